@@ -1,32 +1,60 @@
 # app.py
 import os
 import json
-import pandas as pd
 import io
-import zipfile 
-import csv     
+import click
+import hmac
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+import shutil
 from PIL import Image as PILImage 
 # ...
-from datetime import datetime
+from datetime import datetime, timedelta
 from flask import (
     Flask, render_template, request, redirect, url_for, flash, abort,
-    jsonify, session, send_file, send_from_directory
+    jsonify, session, send_file, send_from_directory, Response, stream_with_context
 )
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy import func
+from sqlalchemy.exc import OperationalError
 from flask_login import (
     LoginManager, login_user, logout_user, login_required, current_user
 )
 from flask_bcrypt import Bcrypt
 from werkzeug.utils import secure_filename
 from functools import wraps
-import pandas as pd
 import io
 from PIL import Image as PILImage
 
 # Yerel modülleri import et
-from models import db, User, Image, Detection, Score, ImageAssignment
-from processing import process_czi_image
+from models import db, User, Image, Detection, Score, ImageAssignment, IngestJob, DetectionConsensus
+from inference import quantize_onnx_model, service_from_config
+from ingest import IngestJobQueue, job_to_dict, ingest_directory
+from tiles import build_tile_pyramid, remove_tile_pyramid
+from preview_encoding import remove_previews
+from redetect import run_redetection
+from processing_cache import (
+    file_sha256, find_active_job, find_duplicate_image, prune_processing_cache, save_stream_hashed
+)
+from image_listing import ListingError, image_page, image_to_dict
+from migrations import LATEST_VERSION, explain_query_plans, init_sqlite_pragmas, migrate
+from metrics import CONTENT_TYPE, REGISTRY, UPLOAD_BYTES, init_request_metrics
+from czi_metadata import CziMetadataError, apply_metadata_columns, metadata_from_json, read_czi_metadata
+from scores import is_lock_error, upsert_score, upsert_scores
+from detections import (
+    DetectionEditError, allocate_detection_ids, apply_detection_edits,
+    detection_to_dict, image_detections_for_user
+)
+from score_export import ExportError, check_format, iter_score_export, parse_export_filters
+from consensus import (
+    clear_image_consensus, consensus_label, image_consensus_to_dict, image_ids_scored_by,
+    refresh_image_consensus
+)
+from dataset_export import CropStore, iter_classification_zip, list_manifests, load_manifest
+from crops import (
+    preview_cache, crop_version, ensure_detection_crop, save_crop,
+    remove_detection_crop, remove_image_crops
+)
 
 # --- UYGULAMA KONFİGÜRASYONU ---
 app = Flask(__name__)
@@ -35,22 +63,71 @@ basedir = os.path.abspath(os.path.dirname(__file__))
 instance_dir = os.path.join(basedir, 'instance')
 db_path = os.path.join(instance_dir, 'proje.db')
 app.config['SECRET_KEY'] = 'COK_GIZLI_BIR_ANAHTAR_12345'
-app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{db_path}' 
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('PROJE_DATABASE_URI', f'sqlite:///{db_path}')
 app.config['UPLOAD_FOLDER'] = os.path.join(basedir, 'uploads')
 app.config['PREVIEW_FOLDER'] = os.path.join(basedir, 'static/previews')
+app.config['PYRAMID_FOLDER'] = os.path.join(basedir, 'static/tiles')
+app.config['PYRAMID_TILE_SIZE'] = 256      # Annotate ekranı için DZI döşeme boyutu
+app.config['PYRAMID_TILE_FORMAT'] = 'jpeg'
+app.config['CROP_FOLDER'] = os.path.join(instance_dir, 'crops')   # Admin'e özel, static dışında
+app.config['PREVIEW_MASTER_FORMAT'] = 'png'  # Kayıpsız ana önizleme: 'png' veya 'webp' (lossless)
+app.config['PREVIEW_PNG_COMPRESS_LEVEL'] = 1  # zlib seviyesi 0-9; 1 hızlı kodlar, boyut farkı küçük
+app.config['PREVIEW_WEBP_METHOD'] = 4       # WebP kodlama eforu 0-6
+app.config['PREVIEW_DISPLAY_FORMAT'] = 'jpeg'  # Görüntüleme kopyası: 'jpeg' (progresif), 'webp', 'png' veya None
+app.config['PREVIEW_DISPLAY_MAX_SIZE'] = 2048  # Görüntüleme kopyasının en uzun kenarı (px)
+app.config['PREVIEW_DISPLAY_QUALITY'] = 85  # Kayıplı görüntüleme kopyası kalitesi
+app.config['PREVIEW_CACHE_MB'] = 512       # Çözülmüş önizlemeler için LRU önbellek sınırı
+app.config['EXPORT_WORKERS'] = None         # Veri seti kırpma süreç sayısı (None: CPU çekirdek sayısı)
+app.config['CROP_STORE_FOLDER'] = os.path.join(instance_dir, 'crop_store')  # 512x512 eğitim kırpmaları deposu
+app.config['EXPORT_MANIFEST_FOLDER'] = os.path.join(instance_dir, 'exports')  # Dışa aktarım manifestleri
+app.config['PROCESSING_CACHE_FOLDER'] = os.path.join(instance_dir, 'processing_cache')  # İçerik özeti + model sürümüne göre sonuçlar
 app.config['ALLOWED_EXTENSIONS'] = {'czi'}
 app.config['YOLO_MODEL_PATH'] = 'modelsv8/best.pt' 
+app.config['YOLO_BACKEND'] = 'ultralytics'  # 'ultralytics' (PyTorch) veya 'onnx' (onnxruntime CPU)
+app.config['YOLO_ONNX_PATH'] = 'modelsv8/best.onnx'  # `flask export-onnx` çıktısı
+app.config['YOLO_ONNX_INT8'] = False       # True: ilk yüklemede dinamik INT8 nicemlenmiş model kullanılır
+app.config['YOLO_ONNX_THREADS'] = 0        # onnxruntime operatör içi thread sayısı (0: çekirdek sayısı)
+app.config['YOLO_IMGSZ'] = 640             # ONNX girdi boyutu (dinamik eksenli dışa aktarımda)
+app.config['YOLO_CONF'] = 0.25             # ONNX son işleme güven eşiği (ultralytics varsayılanı)
+app.config['YOLO_IOU'] = 0.7               # ONNX son işleme NMS eşiği (ultralytics varsayılanı)
+app.config['YOLO_BATCH_SIZE'] = 8          # Tek predict çağrısında toplanacak en fazla önizleme
+app.config['YOLO_BATCH_WAIT_MS'] = 50      # Batch doldurmak için beklenecek en uzun süre
+app.config['YOLO_TILE_SIZE'] = 0           # >0: büyük mozaiklerde bu boyutta örtüşen pencerelerle tespit
+app.config['YOLO_TILE_OVERLAP'] = 0.25     # Pencereler arası örtüşme oranı
+app.config['YOLO_NMS_IOU'] = 0.5           # Pencereler arası birleştirmede NMS eşiği
+app.config['CZI_MEMORY_LIMIT_MB'] = 0       # >0: tahmini bellek bu sınırı aşarsa küçültülmüş önizleme üret
+app.config['CZI_BLOCK_ROWS'] = 1024        # Normalizasyonda tek seferde işlenecek satır sayısı
+app.config['INGEST_WORKERS'] = 2           # Arka planda aynı anda işlenecek yükleme sayısı
+app.config['INGEST_HEARTBEAT_SECONDS'] = 30 # Süreç elindeki işlerin updated_at alanını bu aralıkla tazeler
+app.config['INGEST_STALE_SECONDS'] = 120   # Kalp atışı bundan eski etkin işler sahipsiz sayılıp kurtarılır
+app.config['SQLITE_JOURNAL_MODE'] = 'WAL'  # Okuyucular yazıcıyı beklemez
+app.config['SQLITE_BUSY_TIMEOUT_MS'] = 5000  # Kilitli veritabanında hata vermeden önce beklenecek süre
+app.config['SQLITE_SYNCHRONOUS'] = 'NORMAL'  # WAL ile güvenli; her commit'te fsync yapmaz
+app.config['SCORE_WRITE_ATTEMPTS'] = 5      # Puan kaydında kilit çakışmasına karşı en fazla deneme
+app.config['SCORE_BATCH_MAX'] = 500         # /api/save_scores isteğinde kabul edilecek en fazla güncelleme
+app.config['METRICS_TOKEN'] = os.environ.get('PROJE_METRICS_TOKEN')  # Verilirse /metrics 'Authorization: Bearer <token>' ile de okunur
 os.makedirs(instance_dir, exist_ok=True) 
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 os.makedirs(app.config['PREVIEW_FOLDER'], exist_ok=True)
+os.makedirs(app.config['PYRAMID_FOLDER'], exist_ok=True)
+os.makedirs(app.config['CROP_FOLDER'], exist_ok=True)
+os.makedirs(app.config['CROP_STORE_FOLDER'], exist_ok=True)
+os.makedirs(app.config['EXPORT_MANIFEST_FOLDER'], exist_ok=True)
+os.makedirs(app.config['PROCESSING_CACHE_FOLDER'], exist_ok=True)
+preview_cache.max_bytes = app.config['PREVIEW_CACHE_MB'] * 1024 * 1024
 
 # --- EKLENTİLERİ BAŞLATMA ---
 db.init_app(app)
+init_sqlite_pragmas(app)
+init_request_metrics(app)
 bcrypt = Bcrypt(app)
 login_manager = LoginManager(app)
 login_manager.login_view = 'login'
 login_manager.login_message = 'Lütfen bu sayfaya erişmek için giriş yapın.'
 login_manager.login_message_category = 'info'
+ingest_queue = IngestJobQueue(app)
+
+app.jinja_env.globals['crop_version'] = crop_version
 
 @login_manager.user_loader
 def load_user(user_id):
@@ -61,6 +138,7 @@ def load_user(user_id):
 def init_db_command():
     # ... (init-db kodunuz aynı kalıyor) ...
     db.create_all()
+    migrate(db.engine, backup=False)  # Yeni kurulumda sadece şema sürümünü işaretler
     if not User.query.filter_by(username='uzman1').first():
         hashed_password = bcrypt.generate_password_hash('123456').decode('utf-8')
         new_user = User(username='uzman1', password=hashed_password, role='uzman')
@@ -74,6 +152,183 @@ def init_db_command():
     db.session.commit()
     print("Veritabanı başarıyla oluşturuldu/güncellendi.")
 
+# === YENİ: Mevcut Veritabanını Güncel Şemaya Taşıma ===
+@app.cli.command("migrate-db")
+@click.option("--no-backup", is_flag=True, help="Göçten önce veritabanı yedeği alma.")
+def migrate_db_command(no_backup):
+    start_version, end_version = migrate(db.engine, backup=not no_backup)
+    if start_version == end_version:
+        print(f"Veritabanı zaten güncel (şema sürümü {end_version}).")
+    else:
+        print(f"Veritabanı şema sürümü {start_version} -> {end_version} güncellendi.")
+
+@app.cli.command("check-query-plans")
+def check_query_plans_command():
+    """Sık kullanılan sorguların indeks kullandığını EXPLAIN QUERY PLAN ile doğrular."""
+    failed = 0
+    for name, plan, uses_index in explain_query_plans(db.engine):
+        print(f"[{'OK' if uses_index else 'İNDEKS YOK'}] {name}")
+        for line in plan:
+            print(f"      {line}")
+        failed += not uses_index
+    if failed:
+        raise click.ClickException(
+            f"{failed} sorgu beklenen indeksi kullanmıyor. 'flask migrate-db' çalıştırın "
+            f"(güncel şema sürümü: {LATEST_VERSION})."
+        )
+
+# === YENİ: Klasördeki .czi Dosyalarını Toplu İçe Aktarma ===
+@app.cli.command("ingest")
+@click.argument("directory", type=click.Path(exists=True, file_okay=False))
+@click.option("--workers", type=int, default=None, help="İşçi süreç sayısı (varsayılan: CPU çekirdek sayısı).")
+@click.option("--batch-size", type=int, default=20, help="Tek transaction'da yazılacak görüntü sayısı.")
+@click.option("--user", "username", default=None, help="Görüntülerin yükleyicisi olarak kaydedilecek kullanıcı adı.")
+@click.option("--threads-per-worker", type=int, default=1, help="Her işçideki Torch/OpenMP thread sayısı.")
+@click.option("--no-recursive", is_flag=True, help="Alt klasörlere inme.")
+def ingest_command(directory, workers, batch_size, username, threads_per_worker, no_recursive):
+    uploader_id = None
+    if username:
+        user = User.query.filter_by(username=username).first()
+        if not user:
+            raise click.ClickException(f"'{username}' kullanıcısı bulunamadı.")
+        uploader_id = user.id
+    summary = ingest_directory(
+        directory, app.config,
+        uploader_id=uploader_id,
+        workers=workers,
+        batch_size=batch_size,
+        recursive=not no_recursive,
+        threads_per_worker=threads_per_worker
+    )
+    print(f"Tamamlandı: {summary['ingested']} görüntü içe aktarıldı, "
+          f"{summary['skipped']} atlandı, {len(summary['failed'])} hata.")
+    for image_id, error in summary['failed']:
+        print(f"  - {image_id}: {error}")
+
+# === YENİ: Mevcut Yüklemelerin İçerik Özetlerini Hesaplama ===
+@app.cli.command("hash-uploads")
+@click.option("--batch-size", default=50, show_default=True, help="Tek commit'te yazılacak görüntü sayısı.")
+def hash_uploads_command(batch_size):
+    images = Image.query.filter(Image.content_hash.is_(None)).order_by(Image.id).all()
+    hashed, missing = 0, 0
+    for image in images:
+        try:
+            image.content_hash = file_sha256(image.file_path)
+            hashed += 1
+        except OSError:
+            missing += 1
+        if hashed and hashed % batch_size == 0:
+            db.session.commit()
+    db.session.commit()
+    print(f"{hashed} görüntünün içerik özeti hesaplandı, {missing} dosya bulunamadı.")
+
+@app.cli.command("prune-processing-cache")
+@click.option("--older-than", type=int, default=None, help="Bu kadar gündür kullanılmayan kayıtlar (verilmezse tümü).")
+def prune_processing_cache_command(older_than):
+    removed = prune_processing_cache(app.config['PROCESSING_CACHE_FOLDER'], older_than)
+    db.session.commit()
+    print(f"{removed} önbellek kaydı silindi.")
+
+# === YENİ: Mevcut Görüntülerin Metadata Sütunlarını CZI Başlıklarından Doldurma ===
+@app.cli.command("reindex-metadata")
+@click.option("--workers", default=8, show_default=True, help="Başlıkları paralel okuyacak thread sayısı.")
+@click.option("--missing-only", is_flag=True, help="Sadece henüz indekslenmemiş görüntüler.")
+@click.option("--batch-size", default=500, show_default=True, help="Tek commit'te yazılacak görüntü sayısı.")
+def reindex_metadata_command(workers, missing_only, batch_size):
+    query = Image.query.order_by(Image.id)
+    if missing_only:
+        query = query.filter(Image.objective_name.is_(None), Image.acquisition_date.is_(None),
+                             Image.scale_um_per_pixel.is_(None))
+    images = query.all()
+    sources = Counter()
+
+    def read(image):
+        try:
+            return image, read_czi_metadata(image.file_path)
+        except (OSError, CziMetadataError):
+            return image, None
+
+    # Sadece başlık + XML okunur (piksel verisi yok); dosya okumaları thread'lerde paralel yürür
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        for count, (image, fields) in enumerate(pool.map(read, images), start=1):
+            if fields is None:
+                fields = metadata_from_json(image.metadata_json)
+                sources['json'] += 1
+            else:
+                sources['header'] += 1
+            apply_metadata_columns(image, fields)
+            if count % batch_size == 0:
+                db.session.commit()
+    db.session.commit()
+    print(f"{len(images)} görüntü indekslendi (CZI başlığı: {sources['header']}, kayıtlı JSON: {sources['json']}).")
+
+# === YENİ: Mevcut Görüntüler İçin Döşeme Piramidi Üretme ===
+@app.cli.command("build-tiles")
+@click.option("--force", is_flag=True, help="Piramidi olan görüntüleri de yeniden üret.")
+def build_tiles_command(force):
+    built = 0
+    for image in Image.query.order_by(Image.id).all():
+        metadata = dict(image.metadata_json or {})
+        if metadata.get('tiles') and not force:
+            continue
+        preview_full_path = os.path.join(app.config['PREVIEW_FOLDER'], os.path.basename(image.preview_path))
+        if not os.path.exists(preview_full_path):
+            print(f"  - {image.id}: önizleme dosyası bulunamadı, atlandı.")
+            continue
+        with PILImage.open(preview_full_path) as pil_img:
+            metadata['tiles'] = build_tile_pyramid(
+                pil_img, app.config['PYRAMID_FOLDER'], image.id,
+                tile_size=app.config['PYRAMID_TILE_SIZE'],
+                tile_format=app.config['PYRAMID_TILE_FORMAT']
+            )
+        image.metadata_json = metadata
+        db.session.commit()
+        built += 1
+    print(f"{built} görüntü için döşeme piramidi üretildi.")
+
+# === YENİ: Yeni Modelle Tüm Görüntülerde Yeniden Tespit (puanlar korunur) ===
+@app.cli.command("redetect")
+@click.option("--batch-size", default=32, show_default=True, help="Tek commit'te yazılacak görüntü sayısı (kontrol noktası).")
+@click.option("--workers", default=4, show_default=True, help="Önizlemeleri açıp servise verecek thread sayısı.")
+@click.option("--iou", default=0.5, show_default=True, help="Yeni kutunun mevcut tespitle eşleşmesi için en düşük IoU.")
+@click.option("--keep-unmatched", is_flag=True, help="Eşleşmeyen puansız tespitleri de silme.")
+@click.option("--force", is_flag=True, help="Bu model sürümüyle işlenmiş görüntüleri de tekrar işle.")
+@click.option("--dry-run", is_flag=True, help="Sadece farkları raporla, veritabanına yazma.")
+@click.option("--image-id", "image_ids", multiple=True, help="Sadece bu görüntü(ler).")
+@click.option("--limit", type=int, default=None, help="En fazla bu kadar görüntü işle.")
+def redetect_command(batch_size, workers, iou, keep_unmatched, force, dry_run, image_ids, limit):
+    try:
+        totals, failed = run_redetection(
+            app.config, batch_size=batch_size, workers=workers, iou_threshold=iou,
+            delete_unmatched=not keep_unmatched, force=force, dry_run=dry_run,
+            image_ids=list(image_ids), limit=limit
+        )
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    print(f"{'(Deneme) ' if dry_run else ''}{totals['images']} görüntü işlendi: "
+          f"{totals['updated']} kutu güncellendi, {totals['added']} eklendi, {totals['deleted']} silindi, "
+          f"{totals['kept']} eşleşmeyen puanlı tespit korundu, {totals['unchanged']} görüntüde değişiklik yok, "
+          f"{len(failed)} hata.")
+    for image_id, error in failed:
+        print(f"  - {image_id}: {error}")
+
+# === YENİ: YOLO Modelini ONNX'e Dışa Aktarma (onnxruntime arka ucu için) ===
+@app.cli.command("export-onnx")
+@click.option("--imgsz", default=None, type=int, help="Girdi boyutu (varsayılan: YOLO_IMGSZ).")
+@click.option("--int8", is_flag=True, help="Dinamik INT8 nicemlenmiş kopyayı da üret.")
+def export_onnx_command(imgsz, int8):
+    from ultralytics import YOLO
+
+    imgsz = imgsz or app.config['YOLO_IMGSZ']
+    # Dinamik batch ekseni: servis kuyruktaki önizlemeleri tek çağrıda verebilsin
+    exported = YOLO(app.config['YOLO_MODEL_PATH']).export(format='onnx', imgsz=imgsz, dynamic=True)
+    target = app.config['YOLO_ONNX_PATH']
+    if os.path.abspath(exported) != os.path.abspath(target):
+        shutil.move(exported, target)
+    print(f"ONNX modeli yazıldı: {target}")
+    if int8:
+        print(f"INT8 modeli yazıldı: {quantize_onnx_model(target, force=True)}")
+
 # === Admin Yetki Kontrolü ===
 def admin_required(f):
     @wraps(f)
@@ -84,6 +339,28 @@ def admin_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
+def get_detector():
+    """Süreç genelinde sıcak tutulan YOLO çıkarım servisini döndürür."""
+    return service_from_config(app.config)
+
+def wants_json():
+    return (request.headers.get('X-Requested-With') == 'XMLHttpRequest' or
+            request.accept_mimetypes.best == 'application/json')
+
+def refresh_detection_crop(detection):
+    """Tespit eklendiğinde/değiştiğinde önbellekteki kırpma dosyasını yeniden üretir."""
+    preview_full_path = os.path.join(
+        app.config['PREVIEW_FOLDER'], os.path.basename(detection.parent_image.preview_path)
+    )
+    try:
+        save_crop(
+            preview_cache.get(preview_full_path), app.config['CROP_FOLDER'],
+            detection.parent_image_id, detection.id, detection.coordinates_labelme
+        )
+    except OSError as e:
+        # Kırpma, ilk istekte tekrar üretilmeyi dener
+        print(f"HATA: Kırpma üretilemedi ({detection.id}): {e}")
+
 def allowed_file(filename):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in app.config['ALLOWED_EXTENSIONS']
@@ -139,55 +416,101 @@ def dashboard():
             image_id = f"{base_name}_{timestamp}"
             czi_filename_on_server = f"{image_id}{file_extension}"
             czi_save_path = os.path.join(app.config['UPLOAD_FOLDER'], czi_filename_on_server)
-            file.save(czi_save_path)
-            try:
-                metadata, preview_path, detections = process_czi_image(
-                    czi_save_path, image_id,
-                    app.config['PREVIEW_FOLDER'],
-                    app.config['YOLO_MODEL_PATH']
-                )
-                new_image = Image(
-                    id=image_id, file_path=czi_save_path,
-                    preview_path=preview_path, 
-                    metadata_json=metadata,
-                    uploader_id=current_user.id 
-                )
-                db.session.add(new_image)
-                for det_data in detections:
-                    new_detection = Detection(
-                        id=det_data['id'],
-                        parent_image_id=image_id,
-                        coordinates_labelme=det_data['coordinates_labelme']
-                    )
-                    db.session.add(new_detection)
-                db.session.commit()
-                flash(f"Görüntü {image_id} başarıyla yüklendi ve {len(detections)} oosit bulundu.", 'success')
-            except Exception as e:
-                db.session.rollback()
-                if os.path.exists(czi_save_path): os.remove(czi_save_path) 
-                try:
-                    error_preview_path_rel = f"previews/{image_id}.png"
-                    error_preview_path_abs = os.path.join(basedir, 'static', error_preview_path_rel)
-                    if os.path.exists(error_preview_path_abs):
-                        os.remove(error_preview_path_abs)
-                except: pass 
-                flash(f"Görüntü işlenemedi: {e}", 'danger')
+            # Dosya diske akarken SHA-256 özeti hesaplanır; aynı içerik ikinci kez saklanmaz
+            content_hash, size = save_stream_hashed(file.stream, czi_save_path)
+            duplicate = find_duplicate_image(content_hash)
+            active_job = None if duplicate else find_active_job(content_hash)
+            UPLOAD_BYTES.observe(size, result='duplicate' if duplicate or active_job else 'queued')
+            if duplicate or active_job:
+                os.remove(czi_save_path)
+                existing_id = duplicate.id if duplicate else active_job.image_id
+                if wants_json():
+                    return jsonify({
+                        'success': True, 'duplicate': True, 'image_id': existing_id,
+                        'job': job_to_dict(active_job) if active_job else None
+                    }), 200
+                flash(f"Bu dosya zaten yüklenmiş ({existing_id}); tekrar işlenmedi.", 'info')
+                return redirect(url_for('dashboard'))
+            # İşleme (CZI okuma, normalize, PNG, YOLO) arka plandaki işçi havuzunda yapılır
+            job = ingest_queue.create_job(
+                image_id, czi_save_path, current_user.id,
+                original_filename=file.filename, content_hash=content_hash
+            )
+            if wants_json():
+                return jsonify({'success': True, 'job': job_to_dict(job)}), 202
+            flash(f"Görüntü {image_id} işleme kuyruğuna alındı. İlerlemeyi aşağıdan takip edebilirsiniz.", 'info')
             return redirect(url_for('dashboard'))
 
-    # GET isteği
-    uploaded_images = Image.query.filter_by(uploader_id=current_user.id).order_by(Image.id.desc()).all()
-    assigned_images = Image.query.join(
-        ImageAssignment, Image.id == ImageAssignment.image_id
-    ).filter(
-        ImageAssignment.expert_id == current_user.id
-    ).order_by(
-        Image.id.desc()
-    ).all()
+    # GET isteği: görüntü listeleri sayfa sayfa /api/images üzerinden yüklenir
+    recent_jobs = IngestJob.query.filter(
+        IngestJob.user_id == current_user.id,
+        IngestJob.status != 'done',
+        IngestJob.created_at >= datetime.utcnow() - timedelta(days=1)
+    ).order_by(IngestJob.created_at.desc()).limit(20).all()
     return render_template(
-        'dashboard.html', 
-        uploaded_images=uploaded_images, 
-        assigned_images=assigned_images
+        'dashboard.html',
+        recent_jobs=[job_to_dict(job) for job in recent_jobs]
+    )
+
+# === YENİ: Yükleme İşi Durum API'leri ===
+@app.route('/api/jobs')
+@login_required
+def api_list_jobs():
+    query = IngestJob.query
+    if current_user.role != 'admin' or request.args.get('mine'):
+        query = query.filter(IngestJob.user_id == current_user.id)
+    if request.args.get('active'):
+        query = query.filter(IngestJob.status.in_(['queued', 'running']))
+    limit = min(request.args.get('limit', 20, type=int), 100)
+    jobs = query.order_by(IngestJob.created_at.desc()).limit(limit).all()
+    return jsonify({'success': True, 'jobs': [job_to_dict(job) for job in jobs]})
+
+@app.route('/api/jobs/<job_id>')
+@login_required
+def api_job_status(job_id):
+    job = IngestJob.query.get(job_id)
+    if not job or (job.user_id != current_user.id and current_user.role != 'admin'):
+        return jsonify({'success': False, 'error': 'İş bulunamadı.'}), 404
+    return jsonify({'success': True, 'job': job_to_dict(job)})
+
+# === YENİ: Sayfalı Görüntü Listesi API'si ===
+@app.route('/api/images')
+@login_required
+def api_list_images():
+    try:
+        images, scorer_counts, next_cursor = image_page(request.args, current_user)
+    except ListingError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    return jsonify({
+        'success': True,
+        'images': [image_to_dict(image, scorer_counts.get(image.id, 0)) for image in images],
+        'next_cursor': next_cursor
+    })
+
+# === YENİ: Deep Zoom Döşemeleri ===
+# Bir görüntünün önizlemesi hiç değişmediği için döşemeler uzun süreli önbelleğe alınabilir.
+TILE_CACHE_SECONDS = 365 * 24 * 3600
+
+@app.route('/tiles/<image_id>/image.dzi')
+@login_required
+def serve_tile_descriptor(image_id):
+    return send_from_directory(
+        app.config['PYRAMID_FOLDER'], f"{image_id}/image.dzi",
+        mimetype='application/xml', max_age=TILE_CACHE_SECONDS
+    )
+
+@app.route('/tiles/<image_id>/<int:level>/<tile_name>')
+@login_required
+def serve_tile(image_id, level, tile_name):
+    # send_from_directory yolu güvenli birleştirir; '..' içeren istekler 404 döner
+    response = send_from_directory(
+        app.config['PYRAMID_FOLDER'], f"{image_id}/{level}/{tile_name}",
+        max_age=TILE_CACHE_SECONDS
     )
+    response.cache_control.public = False
+    response.cache_control.private = True
+    response.cache_control.immutable = True
+    return response
 
 @app.route('/annotate/<image_id>')
 @login_required
@@ -195,28 +518,7 @@ def annotate_image(image_id):
     image = Image.query.get_or_404(image_id)
     
     # GÜNCELLEME: 'grade' (A/B/C/D) verisini de çek
-    detections_query = db.session.query(
-        Detection, Score
-    ).outerjoin(
-        Score,
-        (Score.detection_id == Detection.id) & (Score.user_id == current_user.id)
-    ).filter(
-        Detection.parent_image_id == image_id
-    ).all()
-    
-    detections_data = []
-    for det, score in detections_query:
-        detections_data.append({
-            "id": det.id,
-            "coordinates_labelme": det.coordinates_labelme,
-            "scores": {
-                "grade": score.grade if score else None, # YENİ
-                "sitoplazma": score.score_sitoplazma if score else None,
-                "zona": score.score_zona if score else None,
-                "kumulus": score.score_kumulus if score else None,
-                "oopla": score.score_oopla if score else None
-            }
-        })
+    detections_data = image_detections_for_user(image_id, current_user.id)
 
     return render_template(
         'annotate.html',
@@ -237,27 +539,39 @@ def save_score():
     if not detection_id or not scores:
         return jsonify({'success': False, 'error': 'Eksik veri'}), 400
 
-    score_obj = Score.query.filter_by(
-        detection_id=detection_id,
-        user_id=current_user.id
-    ).first()
-    
-    if not score_obj:
-        score_obj = Score(detection_id=detection_id, user_id=current_user.id)
-        db.session.add(score_obj)
+    try:
+        upsert_score(detection_id, current_user.id, grade, scores,
+                     attempts=app.config['SCORE_WRITE_ATTEMPTS'])
+        return jsonify({'success': True})
+    except OperationalError as e:
+        if is_lock_error(e):
+            return jsonify({'success': False, 'error': 'Veritabanı meşgul, lütfen tekrar deneyin.'}), 503
+        return jsonify({'success': False, 'error': str(e)}), 500
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
 
-    score_obj.grade = grade # YENİ: 'grade'i kaydet
-    score_obj.score_sitoplazma = scores.get('sitoplazma')
-    score_obj.score_zona = scores.get('zona')
-    score_obj.score_kumulus = scores.get('kumulus')
-    score_obj.score_oopla = scores.get('oopla')
-    score_obj.timestamp = datetime.utcnow()
+# === YENİ: Toplu Puan Kaydı (annotate sayfası birikmiş değişiklikleri tek istekte gönderir) ===
+@app.route('/api/save_scores', methods=['POST'])
+@login_required
+def save_scores():
+    data = request.get_json(silent=True) or {}
+    updates = data.get('updates')
+    if not isinstance(updates, list) or not updates:
+        return jsonify({'success': False, 'error': 'Eksik veri'}), 400
+    if len(updates) > app.config['SCORE_BATCH_MAX']:
+        return jsonify({'success': False,
+                        'error': f"Tek istekte en fazla {app.config['SCORE_BATCH_MAX']} güncelleme gönderilebilir."}), 413
 
     try:
-        db.session.commit()
-        return jsonify({'success': True})
+        saved, skipped = upsert_scores(current_user.id, updates, attempts=app.config['SCORE_WRITE_ATTEMPTS'])
+        return jsonify({'success': True, 'saved': saved, 'skipped': skipped})
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except OperationalError as e:
+        if is_lock_error(e):
+            return jsonify({'success': False, 'error': 'Veritabanı meşgul, lütfen tekrar deneyin.'}), 503
+        return jsonify({'success': False, 'error': str(e)}), 500
     except Exception as e:
-        db.session.rollback()
         return jsonify({'success': False, 'error': str(e)}), 500
 
 @app.route('/api/add_detection', methods=['POST'])
@@ -273,15 +587,8 @@ def api_add_detection():
     if not image:
         return jsonify({'success': False, 'error': 'İlişkili resim bulunamadı.'}), 404
     try:
-        existing_detections = Detection.query.filter_by(parent_image_id=image_id).all()
-        max_index = 0
-        for det in existing_detections:
-            try:
-                index = int(det.id.split('_')[-1])
-                if index > max_index: max_index = index
-            except ValueError: pass
-        new_index = max_index + 1
-        new_detection_id = f"{image_id}_{new_index}"
+        # Numara, görüntünün sayacından atomik olarak alınır (mevcut tespitler taranmaz)
+        new_detection_id = allocate_detection_ids(image_id)[0]
         new_detection = Detection(
             id=new_detection_id,
             parent_image_id=image_id,
@@ -289,16 +596,9 @@ def api_add_detection():
         )
         db.session.add(new_detection)
         db.session.commit()
-        # Yeni tespit verisine 'grade: None' ekle
-        new_detection_data = {
-            "id": new_detection.id,
-            "coordinates_labelme": new_detection.coordinates_labelme,
-            "scores": { 
-                "grade": None, # YENİ
-                "sitoplazma": None, "zona": None, "kumulus": None, "oopla": None 
-            }
-        }
-        return jsonify({'success': True, 'new_detection': new_detection_data})
+        refresh_detection_crop(new_detection)
+        # Yeni tespit verisi ('grade: None' dahil boş puanlarla)
+        return jsonify({'success': True, 'new_detection': detection_to_dict(new_detection)})
     except Exception as e:
         db.session.rollback()
         print(f"HATA: /api/add_detection: {e}")
@@ -316,14 +616,57 @@ def api_delete_detection():
     if not detection_to_delete:
         return jsonify({'success': False, 'error': 'Tespit bulunamadı.'}), 404
     try:
+        image_id = detection_to_delete.parent_image_id
         db.session.delete(detection_to_delete)
+        refresh_image_consensus([image_id])
         db.session.commit()
+        remove_detection_crop(app.config['CROP_FOLDER'], image_id, detection_id)
         return jsonify({'success': True, 'deleted_id': detection_id})
     except Exception as e:
         db.session.rollback()
         print(f"HATA: /api/delete_detection: {e}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
+# === YENİ: Toplu Tespit Düzenleme (ekle / taşı-boyutlandır / sil tek transaction'da) ===
+@app.route('/api/edit_detections', methods=['POST'])
+@login_required
+def api_edit_detections():
+    data = request.get_json(silent=True) or {}
+    image_id = data.get('image_id')
+    add = data.get('add') or []
+    update_boxes = data.get('update') or []
+    delete = data.get('delete') or []
+    if not image_id or not all(isinstance(v, list) for v in (add, update_boxes, delete)):
+        return jsonify({'success': False, 'error': 'Eksik veri'}), 400
+    if not (add or update_boxes or delete):
+        return jsonify({'success': False, 'error': 'Uygulanacak değişiklik yok.'}), 400
+    if not Image.query.get(image_id):
+        return jsonify({'success': False, 'error': 'İlişkili resim bulunamadı.'}), 404
+    try:
+        added, updated, deleted = apply_detection_edits(image_id, add, update_boxes, delete)
+        db.session.commit()
+    except DetectionEditError as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except LookupError as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': f"Tespit bulunamadı: {e.args[0]}"}), 404
+    except Exception as e:
+        db.session.rollback()
+        print(f"HATA: /api/edit_detections: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+    for detection in added + updated:
+        refresh_detection_crop(detection)
+    for detection_id in deleted:
+        remove_detection_crop(app.config['CROP_FOLDER'], image_id, detection_id)
+    return jsonify({
+        'success': True,
+        'added': [det.id for det in added],
+        'deleted': deleted,
+        'detections': image_detections_for_user(image_id, current_user.id),
+    })
+
 # =====================================================================
 # ===  ADMIN PANELİ ROTALARI
 # =====================================================================
@@ -332,33 +675,26 @@ def api_delete_detection():
 @login_required
 @admin_required 
 def admin_dashboard():
-    # ... (admin_dashboard istatistikleriniz aynı kalıyor) ...
-    experts = User.query.filter_by(role='uzman').all()
-    expert_stats = []
-    for expert in experts:
-        assigned_count = ImageAssignment.query.filter_by(expert_id=expert.id).count()
-        scored_images_count = db.session.query(
-            func.count(db.distinct(Detection.parent_image_id))
-        ).join(Score).filter(Score.user_id == expert.id).scalar()
-        expert_stats.append({
-            'user': expert,
-            'assigned_count': assigned_count,
-            'scored_images_count': scored_images_count
-        })
-    images = Image.query.order_by(Image.id.desc()).all()
-    image_stats = []
-    for img in images:
-        scorer_count = db.session.query(
-            func.count(db.distinct(Score.user_id))
-        ).join(Detection).filter(Detection.parent_image_id == img.id).scalar()
-        image_stats.append({
-            'image': img,
-            'scorer_count': scorer_count
-        })
+    # Tüm istatistikler sabit sayıda gruplanmış sorguyla hesaplanır (uzman/görüntü başına sorgu yok)
+    experts = User.query.filter_by(role='uzman').order_by(User.id).all()
+    assigned_counts = dict(
+        db.session.query(ImageAssignment.expert_id, func.count(ImageAssignment.id))
+        .group_by(ImageAssignment.expert_id).all()
+    )
+    scored_image_counts = dict(
+        db.session.query(Score.user_id, func.count(db.distinct(Detection.parent_image_id)))
+        .join(Detection, Score.detection_id == Detection.id)
+        .group_by(Score.user_id).all()
+    )
+    expert_stats = [{
+        'user': expert,
+        'assigned_count': assigned_counts.get(expert.id, 0),
+        'scored_images_count': scored_image_counts.get(expert.id, 0)
+    } for expert in experts]
+
     return render_template(
-        'admin_dashboard.html', 
-        image_stats=image_stats, 
-        expert_stats=expert_stats 
+        'admin_dashboard.html',
+        expert_stats=expert_stats
     )
 
 @app.route('/admin/assign/<image_id>', methods=['POST'])
@@ -389,45 +725,31 @@ def admin_assign_image(image_id):
 @admin_required
 def admin_image_detail(image_id):
     image = Image.query.get_or_404(image_id)
-    return render_template('admin_image_detail.html', image=image)
+    consensus = image_consensus_to_dict(image_id)
+    return render_template(
+        'admin_image_detail.html', image=image, consensus=consensus,
+        detection_consensus={row['detection_id']: row for row in consensus['detections']}
+    )
 
 
 @app.route('/admin/download_scores')
 @login_required
 @admin_required
 def admin_download_scores():
-    # === GÜNCELLENDİ: Excel Raporuna 'Genel_Kalite' (grade) eklendi ===
-    query = db.session.query(
-        Image.id.label('Resim_ID'),
-        Detection.id.label('Oosit_ID'),
-        User.username.label('Uzman_Adı'),
-        Score.grade.label('Genel_Kalite (A-D)'), # YENİ
-        Score.score_sitoplazma.label('Sitoplazma'),
-        Score.score_zona.label('Zona'),
-        Score.score_kumulus.label('Kumulus'),
-        Score.score_oopla.label('Ooplazma'),
-        Score.timestamp.label('Puanlama_Zamanı')
-    ).join(
-        Detection, Image.id == Detection.parent_image_id
-    ).join(
-        Score, Detection.id == Score.detection_id
-    ).join(
-        User, Score.user_id == User.id
-    ).order_by(
-        Image.id, User.username
-    )
-    
-    df = pd.read_sql(query.statement, db.engine)
-    output = io.BytesIO()
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        df.to_excel(writer, sheet_name='Tum_Puanlar', index=False)
-    output.seek(0)
-    
-    return send_file(
-        output,
-        mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-        as_attachment=True,
-        download_name=f'Oosit_Puanlari_Raporu_{datetime.now().strftime("%Y%m%d")}.xlsx'
+    # Puanlar parça parça okunup seçilen biçimde (xlsx / csv / parquet) akış halinde yazılır
+    export_format = request.args.get('format', 'xlsx')
+    try:
+        mimetype, extension = check_format(export_format)
+        filters = parse_export_filters(request.args)
+    except ExportError as e:
+        flash(str(e), 'danger')
+        return redirect(url_for('admin_dashboard'))
+
+    download_name = f'Oosit_Puanlari_Raporu_{datetime.now().strftime("%Y%m%d")}.{extension}'
+    return Response(
+        stream_with_context(iter_score_export(export_format, filters)),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename={download_name}'}
     )
 
 @app.route('/admin/delete/image/<image_id>', methods=['POST'])
@@ -438,12 +760,13 @@ def admin_delete_image(image_id):
     img = Image.query.get_or_404(image_id)
     try:
         if os.path.exists(img.file_path): os.remove(img.file_path)
-        preview_filename = os.path.basename(img.preview_path)
-        preview_full_path = os.path.join(app.config['PREVIEW_FOLDER'], preview_filename)
-        if os.path.exists(preview_full_path): os.remove(preview_full_path)
+        remove_previews(app.config['PREVIEW_FOLDER'], img.id)  # Ana kopya + görüntüleme kopyası
+        remove_tile_pyramid(app.config['PYRAMID_FOLDER'], img.id)
+        remove_image_crops(app.config['CROP_FOLDER'], img.id)
     except OSError as e:
         flash(f"Disk üzerinden dosya silinirken bir hata oluştu: {e}", 'danger')
         return redirect(url_for('admin_dashboard'))
+    clear_image_consensus(img.id)
     db.session.delete(img)
     db.session.commit()
     flash(f"Görüntü '{image_id}' ve tüm ilişkili veriler kalıcı olarak silindi.", 'success')
@@ -477,11 +800,11 @@ def admin_download_labelme_image(image_id):
     image = Image.query.get_or_404(image_id)
     labelme_output = {
         "version": "5.0.1", "flags": {}, "shapes": [],
-        "imagePath": f"{image.id}.png", "imageData": None,
+        "imagePath": os.path.basename(image.preview_path), "imageData": None,
         "imageHeight": None, "imageWidth": None
     }
     try:
-        preview_full_path = os.path.join(app.config['PREVIEW_FOLDER'], f"{image.id}.png")
+        preview_full_path = os.path.join(app.config['PREVIEW_FOLDER'], os.path.basename(image.preview_path))
         with PILImage.open(preview_full_path) as pil_img:
             labelme_output["imageWidth"] = pil_img.width
             labelme_output["imageHeight"] = pil_img.height
@@ -498,7 +821,8 @@ def admin_download_labelme_image(image_id):
         'Content-Type': 'application/json'
     }
 
-# ... (admin_image_crop rotası aynı kalıyor) ...
+CROP_CACHE_SECONDS = 7 * 24 * 3600
+
 @app.route('/admin/image_crop/<detection_id>')
 @login_required
 @admin_required
@@ -509,14 +833,19 @@ def admin_image_crop(detection_id):
     preview_full_path = os.path.join(app.config['PREVIEW_FOLDER'], preview_filename)
     if not os.path.exists(preview_full_path): abort(404, "Ana önizleme dosyası bulunamadı.")
     try:
-        with PILImage.open(preview_full_path) as base_img:
-            coords = det.coordinates_labelme['points']
-            box = (int(coords[0][0]), int(coords[0][1]), int(coords[1][0]), int(coords[1][1]))
-            cropped_img = base_img.crop(box)
-            img_io = io.BytesIO()
-            cropped_img.save(img_io, 'PNG')
-            img_io.seek(0)
-            return send_file(img_io, mimetype='image/png')
+        # Kırpmalar yükleme sırasında üretilir; eksikse önbellekteki önizlemeden bir kez üretilir
+        crop_full_path = ensure_detection_crop(
+            app.config['CROP_FOLDER'], preview_full_path,
+            img.id, det.id, det.coordinates_labelme
+        )
+        # URL koordinat sürümünü (?v=) içerdiği sürece içerik değişmez; yoksa ETag ile doğrulanır
+        response = send_file(
+            crop_full_path, mimetype='image/png', conditional=True, etag=True,
+            max_age=CROP_CACHE_SECONDS if request.args.get('v') else 0
+        )
+        response.cache_control.private = True
+        response.cache_control.public = False
+        return response
     except Exception as e:
         print(f"Görüntü kırpma hatası (ID: {detection_id}): {e}")
         abort(500, "Görüntü kırpılamadı.")
@@ -557,7 +886,9 @@ def admin_delete_user(user_id):
         return redirect(url_for('admin_dashboard'))
     try:
         username = user_to_delete.username
+        scored_image_ids = image_ids_scored_by(user_to_delete.id)
         db.session.delete(user_to_delete)
+        refresh_image_consensus(scored_image_ids)  # Silinen uzmanın puanları konsensüsten çıkar
         db.session.commit()
         flash(f"Uzman '{username}' başarıyla silindi.", 'success')
     except Exception as e:
@@ -565,124 +896,191 @@ def admin_delete_user(user_id):
         flash(f"Uzman silinirken bir hata oluştu: {e}", 'danger')
     return redirect(url_for('admin_dashboard'))
 
+# === YENİ: Konsensüs Tablolarını Baştan Hesaplama (mevcut veritabanları için) ===
+@app.cli.command("rebuild-consensus")
+@click.option("--batch-size", default=200, show_default=True, help="Tek transaction'da işlenecek görüntü sayısı.")
+def rebuild_consensus_command(batch_size):
+    image_ids = [row[0] for row in db.session.query(Image.id).order_by(Image.id).all()]
+    for start in range(0, len(image_ids), batch_size):
+        refresh_image_consensus(image_ids[start:start + batch_size])
+        db.session.commit()
+    print(f"{len(image_ids)} görüntünün konsensüsü yeniden hesaplandı.")
+
+# === YENİ: Puan Raporunu Komut Satırından Dışa Aktarma ===
+@app.cli.command("export-scores")
+@click.argument("output", type=click.Path(dir_okay=False, writable=True))
+@click.option("--format", "export_format", type=click.Choice(['xlsx', 'csv', 'parquet']), default=None,
+              help="Çıktı biçimi (varsayılan: dosya uzantısından).")
+@click.option("--expert", "expert_ids", type=int, multiple=True, help="Sadece bu uzman id'leri (tekrarlanabilir).")
+@click.option("--image-id", "image_ids", multiple=True, help="Sadece bu görüntüler (tekrarlanabilir).")
+@click.option("--date-from", type=click.DateTime(), default=None)
+@click.option("--date-to", type=click.DateTime(), default=None, help="Bu andan önceki puanlar.")
+def export_scores_command(output, export_format, expert_ids, image_ids, date_from, date_to):
+    export_format = export_format or os.path.splitext(output)[1].lstrip('.').lower() or 'xlsx'
+    filters = {'expert_ids': list(expert_ids), 'image_ids': list(image_ids),
+               'date_from': date_from, 'date_to': date_to}
+    try:
+        chunks = iter_score_export(export_format, filters)
+    except ExportError as e:
+        raise click.ClickException(str(e))
+    with open(output, 'wb') as f:
+        for chunk in chunks:
+            f.write(chunk)
+    print(f"Puan raporu yazıldı: {output}")
+
+# === YENİ: SINIFLANDIRMA (MOBILENETV2) VERİ SETİ İNDİRME ROTASI ===
+def classification_dataset_rows():
+    """Sınıflandırma veri seti için "A, B, C, D" notu verilmiş TÜM puanlar (sadece gerekli sütunlar)."""
+    scored_items = db.session.query(
+        Score.user_id, Score.grade,
+        Score.score_sitoplazma, Score.score_zona, Score.score_kumulus, Score.score_oopla,
+        Detection.id.label('detection_id'),
+        Detection.coordinates_labelme,
+        Image.id.label('image_id'),
+        Image.preview_path
+    ).join(
+        Detection, Score.detection_id == Detection.id
+    ).join(
+        Image, Detection.parent_image_id == Image.id
+    ).filter(
+        Score.grade.in_(['A', 'B', 'C', 'D'])
+    ).order_by(
+        Image.id, Detection.id
+    ).all()
+    return [
+        (item, item.detection_id, item.coordinates_labelme, item.image_id,
+         os.path.join(app.config['PREVIEW_FOLDER'], os.path.basename(item.preview_path)))
+        for item in scored_items
+    ]
+
+def consensus_dataset_rows():
+    """Her tespit için tek örnek: uzman puanları yerine önceden hesaplanmış konsensüs etiketleri."""
+    consensus_items = db.session.query(
+        DetectionConsensus,
+        Detection.coordinates_labelme,
+        Image.id.label('image_id'),
+        Image.preview_path
+    ).join(
+        Detection, DetectionConsensus.detection_id == Detection.id
+    ).join(
+        Image, Detection.parent_image_id == Image.id
+    ).filter(
+        DetectionConsensus.grade_majority.isnot(None)
+    ).order_by(
+        Image.id, Detection.id
+    ).all()
+    return [
+        (consensus_label(row), row.detection_id, coordinates_labelme, image_id,
+         os.path.join(app.config['PREVIEW_FOLDER'], os.path.basename(preview_path)))
+        for row, coordinates_labelme, image_id, preview_path in consensus_items
+    ]
+
+def classification_zip_stream(rows, since=None, only_changed=False, log=print):
+    """Kırpma deposunu ve manifestleri kullanan artımlı veri seti akışı."""
+    previous_manifest = load_manifest(app.config['EXPORT_MANIFEST_FOLDER'], since) if since else None
+    return iter_classification_zip(
+        rows,
+        workers=app.config['EXPORT_WORKERS'],
+        crop_store=CropStore(app.config['CROP_STORE_FOLDER']),
+        previous_manifest=previous_manifest,
+        only_changed=only_changed and previous_manifest is not None,
+        manifest_folder=app.config['EXPORT_MANIFEST_FOLDER'],
+        log=log
+    )
+
+# === YENİ: Veri Setini Komut Satırından (Gece Yenilemesi) Dışa Aktarma ===
+@app.cli.command("export-dataset")
+@click.argument("output", type=click.Path(dir_okay=False, writable=True))
+@click.option("--since", default=None, help="Farkı hesaplanacak önceki dışa aktarım kimliği ('latest': en sonuncusu).")
+@click.option("--only-changed", is_flag=True, help="Arşive sadece eklenen/değişen örnekleri yaz (--since gerekir).")
+@click.option("--prune", is_flag=True, help="Bu dışa aktarımda kullanılmayan depo kırpmalarını sil.")
+@click.option("--consensus", is_flag=True, help="Uzman başına örnek yerine tespit başına konsensüs etiketi kullan.")
+def export_dataset_command(output, since, only_changed, prune, consensus):
+    if since and load_manifest(app.config['EXPORT_MANIFEST_FOLDER'], since) is None:
+        raise click.ClickException(f"'{since}' dışa aktarımına ait manifest bulunamadı.")
+    rows = consensus_dataset_rows() if consensus else classification_dataset_rows()
+    if not rows:
+        raise click.ClickException("Henüz A, B, C veya D olarak puanlanmış oosit yok.")
+    with open(output, 'wb') as f:
+        for chunk in classification_zip_stream(rows, since=since, only_changed=only_changed):
+            f.write(chunk)
+    if prune:
+        manifest = load_manifest(app.config['EXPORT_MANIFEST_FOLDER'], 'latest')
+        keep_keys = {sample['crop_key'] for sample in manifest['samples'].values()}
+        removed = CropStore(app.config['CROP_STORE_FOLDER']).prune(keep_keys)
+        print(f"Depodan {removed} kullanılmayan kırpma silindi.")
+    print(f"Veri seti yazıldı: {output}")
+
 # === YENİ: SINIFLANDIRMA (MOBILENETV2) VERİ SETİ İNDİRME ROTASI ===
 @app.route('/admin/download_classification_dataset')
 @login_required
 @admin_required
 def admin_download_classification_dataset():
-    
-    # 1. Hafızada (in-memory) bir ZIP dosyası oluştur
-    zip_buffer = io.BytesIO()
-    
-    # 2. Hafızada bir CSV dosyası oluştur
-    csv_buffer = io.StringIO()
-    csv_writer = csv.writer(csv_buffer)
-    
-    # CSV başlık satırını yaz
-    csv_writer.writerow([
-        'dosya_adi', 
-        'genel_puan', # A, B, C, D
-        'sitoplazma', # 1-5
-        'zona',       # 1-5
-        'kumulus',    # 1-5
-        'oopla'       # 1-5
-    ])
-
+    since = request.args.get('since') or None
+    only_changed = request.args.get('only_changed') == '1'
+    use_consensus = request.args.get('labels') == 'consensus'
+    if since and load_manifest(app.config['EXPORT_MANIFEST_FOLDER'], since) is None:
+        flash(f"'{since}' dışa aktarımına ait manifest bulunamadı.", 'danger')
+        return redirect(url_for('admin_dashboard'))
     try:
-        # 3. Veritabanından "A, B, C, D" notu verilmiş TÜM puanları çek
-        scored_items = db.session.query(
-            Score, Detection, Image
-        ).join(
-            Detection, Score.detection_id == Detection.id
-        ).join(
-            Image, Detection.parent_image_id == Image.id
-        ).filter(
-            Score.grade.in_(['A', 'B', 'C', 'D'])
-        ).all()
-        
-        if not scored_items:
-            flash('Sınıflandırma veri seti oluşturulamadı. Henüz A, B, C veya D olarak puanlanmış oosit yok.', 'danger')
-            return redirect(url_for('admin_dashboard'))
-
-        # 4. ZIP dosyasını yazma modunda aç
-        with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_f:
-            
-            processed_count = 0
-            
-            # 5. Her puanlanmış oosit için döngüye gir
-            for score, detection, image in scored_items:
-                
-                # Benzersiz dosya adı: OositID_UzmanID_Puan.png
-                png_filename = f"{detection.id}_u{score.user.id}_g{score.grade}.png"
-
-                try:
-                    # Ana PNG dosyasını aç
-                    preview_full_path = os.path.join(app.config['PREVIEW_FOLDER'], f"{image.id}.png")
-                    
-                    with PILImage.open(preview_full_path) as base_img:
-                        # Orijinal koordinatları al
-                        coords = detection.coordinates_labelme['points']
-                        box = (int(coords[0][0]), int(coords[0][1]), int(coords[1][0]), int(coords[1][1]))
-                        
-                        # Oositi Kırp
-                        cropped_img = base_img.crop(box)
-                        
-                        # === 512x512 PADDING (BOZULMAYI ÖNLEME) ===
-                        
-                        # 1. Kırpılmış görüntüyü en-boy oranını koruyarak 512 sınırına küçült/büyüt
-                        # LANCZOS en yüksek kaliteli yeniden örnekleme filtresidir
-                        cropped_img.thumbnail((512, 512), PILImage.Resampling.LANCZOS)
-                        
-                        # 2. Siyah (RGB=0,0,0) 512x512 bir arka plan oluştur
-                        # (Kırpılmış resim RGB değilse diye 'RGB'ye çeviriyoruz)
-                        padded_img = PILImage.new("RGB", (512, 512), (0, 0, 0))
-                        
-                        # 3. Kırpılmış görüntüyü bu siyah arka planın ortasına yapıştır
-                        paste_x = (512 - cropped_img.width) // 2
-                        paste_y = (512 - cropped_img.height) // 2
-                        padded_img.paste(cropped_img.convert("RGB"), (paste_x, paste_y))
-                        
-                        # 4. Son 512x512 görüntüyü hafızada bir tampona kaydet
-                        img_io = io.BytesIO()
-                        padded_img.save(img_io, 'PNG')
-                        img_io.seek(0)
-                        
-                        # 5. Bu görüntüyü ZIP dosyasına ekle
-                        zip_f.writestr(png_filename, img_io.getvalue())
-                        
-                        # 6. CSV dosyasına ilgili satırı ekle
-                        csv_writer.writerow([
-                            png_filename,
-                            score.grade,
-                            score.score_sitoplazma,
-                            score.score_zona,
-                            score.score_kumulus,
-                            score.score_oopla
-                        ])
-                        
-                        processed_count += 1
-
-                except Exception as e:
-                    print(f"HATA: Veri seti oluşturulurken {detection.id} işlenemedi: {e}")
-            
-            # 6. CSV dosyasını ZIP'e ekle
-            zip_f.writestr('labels.csv', csv_buffer.getvalue())
-
-        zip_buffer.seek(0)
-        
-        flash(f'Başarılı: {processed_count} adet görüntü ve 1 adet labels.csv dosyası ile .zip arşivi oluşturuldu.', 'success')
-        
-        return send_file(
-            zip_buffer,
-            mimetype='application/zip',
-            as_attachment=True,
-            download_name=f'MobileNet_VeriSeti_{datetime.now().strftime("%Y%m%d")}.zip'
-        )
-        
+        # 1. Veritabanından "A, B, C, D" notu verilmiş TÜM puanları (ya da tespit konsensüslerini) çek
+        rows = consensus_dataset_rows() if use_consensus else classification_dataset_rows()
     except Exception as e:
         flash(f"Veri seti oluşturulurken bir hata oluştu: {e}", 'danger')
         print(f"HATA: /admin/download_classification_dataset: {e}")
         return redirect(url_for('admin_dashboard'))
 
+    if not rows:
+        flash('Sınıflandırma veri seti oluşturulamadı. Henüz A, B, C veya D olarak puanlanmış oosit yok.', 'danger')
+        return redirect(url_for('admin_dashboard'))
+
+    # 2. Depoda olmayan kırpmalar görüntü bazında süreç havuzunda üretilir, ZIP akış halinde gönderilir
+    flash(f'{len(rows)} puanlanmış oosit için .zip arşivi hazırlanıyor.', 'success')
+    suffix = ('_Konsensus' if use_consensus else '') + ('_Degisenler' if only_changed and since else '')
+    download_name = f'MobileNet_VeriSeti_{datetime.now().strftime("%Y%m%d")}{suffix}.zip'
+    return Response(
+        classification_zip_stream(rows, since=since, only_changed=only_changed),
+        mimetype='application/zip',
+        headers={'Content-Disposition': f'attachment; filename={download_name}'}
+    )
+
+@app.route('/admin/api/exports')
+@login_required
+@admin_required
+def admin_list_exports():
+    """Kayıtlı dışa aktarım manifestleri (since= parametresi için kimlikler)."""
+    return jsonify({'exports': list_manifests(app.config['EXPORT_MANIFEST_FOLDER'])})
+
+@app.route('/admin/api/consensus/<image_id>')
+@login_required
+@admin_required
+def admin_image_consensus(image_id):
+    """Görüntünün önceden hesaplanmış tespit konsensüsleri ve uzmanlar arası uyum (kappa) özetleri."""
+    Image.query.get_or_404(image_id)
+    return jsonify(image_consensus_to_dict(image_id))
+
+@app.route('/admin/api/inference_stats')
+@login_required
+@admin_required
+def admin_inference_stats():
+    return jsonify(get_detector().stats())
+
+# === YENİ: Prometheus Metrikleri ===
+@app.route('/metrics')
+def metrics_endpoint():
+    """
+    İşleme aşaması, istek süresi, istek başına SQL ve yükleme boyutu histogramları (Prometheus metin biçimi).
+    Sadece admin oturumuyla ya da METRICS_TOKEN ayarlıysa Bearer token ile okunur.
+    """
+    token = app.config.get('METRICS_TOKEN')
+    is_admin = current_user.is_authenticated and current_user.role == 'admin'
+    has_token = bool(token) and hmac.compare_digest(
+        request.headers.get('Authorization', '').encode('utf-8'), f'Bearer {token}'.encode('utf-8')
+    )
+    if not (is_admin or has_token):
+        abort(403)
+    return Response(REGISTRY.render(), content_type=CONTENT_TYPE)
+
 if __name__ == '__main__':
+    get_detector()  # Modeli ilk yüklemeden önce ısıt
     app.run(debug=True, host='0.0.0.0')
\ No newline at end of file
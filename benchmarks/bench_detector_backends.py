@@ -0,0 +1,141 @@
+# benchmarks/bench_detector_backends.py
+"""
+Tespit arka uçları karşılaştırması (ultralytics PyTorch / onnxruntime / onnxruntime INT8).
+
+Kayıtlı önizlemeler (static/previews, görüntüleme kopyaları hariç) üzerinde her arka uç için
+tek görüntü gecikmesini (medyan, p95), batch'li verimi (görüntü/sn) ve ilk arka uca göre
+kutu uyumunu raporlar: eşleşen kutuların ortalama IoU'su ve IoU >= 0.5 ile eşleşen
+referans/aday kutu oranları.
+
+Kullanım (proje kökünden):
+    python -m benchmarks.bench_detector_backends --backends ultralytics,onnx,onnx-int8 --limit 20
+    python -m benchmarks.bench_detector_backends --backends onnx,onnx-int8 --threads 4 --batch 8
+"""
+import argparse
+import glob
+import os
+import time
+
+import numpy as np
+from PIL import Image as PILImage
+
+from inference import make_backend, match_boxes, to_model_input
+from preview_encoding import DISPLAY_SUFFIX
+
+
+def load_previews(folder, limit):
+    paths = sorted(
+        path for path in glob.glob(os.path.join(folder, '*'))
+        if os.path.splitext(path)[1].lower() in ('.png', '.webp', '.jpg')
+        and not os.path.splitext(os.path.basename(path))[0].endswith(DISPLAY_SUFFIX)
+    )[:limit]
+    images = []
+    for path in paths:
+        with PILImage.open(path) as pil_img:
+            images.append(to_model_input(np.asarray(pil_img.convert('RGB'))))
+    return paths, images
+
+
+def backend_for(spec, args):
+    if spec == 'ultralytics':
+        return make_backend('ultralytics', args.model)
+    if spec in ('onnx', 'onnx-int8'):
+        return make_backend('onnx', args.onnx, int8=spec == 'onnx-int8',
+                            intra_op_threads=args.threads, imgsz=args.imgsz)
+    raise ValueError(f"Bilinmeyen arka uç: {spec} (ultralytics, onnx, onnx-int8)")
+
+
+def measure(backend, images, batch_size, repeat):
+    start = time.perf_counter()
+    backend.load()
+    backend.predict_batch(images[:1])  # Isınma
+    load_seconds = time.perf_counter() - start
+
+    latencies = []
+    for _ in range(repeat):
+        for image in images:
+            start = time.perf_counter()
+            backend.predict_batch([image])
+            latencies.append(time.perf_counter() - start)
+
+    best_throughput, results = 0.0, None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        batch_results = []
+        for offset in range(0, len(images), batch_size):
+            batch_results.extend(backend.predict_batch(images[offset:offset + batch_size]))
+        elapsed = time.perf_counter() - start
+        best_throughput = max(best_throughput, len(images) / elapsed)
+        results = batch_results
+    return {
+        'load_seconds': load_seconds,
+        'latency_median_ms': float(np.median(latencies)) * 1000,
+        'latency_p95_ms': float(np.percentile(latencies, 95)) * 1000,
+        'throughput': best_throughput,
+        'boxes': results,
+    }
+
+
+def agreement(reference_boxes, candidate_boxes):
+    ious, reference_count, candidate_count = [], 0, 0
+    for reference, candidate in zip(reference_boxes, candidate_boxes):
+        ious.extend(iou for _, _, iou in match_boxes(reference, candidate))
+        reference_count += len(reference)
+        candidate_count += len(candidate)
+    return {
+        'mean_iou': float(np.mean(ious)) if ious else None,
+        'recall': len(ious) / reference_count if reference_count else None,
+        'precision': len(ious) / candidate_count if candidate_count else None,
+    }
+
+
+def run(specs, images, args):
+    results = {}
+    for spec in specs:
+        results[spec] = measure(backend_for(spec, args), images, args.batch, args.repeat)
+    reference = results[specs[0]]['boxes']
+    for spec in specs[1:]:
+        results[spec]['agreement'] = agreement(reference, results[spec]['boxes'])
+    return results
+
+
+def _percent(value):
+    return '   -  ' if value is None else f"%{value * 100:5.1f}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--backends', default='ultralytics,onnx,onnx-int8',
+                        help='Virgülle ayrılmış arka uçlar; ilki uyum için referanstır.')
+    parser.add_argument('--previews', default='static/previews', help='Önizleme klasörü.')
+    parser.add_argument('--limit', type=int, default=20, help='En fazla önizleme sayısı.')
+    parser.add_argument('--model', default='modelsv8/best.pt', help='Ultralytics ağırlık dosyası.')
+    parser.add_argument('--onnx', default='modelsv8/best.onnx', help='Dışa aktarılmış ONNX modeli.')
+    parser.add_argument('--imgsz', type=int, default=640)
+    parser.add_argument('--threads', type=int, default=0, help='onnxruntime operatör içi thread (0: varsayılan).')
+    parser.add_argument('--batch', type=int, default=4, help='Verim ölçümünde batch boyutu.')
+    parser.add_argument('--repeat', type=int, default=2)
+    args = parser.parse_args()
+
+    paths, images = load_previews(args.previews, args.limit)
+    if not images:
+        parser.error(f"{args.previews} içinde önizleme bulunamadı.")
+    specs = [spec.strip() for spec in args.backends.split(',') if spec.strip()]
+    results = run(specs, images, args)
+
+    print(f"{len(images)} önizleme, batch={args.batch}, en iyi {args.repeat} deneme (referans: {specs[0]}):")
+    print(f"  {'arka uç':<12} {'yükleme':>8} {'medyan':>9} {'p95':>9} {'verim':>10} {'kutu':>6}"
+          f" {'ort. IoU':>9} {'duyarlılık':>10} {'kesinlik':>9}")
+    for spec, stat in results.items():
+        line = (f"  {spec:<12} {stat['load_seconds']:7.2f}s {stat['latency_median_ms']:6.1f} ms"
+                f" {stat['latency_p95_ms']:6.1f} ms {stat['throughput']:6.2f} g/sn"
+                f" {sum(len(boxes) for boxes in stat['boxes']):6d}")
+        if 'agreement' in stat:
+            match = stat['agreement']
+            mean_iou = '    -' if match['mean_iou'] is None else f"{match['mean_iou']:.3f}"
+            line += f" {mean_iou:>9} {_percent(match['recall']):>10} {_percent(match['precision']):>9}"
+        print(line)
+
+
+if __name__ == '__main__':
+    main()
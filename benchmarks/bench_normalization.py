@@ -0,0 +1,100 @@
+# benchmarks/bench_normalization.py
+"""
+Kontrast normalizasyonu mikro-benchmark'ı.
+
+Eski `normalize_channel` (float32 kopya + iki `np.percentile` + clip/min/max) ile
+histogram/LUT tabanlı motoru sentetik uint16 düzlemler üzerinde karşılaştırır.
+
+Kullanım (proje kökünden):
+    python -m benchmarks.bench_normalization --size 4096 --repeat 3
+"""
+import argparse
+import time
+
+import numpy as np
+
+from normalization import ChannelNormalizer
+
+
+def normalize_channel_reference(channel_data):
+    """processing.py'deki eski uygulama (karşılaştırma için birebir kopya)."""
+    data = channel_data.astype(np.float32)
+    p2 = np.percentile(data, 2)
+    p98 = np.percentile(data, 98)
+    data = np.clip(data, p2, p98)
+    min_val, max_val = np.min(data), np.max(data)
+    if max_val == min_val: return np.zeros_like(data, dtype=np.uint8)
+    data = (data - min_val) / (max_val - min_val)
+    return (data * 255).astype(np.uint8)
+
+
+def synthetic_channels(size, num_channels=3, seed=0):
+    """Mikroskop benzeri (düşük arka plan + parlak lekeler) 12-bit uint16 kanallar."""
+    rng = np.random.default_rng(seed)
+    channels = []
+    for _ in range(num_channels):
+        plane = rng.normal(400, 60, (size, size))
+        for _ in range(20):
+            cy, cx = rng.integers(0, size, 2)
+            r = rng.integers(size // 40, size // 10)
+            y0, y1, x0, x1 = max(cy - r, 0), min(cy + r, size), max(cx - r, 0), min(cx + r, size)
+            plane[y0:y1, x0:x1] += rng.normal(2500, 300)
+        channels.append(np.clip(plane, 0, 4095).astype(np.uint16))
+    return channels
+
+
+def timed(fn, repeat):
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def run(size=4096, repeat=3, num_channels=3):
+    channels = synthetic_channels(size, num_channels)
+    out = np.empty((size, size, num_channels), dtype=np.uint8)
+
+    def reference():
+        return np.stack([normalize_channel_reference(c) for c in channels], axis=2)
+
+    def per_channel():
+        for index, channel in enumerate(channels):
+            ChannelNormalizer(channel.dtype).normalize(channel, out[:, :, index])
+        return out
+
+    results = {}
+    ref_time, ref_out = timed(reference, repeat)
+    results['reference'] = {'seconds': ref_time}
+    for name, fn in (('histogram_lut_per_channel', per_channel),):
+        seconds, result = timed(fn, repeat)
+        diff = np.abs(result.astype(np.int16) - ref_out.astype(np.int16))
+        results[name] = {
+            'seconds': seconds,
+            'speedup': ref_time / seconds if seconds else None,
+            'max_abs_diff': int(diff.max()),
+            'mismatch_ratio': float((diff > 0).mean()),
+        }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size', type=int, default=4096, help='Kare düzlem kenar uzunluğu (piksel).')
+    parser.add_argument('--channels', type=int, default=3)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{args.channels} x {args.size}x{args.size} uint16 düzlem, en iyi {args.repeat} deneme:")
+    for name, stat in run(args.size, args.repeat, args.channels).items():
+        line = f"  {name:<28} {stat['seconds'] * 1000:9.1f} ms"
+        if 'speedup' in stat:
+            line += (f"  x{stat['speedup']:.1f}  maks. fark={stat['max_abs_diff']}"
+                     f"  farklı piksel=%{stat['mismatch_ratio'] * 100:.3f}")
+        print(line)
+
+
+if __name__ == '__main__':
+    main()
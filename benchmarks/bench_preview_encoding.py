@@ -0,0 +1,109 @@
+# benchmarks/bench_preview_encoding.py
+"""
+Önizleme kodlama benchmark'ı.
+
+Normalize edilmiş sentetik bir mikroskop önizlemesini her biçim/ayar için kodlar ve çözer;
+kodlama süresi, çözme süresi ve dosya boyutunu raporlar. Kayıpsız seçenekler (ana kopya)
+tam çözünürlükte, kayıplı seçenekler (görüntüleme kopyası) `--display-size` kenarına
+küçültülmüş görüntü üzerinde ölçülür. Kayıpsız seçeneklerin çözülen pikselleri kaynakla
+birebir karşılaştırılır.
+
+Kullanım (proje kökünden):
+    python -m benchmarks.bench_preview_encoding --size 4096 --repeat 3
+"""
+import argparse
+import io
+
+import numpy as np
+from PIL import Image as PILImage
+
+from normalization import ChannelNormalizer
+from preview_encoding import PreviewEncoding, display_size, encode_image
+from benchmarks.bench_normalization import synthetic_channels, timed
+
+
+# (ad, biçim, kayıpsız mı, PreviewEncoding ayarları)
+OPTIONS = [
+    ('png (PIL varsayılanı, seviye 6)', 'png', True, {'png_compress_level': 6}),
+    ('png seviye 0', 'png', True, {'png_compress_level': 0}),
+    ('png seviye 1', 'png', True, {'png_compress_level': 1}),
+    ('png seviye 3', 'png', True, {'png_compress_level': 3}),
+    ('png seviye 9', 'png', True, {'png_compress_level': 9}),
+    ('webp lossless method 0', 'webp', True, {'webp_method': 0}),
+    ('webp lossless method 4', 'webp', True, {'webp_method': 4}),
+    ('jpeg q85 progresif', 'jpeg', False, {'display_quality': 85}),
+    ('jpeg q75 progresif', 'jpeg', False, {'display_quality': 75}),
+    ('webp q85', 'webp', False, {'display_quality': 85}),
+    ('png seviye 1 (küçük)', 'png', False, {'png_compress_level': 1}),
+]
+
+
+def synthetic_preview(size, num_channels=3):
+    channels = synthetic_channels(size, num_channels)
+    preview = np.empty((size, size, num_channels), dtype=np.uint8)
+    for index, channel in enumerate(channels):
+        ChannelNormalizer(channel.dtype).normalize(channel, preview[:, :, index])
+    if num_channels == 1:
+        return PILImage.fromarray(preview[:, :, 0], 'L')
+    return PILImage.fromarray(preview, 'RGB')
+
+
+def measure(pil_img, fmt, lossless, settings, repeat):
+    encoding = PreviewEncoding(**settings)
+    options = encoding.save_options(fmt, lossless)
+
+    def encode():
+        buffer = io.BytesIO()
+        encode_image(pil_img, buffer, fmt, options)
+        return buffer.getvalue()
+
+    def decode():
+        with PILImage.open(io.BytesIO(data)) as decoded:
+            decoded.load()
+            return decoded.copy()
+
+    encode_seconds, data = timed(encode, repeat)
+    decode_seconds, decoded = timed(decode, repeat)
+    result = {'encode_seconds': encode_seconds, 'decode_seconds': decode_seconds, 'bytes': len(data)}
+    if lossless:
+        result['exact'] = np.array_equal(np.asarray(decoded), np.asarray(pil_img))
+    return result
+
+
+def run(size=4096, repeat=3, num_channels=3, display_max_size=2048):
+    master = synthetic_preview(size, num_channels)
+    width, height, scale = display_size(master.width, master.height, display_max_size)
+    display = master if scale == 1.0 else master.resize((width, height), PILImage.Resampling.LANCZOS)
+    raw_bytes = master.width * master.height * num_channels
+
+    results = {}
+    for name, fmt, lossless, settings in OPTIONS:
+        stat = measure(master if lossless else display, fmt, lossless, settings, repeat)
+        source_bytes = raw_bytes if lossless else display.width * display.height * num_channels
+        stat['ratio'] = stat['bytes'] / source_bytes
+        results[name] = stat
+    return results, (master.width, master.height), (display.width, display.height)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size', type=int, default=4096, help='Kare önizleme kenar uzunluğu (piksel).')
+    parser.add_argument('--channels', type=int, default=3, choices=(1, 3))
+    parser.add_argument('--display-size', type=int, default=2048, help='Görüntüleme kopyasının en uzun kenarı.')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    results, master_size, display_dims = run(args.size, args.repeat, args.channels, args.display_size)
+    print(f"Ana kopya {master_size[0]}x{master_size[1]}, görüntüleme kopyası "
+          f"{display_dims[0]}x{display_dims[1]}, en iyi {args.repeat} deneme:")
+    print(f"  {'seçenek':<32} {'kodlama':>10} {'çözme':>10} {'boyut':>10} {'oran':>7}")
+    for name, stat in results.items():
+        line = (f"  {name:<32} {stat['encode_seconds'] * 1000:7.1f} ms {stat['decode_seconds'] * 1000:7.1f} ms"
+                f" {stat['bytes'] / 1024 / 1024:7.2f} MB {stat['ratio'] * 100:6.1f}%")
+        if 'exact' in stat:
+            line += '  kayıpsız' if stat['exact'] else '  FARKLI!'
+        print(line)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,175 @@
+# benchmarks/bench_save_score.py
+"""
+`/api/save_score` ve `/api/save_scores` eşzamanlılık stres testi.
+
+Geçici bir SQLite veritabanı üzerinde her uzman için birden çok bağımsız oturum
+(`--clients-per-expert`, ör. aynı uzmanın iki sekmesi ya da çift tıklama) açar.
+Her adımda tüm oturumlar bir bariyerde buluşup aynı tespit(ler)e aynı anda farklı
+puanlar gönderir; böylece aynı (tespit, uzman) çiftine eşzamanlı yazım gerçekten
+yarışır. Her istek 200 dönmeli; sonunda her çift için tam olarak bir satır
+bulunmalı ve bu satır son turda kabul edilen puanlardan birini taşımalıdır
+(kayıp, yinelenen ya da eski turdan kalan puan yok). Hata varsa çıkış kodu 1'dir.
+`--batch N` ile her istek N güncellemeyi toplu uç noktaya gönderir.
+
+Kullanım (proje kökünden):
+    python -m benchmarks.bench_save_score --experts 4 --clients-per-expert 3 --detections 20 --rounds 5
+    python -m benchmarks.bench_save_score --batch 10
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+
+GRADES = 'ABCD'
+CRITERIA = ('sitoplazma', 'zona', 'kumulus', 'oopla')
+PASSWORD = 'bench'
+
+
+def setup_database(app_module, experts, detections):
+    from models import db, User, Image, Detection
+
+    app = app_module.app
+    with app.app_context():
+        db.create_all()
+        password = app_module.bcrypt.generate_password_hash(PASSWORD).decode('utf-8')
+        for index in range(experts):
+            db.session.add(User(username=f'bench_uzman{index}', password=password, role='uzman'))
+        db.session.add(Image(id='bench_image', file_path='-', preview_path='-'))
+        for index in range(detections):
+            db.session.add(Detection(id=f'bench_image_det_{index}', parent_image_id='bench_image',
+                                     coordinates_labelme={'points': [[0, 0], [1, 1]]}))
+        db.session.commit()
+        return {user.username: user.id for user in User.query.all()}
+
+
+def logged_in_client(app, username):
+    client = app.test_client()
+    response = client.post('/login', data={'username': username, 'password': PASSWORD})
+    if response.status_code != 302:
+        raise RuntimeError(f"{username} giriş yapamadı ({response.status_code})")
+    return client
+
+
+def payload_for(detection_id, round_index, client_index):
+    # Aynı turda aynı uzmanın oturumları farklı puanlar gönderir; hangisinin kazandığı
+    # belirsizdir ama sonuç o turun puanlarından biri olmalıdır.
+    value = (round_index + client_index) % 5 + 1
+    return {'detection_id': detection_id, 'grade': GRADES[(round_index + client_index) % 4],
+            'scores': {criterion: value for criterion in CRITERIA}}
+
+
+def score_key(grade, scores):
+    return (grade,) + tuple(scores[criterion] for criterion in CRITERIA)
+
+
+def run(experts=4, clients_per_expert=3, detections=20, rounds=5, batch=0):
+    database = tempfile.NamedTemporaryFile(suffix='.db', delete=False)
+    database.close()
+    os.environ['PROJE_DATABASE_URI'] = f'sqlite:///{database.name}'
+    import app as app_module
+    from models import Score
+
+    app = app_module.app
+    user_ids = setup_database(app_module, experts, detections)
+    usernames = [name for name in user_ids if name.startswith('bench_uzman')]
+    # Her oturum ayrı giriş yapar (ayrı çerez kavanozu); aynı uzmanın istekleri sıralanmaz.
+    sessions = [
+        (name, client_index, logged_in_client(app, name))
+        for name in usernames for client_index in range(clients_per_expert)
+    ]
+
+    detection_ids = [f'bench_image_det_{d}' for d in range(detections)]
+    size = batch or 1
+    steps = [
+        (round_index, detection_ids[i:i + size])
+        for round_index in range(rounds) for i in range(0, detections, size)
+    ]
+    barrier = threading.Barrier(len(sessions))
+    lock = threading.Lock()
+    statuses = Counter()
+    accepted = defaultdict(dict)  # (tespit, uzman) -> {tur: {kabul edilen puanlar}}
+    failures = []
+
+    def worker(name, client_index, client):
+        try:
+            for round_index, step_ids in steps:
+                payloads = [payload_for(detection_id, round_index, client_index) for detection_id in step_ids]
+                barrier.wait(timeout=60)
+                if batch:
+                    response = client.post('/api/save_scores', json={'updates': payloads})
+                else:
+                    response = client.post('/api/save_score', json=payloads[0])
+                with lock:
+                    statuses[response.status_code] += 1
+                    if response.status_code == 200:
+                        for payload in payloads:
+                            pair = (payload['detection_id'], user_ids[name])
+                            accepted[pair].setdefault(round_index, set()).add(
+                                score_key(payload['grade'], payload['scores'])
+                            )
+        except threading.BrokenBarrierError:
+            pass
+        except Exception as error:
+            with lock:
+                failures.append(f"{name}#{client_index}: {error!r}")
+            barrier.abort()
+
+    threads = [threading.Thread(target=worker, args=session) for session in sessions]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    errors = list(failures)
+    with app.app_context():
+        rows = Score.query.filter(Score.detection_id.like('bench_image_det_%')).all()
+        pairs = Counter((row.detection_id, row.user_id) for row in rows)
+        duplicates = [pair for pair, count in pairs.items() if count > 1]
+        missing = set(accepted) - set(pairs)
+        if duplicates:
+            errors.append(f"{len(duplicates)} yinelenen puan satırı")
+        if missing:
+            errors.append(f"{len(missing)} kayıp puan")
+        for row in rows:
+            by_round = accepted.get((row.detection_id, row.user_id))
+            if not by_round:
+                continue
+            expected = by_round[max(by_round)]
+            stored = (row.grade, row.score_sitoplazma, row.score_zona, row.score_kumulus, row.score_oopla)
+            if stored not in expected:
+                errors.append(f"{row.detection_id}/{row.user_id}: son turda gönderilen puan kaydedilmemiş {stored}")
+    if set(statuses) != {200}:
+        errors.append(f"başarısız yanıtlar: {dict(statuses)}")
+
+    os.unlink(database.name)
+    return {'updates': len(sessions) * rounds * detections, 'requests': sum(statuses.values()),
+            'sessions': len(sessions), 'seconds': elapsed, 'rows': len(rows), 'statuses': dict(statuses),
+            'errors': errors}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--experts', type=int, default=4)
+    parser.add_argument('--clients-per-expert', type=int, default=3,
+                        help='Uzman başına ayrı giriş yapmış eşzamanlı oturum sayısı.')
+    parser.add_argument('--detections', type=int, default=20)
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--batch', type=int, default=0, help='>0: /api/save_scores ile istek başına güncelleme sayısı.')
+    args = parser.parse_args()
+
+    result = run(args.experts, args.clients_per_expert, args.detections, args.rounds, args.batch)
+    print(f"{result['updates']} güncelleme, {result['requests']} istek, {result['sessions']} oturum: {result['seconds']:.2f} sn "
+          f"({result['requests'] / result['seconds']:.0f} istek/sn), {result['rows']} puan satırı, "
+          f"yanıtlar={result['statuses']}")
+    for error in result['errors']:
+        print(f"  HATA: {error}")
+    sys.exit(1 if result['errors'] else 0)
+
+
+if __name__ == '__main__':
+    main()
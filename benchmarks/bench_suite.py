@@ -0,0 +1,444 @@
+# benchmarks/bench_suite.py
+"""
+Uçtan uca benchmark takımı (çevrimdışı, sahte dedektörle).
+
+Üç grup ölçülür:
+- pipeline: sentetik CZI dizileri (çok kanallı, çok sahneli, gri) `process_czi_image` ile
+  işlenir; her aşamanın (opening, metadata, normalizing, saving_preview, building_tiles,
+  detecting, saving_crops) süresi ilerleme bildirimlerinin zaman damgalarından hesaplanır;
+  `process_czi_image`'in metadata'ya yazdığı `stage_seconds` değerleri de `timer.*` olarak kaydedilir.
+  Aynı içeriğin önbellekten yeniden kullanımı (`reuse_cached_result`) da ölçülür.
+- endpoints: varsayılan olarak 10.000 görüntü, 200.000 tespit ve 1.000.000 puanla tohumlanan
+  geçici bir veritabanında uzman ve admin uç noktaları (liste, annotate, puan kaydı, panel,
+  görüntü detayı, konsensüs) Flask test istemcisiyle çağrılır.
+- exports: puan raporu (csv / xlsx / parquet) ve sınıflandırma veri seti (boş kırpma deposuyla
+  soğuk, dolu depoyla sıcak, konsensüs etiketli) uç noktaları.
+
+Sonuçlar makinece okunabilir JSON olarak yazılır (git commit'i, parametreler, her ölçüm için
+medyan / p95 / en küçük / ortalama ms); `--compare` ile önceki bir sonuç dosyasıyla karşılaştırılır.
+
+Kullanım (proje kökünden):
+    python -m benchmarks.bench_suite --output bench_results.json
+    python -m benchmarks.bench_suite --scale 0.05 --groups pipeline,endpoints --output hizli.json
+    python -m benchmarks.bench_suite --workdir /tmp/bench --reuse-db --compare onceki.json
+    python -m benchmarks.bench_suite --input yeni.json --compare onceki.json
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+
+from benchmarks.fixtures import (
+    ADMIN_USERNAME, CRITERIA, GRADES, StubDetector, SyntheticCziImage, image_id_for,
+    seed_database, write_synthetic_czi
+)
+from benchmarks.bench_save_score import logged_in_client
+
+
+RESULTS_VERSION = 1
+GROUPS = ('pipeline', 'endpoints', 'exports')
+# (ad, kanal, sahne, piksel tipi) — processing.py'nin üç renk modu
+PIPELINE_FIXTURES = [
+    ('kanal_3x_uint16', 3, 1, 'uint16'),
+    ('sahne_3x_uint16', 1, 3, 'uint16'),
+    ('gri_uint8', 1, 1, 'uint8'),
+]
+FIXTURE_FILE = 'fixture.json'
+
+
+# --- Ölçüm yardımcıları ---
+def summarize(samples, **extra):
+    """Saniye cinsinden örneklerden ms istatistikleri."""
+    values = np.asarray(samples, dtype=np.float64) * 1000
+    stat = {
+        'n': int(values.size),
+        'median_ms': float(np.median(values)),
+        'p95_ms': float(np.percentile(values, 95)),
+        'min_ms': float(values.min()),
+        'mean_ms': float(values.mean()),
+    }
+    stat.update(extra)
+    return stat
+
+
+def git_info():
+    def run(*command):
+        return subprocess.run(command, capture_output=True, text=True, check=True).stdout.strip()
+    try:
+        return {'commit': run('git', 'rev-parse', 'HEAD'), 'dirty': bool(run('git', 'status', '--porcelain'))}
+    except (OSError, subprocess.CalledProcessError):
+        return {'commit': None, 'dirty': None}
+
+
+# --- Uygulama ve veritabanı ---
+def prepare_app(workdir, args, log=print):
+    """
+    Uygulamayı `workdir` içindeki veritabanı ve klasörlerle yükler; gerekirse tohumlar.
+    `--reuse-db` ile aynı parametrelerle tohumlanmış veritabanı yeniden kullanılır.
+    """
+    params = {'images': args.images, 'detections_per_image': args.detections_per_image,
+              'experts': args.experts, 'preview_size': args.preview_size}
+    database_path = os.path.join(workdir, 'bench.db')
+    fixture_path = os.path.join(workdir, FIXTURE_FILE)
+    reuse = False
+    if args.reuse_db and os.path.exists(database_path) and os.path.exists(fixture_path):
+        with open(fixture_path, encoding='utf-8') as f:
+            reuse = json.load(f).get('params') == params
+    if not reuse:
+        for name in ('bench.db', 'bench.db-wal', 'bench.db-shm', FIXTURE_FILE):
+            if os.path.exists(os.path.join(workdir, name)):
+                os.remove(os.path.join(workdir, name))
+        shutil.rmtree(os.path.join(workdir, 'previews'), ignore_errors=True)
+
+    os.environ['PROJE_DATABASE_URI'] = f'sqlite:///{database_path}'
+    import app as app_module
+
+    config = app_module.app.config
+    for key, folder in (('UPLOAD_FOLDER', 'uploads'), ('PREVIEW_FOLDER', 'previews'), ('PYRAMID_FOLDER', 'tiles'),
+                        ('CROP_FOLDER', 'crops'), ('CROP_STORE_FOLDER', 'crop_store'),
+                        ('EXPORT_MANIFEST_FOLDER', 'exports'), ('PROCESSING_CACHE_FOLDER', 'processing_cache')):
+        config[key] = os.path.join(workdir, folder)
+        os.makedirs(config[key], exist_ok=True)
+    config['EXPORT_WORKERS'] = args.export_workers
+
+    fixture = {'params': params}
+    if reuse:
+        with open(fixture_path, encoding='utf-8') as f:
+            fixture = json.load(f)
+        log(f"Tohumlanmış veritabanı yeniden kullanılıyor: {database_path}")
+    else:
+        log(f"Veritabanı tohumlanıyor: {args.images} görüntü, {args.images * args.detections_per_image} tespit, "
+            f"{args.images * args.detections_per_image * args.experts} puan...")
+        start = time.perf_counter()
+        seed_database(app_module, log=log, **params)
+        fixture['seed_seconds'] = time.perf_counter() - start
+        with open(fixture_path, 'w', encoding='utf-8') as f:
+            json.dump(fixture, f)
+    with app_module.app.app_context():
+        from models import db, Image, Detection, Score
+        fixture['counts'] = {
+            'images': db.session.query(Image).count(),
+            'detections': db.session.query(Detection).count(),
+            'scores': db.session.query(Score).count(),
+        }
+    return app_module, fixture
+
+
+# --- 1. İşleme hattı ---
+def stage_durations(events, end):
+    """[(aşama, zaman)] bildirimlerinden aşama süreleri: her aşama bir sonrakinin başına kadar sürer."""
+    durations = {}
+    for (stage, started), (_, finished) in zip(events, events[1:] + [(None, end)]):
+        durations[stage] = durations.get(stage, 0.0) + finished - started
+    return durations
+
+
+def timed_processing(fn):
+    events = []
+    start = time.perf_counter()
+    result = fn(lambda stage, percent: events.append((stage, time.perf_counter())))
+    end = time.perf_counter()
+    durations = stage_durations(events, end)
+    durations['total'] = end - start
+    return durations, result
+
+
+def bench_pipeline(app_module, workdir, args, log=print):
+    from processing import process_czi_image, processing_options_from_config, reuse_cached_result
+
+    config = app_module.app.config
+    options = processing_options_from_config(config)
+    detector = StubDetector(boxes_per_image=args.detections_per_image, delay_ms=args.detector_delay_ms)
+    czi_folder = os.path.join(workdir, 'czi')
+    os.makedirs(czi_folder, exist_ok=True)
+
+    results = {}
+    for name, channels, scenes, dtype in PIPELINE_FIXTURES:
+        czi_path = os.path.join(czi_folder, f'{name}_{args.czi_size}.czi')
+        if not os.path.exists(czi_path):
+            write_synthetic_czi(czi_path, args.czi_size, channels, scenes, z_slices=3, dtype=dtype)
+        samples = {}
+        for run_index in range(args.pipeline_repeat + 1):
+            image_id = f'pipeline_{name}_{run_index}'
+            durations, (metadata, preview_path, detections) = timed_processing(
+                lambda callback: process_czi_image(
+                    czi_path, image_id, config['PREVIEW_FOLDER'], config['YOLO_MODEL_PATH'],
+                    detector=detector, progress_callback=callback, image_reader=SyntheticCziImage, **options
+                )
+            )
+            if run_index == 0:
+                continue  # Isınma (ilk import / dosya önbelleği)
+            for stage, seconds in durations.items():
+                samples.setdefault(stage, []).append(seconds)
+            # İşleme kodunun kendi ölçtüğü ince aşamalar (plane_read / normalize ayrı)
+            for stage, seconds in metadata.get('stage_seconds', {}).items():
+                samples.setdefault(f'timer.{stage}', []).append(seconds)
+        for stage, values in samples.items():
+            results[f'pipeline.{name}.{stage}'] = summarize(values)
+
+        # Aynı içerik tekrar yüklendiğinde: önbellekteki ana önizlemeden çıktıların üretilmesi
+        cached_preview = os.path.join(config['PREVIEW_FOLDER'], os.path.basename(preview_path))
+        coordinates = [detection['coordinates_labelme'] for detection in detections]
+        samples = []
+        for run_index in range(args.pipeline_repeat):
+            durations, _ = timed_processing(
+                lambda callback: reuse_cached_result(
+                    cached_preview, f'pipeline_{name}_cache_{run_index}', config['PREVIEW_FOLDER'],
+                    metadata, coordinates, progress_callback=callback, **options
+                )
+            )
+            samples.append(durations['total'])
+        results[f'pipeline.{name}.cache_hit_total'] = summarize(samples)
+        log(f"  {name}: toplam medyan {results[f'pipeline.{name}.total']['median_ms']:.0f} ms")
+    return results
+
+
+# --- 2. Uç noktalar ---
+def score_payload(detection_id, sequence):
+    value = sequence % 5 + 1
+    return {'detection_id': detection_id, 'grade': GRADES[sequence % len(GRADES)],
+            'scores': {criterion: value for criterion in CRITERIA}}
+
+
+def endpoint_cases(args):
+    """(ad, kullanıcı, yöntem, istek üreticisi) — üretici sıra numarasından (yol, json) döndürür."""
+    images = args.images
+    per_image = args.detections_per_image
+
+    def image_at(sequence):
+        return image_id_for((sequence * 7919) % images)
+
+    def edit_detection(sequence):
+        # Kutu iki konum arasında gidip gelir; veritabanı her turda aynı duruma döner
+        image_id = image_at(sequence)
+        shift = 4 if sequence % 2 == 0 else 0
+        box = [[40 + shift, 40 + shift], [120 + shift, 120 + shift]]
+        return '/api/edit_detections', {'image_id': image_id, 'update': [{'id': f'{image_id}_1', 'coordinates': box}]}
+
+    return [
+        ('expert.dashboard', 'expert', 'GET', lambda s: ('/dashboard', None)),
+        ('expert.images.uploaded', 'expert', 'GET', lambda s: ('/api/images?limit=50', None)),
+        ('expert.images.assigned_unscored', 'expert', 'GET',
+         lambda s: ('/api/images?scope=assigned&status=unscored&limit=50', None)),
+        ('expert.annotate', 'expert', 'GET', lambda s: (f'/annotate/{image_at(s)}', None)),
+        ('expert.save_score', 'expert', 'POST',
+         lambda s: ('/api/save_score', score_payload(f'{image_at(s)}_{s % per_image + 1}', s))),
+        ('expert.save_scores_image', 'expert', 'POST',
+         lambda s: ('/api/save_scores', {'updates': [
+             score_payload(f'{image_at(s)}_{number}', s + number) for number in range(1, per_image + 1)
+         ]})),
+        ('expert.edit_detections', 'expert', 'POST', edit_detection),
+        ('admin.dashboard', 'admin', 'GET', lambda s: ('/admin', None)),
+        ('admin.images.all', 'admin', 'GET', lambda s: ('/api/images?scope=all&limit=50', None)),
+        ('admin.images.pending', 'admin', 'GET', lambda s: ('/api/images?scope=all&status=pending&limit=50', None)),
+        ('admin.images.metadata_filter', 'admin', 'GET',
+         lambda s: ('/api/images?scope=all&objective=20x&channels=3&date_from=2024-03-01'
+                    '&sort=-acquisition_date&limit=50', None)),
+        ('admin.image_detail', 'admin', 'GET', lambda s: (f'/admin/image/{image_at(s)}', None)),
+        ('admin.consensus', 'admin', 'GET', lambda s: (f'/admin/api/consensus/{image_at(s)}', None)),
+    ]
+
+
+def call(client, method, path, payload):
+    if method == 'GET':
+        return client.get(path)
+    return client.post(path, json=payload)
+
+
+def bench_endpoints(app_module, args, log=print):
+    app = app_module.app
+    clients = {'expert': logged_in_client(app, 'bench_uzman0'), 'admin': logged_in_client(app, ADMIN_USERNAME)}
+    results = {}
+    for name, role, method, request_for in endpoint_cases(args):
+        samples, sizes = [], []
+        for sequence in range(args.repeat + 1):
+            path, payload = request_for(sequence)
+            start = time.perf_counter()
+            response = call(clients[role], method, path, payload)
+            body = response.get_data()
+            elapsed = time.perf_counter() - start
+            if response.status_code != 200:
+                raise RuntimeError(f"{name}: {method} {path} -> {response.status_code}: {body[:200]!r}")
+            if sequence:  # İlk istek ısınmadır
+                samples.append(elapsed)
+                sizes.append(len(body))
+        results[f'endpoint.{name}'] = summarize(samples, bytes=int(np.median(sizes)))
+        log(f"  {name}: medyan {results[f'endpoint.{name}']['median_ms']:.1f} ms")
+    return results
+
+
+# --- 3. Dışa aktarımlar ---
+def stream_download(client, path):
+    """Akış yanıtını belleğe toplamadan sonuna kadar okur. Dönüş: (saniye, bayt)."""
+    start = time.perf_counter()
+    response = client.get(path)
+    if response.status_code != 200:
+        raise RuntimeError(f"{path} -> {response.status_code}")
+    size = sum(len(chunk) for chunk in response.response)
+    response.close()
+    return time.perf_counter() - start, size
+
+
+def bench_exports(app_module, args, fixture, log=print):
+    app = app_module.app
+    client = logged_in_client(app, ADMIN_USERNAME)
+    score_count = fixture['counts']['scores']
+    results = {}
+
+    for export_format in args.score_formats:
+        samples, size = [], 0
+        for _ in range(args.export_repeat):
+            seconds, size = stream_download(client, f'/admin/download_scores?format={export_format}')
+            samples.append(seconds)
+        stat = summarize(samples, bytes=size, rows=score_count)
+        stat['rows_per_second'] = score_count / (stat['median_ms'] / 1000)
+        results[f'export.scores.{export_format}'] = stat
+        log(f"  puanlar ({export_format}): {stat['median_ms'] / 1000:.1f} sn, {size / 1024 / 1024:.1f} MB")
+
+    # Veri seti: boş depoyla (tüm kırpmalar üretilir), sonra dolu depoyla (sadece okunur)
+    shutil.rmtree(app.config['CROP_STORE_FOLDER'], ignore_errors=True)
+    os.makedirs(app.config['CROP_STORE_FOLDER'], exist_ok=True)
+    runs = [('dataset.cold', '/admin/download_classification_dataset', 1)]
+    runs.append(('dataset.warm', '/admin/download_classification_dataset', args.export_repeat))
+    runs.append(('dataset.consensus_warm', '/admin/download_classification_dataset?labels=consensus',
+                 args.export_repeat))
+    for name, path, repeat in runs:
+        samples, size = [], 0
+        for _ in range(repeat):
+            seconds, size = stream_download(client, path)
+            samples.append(seconds)
+        results[f'export.{name}'] = summarize(samples, bytes=size)
+        log(f"  {name}: {results[f'export.{name}']['median_ms'] / 1000:.1f} sn, {size / 1024 / 1024:.1f} MB")
+    return results
+
+
+# --- Sonuçlar ---
+def compare(previous, current, threshold):
+    """Ortak ölçümlerin medyanlarını karşılaştırır; eşikten fazla değişenleri işaretler."""
+    rows = []
+    for key in sorted(set(previous['results']) & set(current['results'])):
+        old, new = previous['results'][key]['median_ms'], current['results'][key]['median_ms']
+        change = (new - old) / old * 100 if old else 0.0
+        mark = ''
+        if change > threshold:
+            mark = 'YAVAŞLADI'
+        elif change < -threshold:
+            mark = 'HIZLANDI'
+        rows.append((key, old, new, change, mark))
+    return rows
+
+
+def print_comparison(previous, current, threshold):
+    old_commit = (previous.get('git') or {}).get('commit') or '?'
+    new_commit = (current.get('git') or {}).get('commit') or '?'
+    print(f"Karşılaştırma (medyan): {old_commit[:10]} -> {new_commit[:10]}, eşik %{threshold:g}")
+    print(f"  {'ölçüm':<48} {'önceki':>11} {'şimdiki':>11} {'değişim':>9}")
+    for key, old, new, change, mark in compare(previous, current, threshold):
+        print(f"  {key:<48} {old:8.1f} ms {new:8.1f} ms {change:+8.1f}% {mark}")
+    changed = sorted(key for key in set(previous['params']) | set(current['params'])
+                     if previous['params'].get(key) != current['params'].get(key))
+    if changed:
+        print(f"  UYARI: parametreler farklı ({', '.join(changed)}); sonuçlar doğrudan karşılaştırılamayabilir.")
+    one_sided = set(previous['results']) ^ set(current['results'])
+    if one_sided:
+        print(f"  {len(one_sided)} ölçüm sadece bir tarafta var.")
+
+
+def run(args, log=print):
+    workdir = args.workdir or tempfile.mkdtemp(prefix='bench_suite_')
+    os.makedirs(workdir, exist_ok=True)
+    app_module, fixture = prepare_app(workdir, args, log)
+    results = {}
+    try:
+        if 'pipeline' in args.groups:
+            log("İşleme hattı:")
+            results.update(bench_pipeline(app_module, workdir, args, log))
+        if 'endpoints' in args.groups:
+            log("Uç noktalar:")
+            results.update(bench_endpoints(app_module, args, log))
+        if 'exports' in args.groups:
+            log("Dışa aktarımlar:")
+            results.update(bench_exports(app_module, args, fixture, log))
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+    return {
+        'version': RESULTS_VERSION,
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'git': git_info(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'params': {
+            'groups': list(args.groups), 'scale': args.scale, 'images': args.images,
+            'detections_per_image': args.detections_per_image, 'experts': args.experts,
+            'preview_size': args.preview_size, 'czi_size': args.czi_size, 'repeat': args.repeat,
+            'pipeline_repeat': args.pipeline_repeat, 'export_repeat': args.export_repeat,
+            'score_formats': list(args.score_formats), 'export_workers': args.export_workers,
+            'detector_delay_ms': args.detector_delay_ms,
+        },
+        'fixture': fixture,
+        'results': results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--groups', default=','.join(GROUPS), help='Virgülle ayrılmış gruplar: pipeline,endpoints,exports.')
+    parser.add_argument('--scale', type=float, default=1.0,
+                        help='Veritabanı ölçeği (1.0: 10.000 görüntü / 200.000 tespit / 1.000.000 puan).')
+    parser.add_argument('--images', type=int, default=None, help='Görüntü sayısı (--scale yerine).')
+    parser.add_argument('--detections-per-image', type=int, default=20)
+    parser.add_argument('--experts', type=int, default=5, help='Her uzman her tespiti puanlar.')
+    parser.add_argument('--preview-size', type=int, default=1024, help='Tohumlanan önizlemelerin kenarı (px).')
+    parser.add_argument('--czi-size', type=int, default=2048, help='Sentetik CZI düzlemlerinin kenarı (px).')
+    parser.add_argument('--repeat', type=int, default=20, help='Uç nokta başına ölçülen istek sayısı.')
+    parser.add_argument('--pipeline-repeat', type=int, default=3)
+    parser.add_argument('--export-repeat', type=int, default=1)
+    parser.add_argument('--score-formats', default='csv,xlsx,parquet')
+    parser.add_argument('--export-workers', type=int, default=None, help='Veri seti kırpma süreç sayısı.')
+    parser.add_argument('--detector-delay-ms', type=float, default=0, help='Sahte dedektörde görüntü başına bekleme.')
+    parser.add_argument('--workdir', default=None, help='Veritabanı ve dosyalar için klasör (verilmezse geçici, sonunda silinir).')
+    parser.add_argument('--reuse-db', action='store_true', help='--workdir içindeki aynı parametreli veritabanını kullan.')
+    parser.add_argument('--output', default=None, help='Sonuçların yazılacağı JSON dosyası.')
+    parser.add_argument('--input', default=None, help='Çalıştırmadan bu sonuç dosyasını kullan (--compare ile).')
+    parser.add_argument('--compare', default=None, help='Karşılaştırılacak önceki sonuç dosyası.')
+    parser.add_argument('--threshold', type=float, default=10.0, help='İşaretlenecek değişim eşiği (%%).')
+    args = parser.parse_args()
+
+    args.groups = [group.strip() for group in args.groups.split(',') if group.strip()]
+    unknown = set(args.groups) - set(GROUPS)
+    if unknown:
+        parser.error(f"Bilinmeyen grup: {', '.join(sorted(unknown))}")
+    args.score_formats = [fmt.strip() for fmt in args.score_formats.split(',') if fmt.strip()]
+    args.images = args.images or max(1, round(10000 * args.scale))
+    if args.reuse_db and not args.workdir:
+        parser.error('--reuse-db için --workdir gerekir.')
+
+    if args.input:
+        with open(args.input, encoding='utf-8') as f:
+            current = json.load(f)
+    else:
+        current = run(args)
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as f:
+                json.dump(current, f, indent=2, ensure_ascii=False)
+            print(f"Sonuçlar yazıldı: {args.output}")
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            print_comparison(json.load(f), current, args.threshold)
+    elif not args.output:
+        json.dump(current, sys.stdout, indent=2, ensure_ascii=False)
+        print()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+# benchmarks/check_consensus.py
+"""
+Konsensüs hesaplarının bilinen örnekler üzerinde doğrulanması.
+
+Çoğunluk notunun eşitlik kuralı (sadece en çok oy alan notlar arasından alt medyan),
+uyum oranı ve medyanlar elle hesaplanmış beklenen değerlerle karşılaştırılır.
+Bir kontrol başarısız olursa çıkış kodu 1'dir.
+
+Kullanım (proje kökünden):
+    python -m benchmarks.check_consensus
+"""
+import argparse
+import sys
+
+import numpy as np
+
+from consensus import GRADES, category_counts, compute_consensus, lower_median, majority
+
+
+# (açıklama, not oyları, beklenen çoğunluk, beklenen uyum, beklenen alt medyan)
+GRADE_CASES = [
+    ('tek mod', 'AAB', 'A', 2 / 3, 'A'),
+    ('iki uç mod (A:2, B:1, D:2)', 'AABDD', 'A', 0.4, 'B'),
+    ('iki komşu mod', 'BBCC', 'B', 0.5, 'B'),
+    ('üç mod', 'ABD', 'B', 1 / 3, 'B'),
+    ('dört mod', 'ABCD', 'B', 0.25, 'B'),
+    ('üst modlar (C:2, D:2, A:1)', 'ACCDD', 'C', 0.4, 'C'),
+    ('tek oy', 'D', 'D', 1.0, 'D'),
+]
+
+
+def grade_codes(votes):
+    return np.array([[GRADES.index(grade) for grade in votes]], dtype=np.int64)
+
+
+def check_majority():
+    errors = []
+    for label, votes, expected, expected_agreement, expected_median in GRADE_CASES:
+        counts = category_counts(grade_codes(votes), len(GRADES))
+        winner, agreement = majority(counts)
+        median = lower_median(counts)
+        got = GRADES[winner[0]]
+        if got != expected or not np.isclose(agreement[0], expected_agreement):
+            errors.append(f"{label}: çoğunluk {got} / {agreement[0]:.3f}, beklenen {expected} / {expected_agreement:.3f}")
+        if GRADES[median[0]] != expected_median:
+            errors.append(f"{label}: alt medyan {GRADES[median[0]]}, beklenen {expected_median}")
+
+    winner, agreement = majority(np.zeros((1, len(GRADES)), dtype=np.int64))
+    if winner[0] != -1 or not np.isnan(agreement[0]):
+        errors.append(f"oy yok: çoğunluk {winner[0]} / {agreement[0]}, beklenen -1 / nan")
+    return errors
+
+
+def check_compute_consensus():
+    # Beş uzman, tek tespit: A:2, B:1, D:2 ve zona için 1, 1, 2, 5, 5
+    rows = [
+        ('det_1', user_id, grade, 3, zona, 3, 3)
+        for user_id, grade, zona in zip(range(1, 6), 'AABDD', (1, 1, 2, 5, 5))
+    ]
+    detections, image = compute_consensus(rows)
+    record = detections['det_1']
+    expected = {'rater_count': 5, 'grade_majority': 'A', 'grade_median': 'B', 'grade_agreement': 0.4,
+                'zona_median': 2, 'sitoplazma_std': 0.0}
+    errors = []
+    for key, value in expected.items():
+        if not np.isclose(record[key], value) if isinstance(value, float) else record[key] != value:
+            errors.append(f"compute_consensus {key}: {record[key]!r}, beklenen {value!r}")
+    if image['scored_detections'] != 1 or image['rater_count'] != 5:
+        errors.append(f"compute_consensus görüntü özeti: {image['scored_detections']} tespit, {image['rater_count']} uzman")
+    return errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.parse_args()
+
+    errors = check_majority() + check_compute_consensus()
+    for error in errors:
+        print(f"  HATA: {error}")
+    print(f"{len(GRADE_CASES)} not örneği ve compute_consensus kontrol edildi: {len(errors)} hata")
+    sys.exit(1 if errors else 0)
+
+
+if __name__ == '__main__':
+    main()
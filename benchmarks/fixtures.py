@@ -0,0 +1,265 @@
+# benchmarks/fixtures.py
+"""
+Benchmark'lar için çevrimdışı sentetik veri.
+
+- CZI yerine geçen çok kanallı / çok sahneli diziler: (S, C, Z, Y, X) dizisi `.npy` olarak
+  `.czi` uzantılı dosyaya yazılır ve AICSImage arayüzünü taklit eden `SyntheticCziImage` ile
+  tembel (dask) düzlemler halinde okunur (`process_czi_image(..., image_reader=SyntheticCziImage)`).
+- `StubDetector`: model yüklemeden görüntü boyutuna göre sabit kutular döndüren dedektör.
+- `seed_database`: binlerce görüntü, yüz binlerce tespit ve milyonlarca puanı toplu INSERT
+  (executemany) ile yazan veritabanı tohumlayıcısı; konsensüs tabloları da doldurulur.
+"""
+import hashlib
+import math
+import os
+import random
+import shutil
+import time
+import xml.etree.ElementTree as ET
+from collections import namedtuple
+from datetime import date, datetime, timedelta
+
+import dask.array as da
+import numpy as np
+from PIL import Image as PILImage
+
+from benchmarks.bench_normalization import synthetic_channels
+from benchmarks.bench_save_score import PASSWORD
+
+
+ADMIN_USERNAME = 'bench_admin'
+OBJECTIVES = ['Plan-Apochromat 10x/0.45', 'Plan-Apochromat 20x/0.8', 'EC Plan-Neofluar 40x/0.75']
+GRADES = 'ABCD'
+CRITERIA = ('sitoplazma', 'zona', 'kumulus', 'oopla')
+
+SceneDims = namedtuple('SceneDims', 'S C Z Y X order')
+PixelSizes = namedtuple('PixelSizes', 'Z Y X')
+
+
+# --- CZI yerine geçen diziler ---
+def write_synthetic_czi(path, size=2048, channels=3, scenes=1, z_slices=1, dtype='uint16', seed=0):
+    """
+    Mikroskop benzeri düzlemlerden oluşan (S, C, Z, Y, X) dizisini diske yazar.
+    uint16 düzlemler 12 bitliktir (normalize edilir); uint8 düzlemler doğrudan kopyalanır.
+    """
+    dtype = np.dtype(dtype)
+    data = np.lib.format.open_memmap(path, mode='w+', dtype=dtype, shape=(scenes, channels, z_slices, size, size))
+    for s in range(scenes):
+        for c in range(channels):
+            plane = synthetic_channels(size, 1, seed=seed * 1000 + s * 10 + c)[0]
+            if dtype == np.uint8:
+                plane = (plane >> 4).astype(np.uint8)
+            data[s, c, :] = plane
+    data.flush()
+    del data
+    return path
+
+
+class SyntheticCziImage:
+    """AICSImage'ın `_process_czi_image` içinde kullanılan kısmı: boyutlar, tip, metadata, tembel düzlemler."""
+
+    SCALE_UM_PER_PIXEL = 0.345
+    CHUNK_ROWS = 512  # CZI alt blokları gibi düzlemler satır parçaları halinde okunur
+
+    def __init__(self, path):
+        self._data = np.load(path, mmap_mode='r')
+        scenes, channels, z_slices, height, width = self._data.shape
+        self.dims = SceneDims(scenes, channels, z_slices, height, width, 'SCZYX')
+        self.dtype = self._data.dtype
+        self.physical_pixel_sizes = PixelSizes(None, self.SCALE_UM_PER_PIXEL / 1e6, self.SCALE_UM_PER_PIXEL / 1e6)
+        self.channel_names = [f'Kanal {c}' for c in range(channels)]
+        self.metadata = self._metadata_xml()
+
+    @staticmethod
+    def _metadata_xml():
+        root = ET.Element('ImageDocument')
+        information = ET.SubElement(ET.SubElement(root, 'Metadata'), 'Information')
+        objectives = ET.SubElement(ET.SubElement(information, 'Instrument'), 'Objectives')
+        ET.SubElement(objectives, 'Objective', Name=OBJECTIVES[1])
+        ET.SubElement(ET.SubElement(information, 'Image'), 'AcquisitionDateAndTime').text = '2025-01-15T10:00:00.000'
+        return root
+
+    def get_image_dask_data(self, dimension_order, Z=0, T=0, C=0, S=0):
+        if dimension_order != 'YX':
+            raise ValueError(f"Sentetik okuyucu sadece 'YX' düzlemleri verir: {dimension_order}")
+        return da.from_array(self._data[S, C, Z], chunks=(self.CHUNK_ROWS, -1))
+
+
+# --- Sahte dedektör ---
+class StubDetector:
+    """
+    InferenceService yerine geçer: model yüklemez, görüntü boyutuna göre ızgaraya dizilmiş
+    sabit `boxes_per_image` kutu döndürür. `delay_ms` ile model süresi taklit edilebilir.
+    """
+
+    def __init__(self, boxes_per_image=20, delay_ms=0):
+        self.boxes_per_image = boxes_per_image
+        self.delay_ms = delay_ms
+
+    def predict(self, image):
+        if self.delay_ms:
+            time.sleep(self.delay_ms / 1000)
+        height, width = image.shape[:2]
+        return grid_boxes(width, height, self.boxes_per_image)
+
+    def predict_many(self, images):
+        return [self.predict(image) for image in images]
+
+
+def grid_boxes(width, height, count):
+    """Görüntüye eşit aralıklı ızgara halinde yerleştirilmiş `count` kutu: (N, 5) [x1, y1, x2, y2, güven]."""
+    columns = max(1, math.ceil(math.sqrt(count)))
+    rows = max(1, math.ceil(count / columns))
+    cell_w, cell_h = width / columns, height / rows
+    boxes = np.zeros((count, 5), dtype=np.float32)
+    for index in range(count):
+        row, column = divmod(index, columns)
+        x0, y0 = column * cell_w, row * cell_h
+        boxes[index] = [x0 + cell_w * 0.2, y0 + cell_h * 0.2, x0 + cell_w * 0.8, y0 + cell_h * 0.8, 0.9]
+    return boxes
+
+
+# --- Veritabanı tohumlama ---
+def image_id_for(index):
+    return f'bench_{index:06d}'
+
+
+def _image_row(index, uploader_id, detections_per_image, preview_size, now):
+    image_id = image_id_for(index)
+    acquisition_date = date(2024, 1, 1) + timedelta(days=index % 365)
+    channels = 3 if index % 4 else 1
+    scale = round(0.1 + (index % 10) * 0.1, 3)
+    objective = OBJECTIVES[index % len(OBJECTIVES)]
+    metadata = {
+        'scale_um_per_pixel': scale,
+        'dimensions': 'SCZYX',
+        'size_bytes': 0,
+        'acquisition_date': acquisition_date.isoformat(),
+        'channel_names': [f'Kanal {c}' for c in range(channels)],
+        'objective_name': objective,
+        'preview_downsample': 1,
+    }
+    return {
+        'id': image_id,
+        'file_path': '-',
+        'preview_path': f'previews/{image_id}.png',
+        'metadata_json': metadata,
+        'uploader_id': uploader_id,
+        'detection_seq': detections_per_image,
+        'objective_name': objective,
+        'acquisition_date': acquisition_date,
+        'scale_um_per_pixel': scale,
+        'channel_count': channels,
+        'size_x': preview_size,
+        'size_y': preview_size,
+        'pixel_type': 'uint16',
+        'content_hash': hashlib.sha256(image_id.encode('utf-8')).hexdigest(),
+    }
+
+
+def _score_row(rng, detection_id, user_id, base_grade, now):
+    # Uzmanlar çoğunlukla aynı notu verir; konsensüs ve kappa hesapları anlamlı kalır
+    grade = base_grade if rng.random() < 0.7 else rng.choice(GRADES)
+    row = {'detection_id': detection_id, 'user_id': user_id, 'grade': grade, 'timestamp': now}
+    for criterion in CRITERIA:
+        row[f'score_{criterion}'] = rng.randint(1, 5)
+    return row
+
+
+def write_previews(preview_folder, image_ids, preview_size, seed=0):
+    """
+    Tek bir sentetik önizleme yazar ve diğer görüntülere sabit bağlantı (olmazsa kopya) olarak verir.
+    Dosya adları farklı olduğu için kırpma deposu anahtarları da görüntü başına farklıdır.
+    """
+    channels = synthetic_channels(preview_size, 3, seed=seed)
+    rgb = np.stack([(plane >> 4).astype(np.uint8) for plane in channels], axis=2)
+    source = os.path.join(preview_folder, '_bench_source.png')
+    PILImage.fromarray(rgb, 'RGB').save(source, compress_level=1)
+    for image_id in image_ids:
+        target = os.path.join(preview_folder, f'{image_id}.png')
+        if os.path.exists(target):
+            continue
+        try:
+            os.link(source, target)
+        except OSError:
+            shutil.copy2(source, target)
+    os.remove(source)
+
+
+def seed_database(app_module, images=10000, detections_per_image=20, experts=5, preview_size=1024,
+                  chunk_images=500, seed=0, log=print):
+    """
+    Boş veritabanını güncel şemayla oluşturur ve toplu INSERT ile doldurur.
+
+    Her uzman her tespiti puanlar (images * detections_per_image * experts puan); her görüntü
+    iki uzmana atanır ve yükleyicisi uzmanlar arasında sırayla dağıtılır. Konsensüs satırları
+    üretilen puanlardan doğrudan hesaplanır (ek sorgu yok). Dönüş: {kullanıcı adı: id}
+    """
+    from models import (
+        db, User, Image, Detection, Score, ImageAssignment, DetectionConsensus, ImageConsensus
+    )
+    from migrations import migrate
+    from consensus import consensus_records
+
+    app = app_module.app
+    rng = random.Random(seed)
+    started = time.perf_counter()
+    with app.app_context():
+        migrate(db.engine, backup=False, log=lambda message: None)
+        password = app_module.bcrypt.generate_password_hash(PASSWORD).decode('utf-8')
+        db.session.add(User(username=ADMIN_USERNAME, password=password, role='admin'))
+        for index in range(experts):
+            db.session.add(User(username=f'bench_uzman{index}', password=password, role='uzman'))
+        db.session.commit()
+        user_ids = {user.username: user.id for user in User.query.all()}
+        expert_ids = [user_ids[f'bench_uzman{index}'] for index in range(experts)]
+
+        now = datetime.utcnow()
+        boxes = grid_boxes(preview_size, preview_size, detections_per_image)
+        points = [[[int(x1), int(y1)], [int(x2), int(y2)]] for x1, y1, x2, y2, _ in boxes]
+        for start in range(0, images, chunk_images):
+            image_rows, detection_rows, score_rows, assignment_rows = [], [], [], []
+            detection_consensus_rows, image_consensus_rows = [], []
+            for index in range(start, min(start + chunk_images, images)):
+                image_id = image_id_for(index)
+                image_rows.append(_image_row(
+                    index, expert_ids[index % experts], detections_per_image, preview_size, now
+                ))
+                for offset in range(2 if experts > 1 else 1):
+                    assignment_rows.append({'image_id': image_id, 'expert_id': expert_ids[(index + offset) % experts]})
+                image_scores = []
+                for number, box_points in enumerate(points, start=1):
+                    detection_id = f'{image_id}_{number}'
+                    detection_rows.append({
+                        'id': detection_id, 'parent_image_id': image_id,
+                        'coordinates_labelme': {'shape_type': 'rectangle', 'points': box_points},
+                    })
+                    base_grade = rng.choice(GRADES)
+                    for user_id in expert_ids:
+                        image_scores.append(_score_row(rng, detection_id, user_id, base_grade, now))
+                score_rows.extend(image_scores)
+                records, image_record = consensus_records(image_id, [
+                    (row['detection_id'], row['user_id'], row['grade'], row['score_sitoplazma'],
+                     row['score_zona'], row['score_kumulus'], row['score_oopla'])
+                    for row in image_scores
+                ], now)
+                detection_consensus_rows.extend(records)
+                if image_record is not None:
+                    image_consensus_rows.append(image_record)
+
+            db.session.execute(Image.__table__.insert(), image_rows)
+            db.session.execute(Detection.__table__.insert(), detection_rows)
+            if score_rows:
+                db.session.execute(Score.__table__.insert(), score_rows)
+            db.session.execute(ImageAssignment.__table__.insert(), assignment_rows)
+            if detection_consensus_rows:
+                db.session.execute(DetectionConsensus.__table__.insert(), detection_consensus_rows)
+                db.session.execute(ImageConsensus.__table__.insert(), image_consensus_rows)
+            db.session.commit()
+            log(f"  {min(start + chunk_images, images)}/{images} görüntü yazıldı "
+                f"({time.perf_counter() - started:.0f} sn)")
+        db.session.execute(db.text('ANALYZE'))
+        db.session.commit()
+
+    write_previews(app.config['PREVIEW_FOLDER'], [image_id_for(index) for index in range(images)], preview_size, seed)
+    return user_ids
@@ -0,0 +1,268 @@
+# consensus.py
+from collections import namedtuple
+from datetime import datetime
+from itertools import combinations
+
+import numpy as np
+
+from models import db, Detection, Score, DetectionConsensus, ImageConsensus
+
+
+GRADES = ['A', 'B', 'C', 'D']
+CRITERIA = ['sitoplazma', 'zona', 'kumulus', 'oopla']
+CRITERION_LEVELS = 5        # 1-5 arası puanlar 0-4 kodlarına çevrilir
+MISSING = -1
+
+# Sınıflandırma veri setinde uzman puanı yerine kullanılan konsensüs etiketi
+# (dataset_export'un beklediği puan nesnesiyle aynı alanlar)
+ConsensusLabel = namedtuple('ConsensusLabel', [
+    'user_id', 'grade', 'score_sitoplazma', 'score_zona', 'score_kumulus', 'score_oopla'
+])
+CONSENSUS_RATER = 'konsensus'
+
+
+# --- Vektörel Hesaplama (satır: tespit, sütun: uzman, değer: kategori kodu ya da -1) ---
+def category_counts(codes, n_categories):
+    """Her tespit için kategori başına oy sayıları: (tespit sayısı, kategori sayısı)."""
+    n_items = codes.shape[0]
+    valid = codes >= 0
+    flat = np.nonzero(valid)[0] * n_categories + codes[valid]
+    return np.bincount(flat, minlength=n_items * n_categories).reshape(n_items, n_categories)
+
+
+def lower_median(counts):
+    """Oy sayılarından alt medyan kategori; oy yoksa -1."""
+    n = counts.sum(axis=1)
+    cumulative = counts.cumsum(axis=1)
+    median = np.argmax(cumulative >= ((n + 1) // 2)[:, None], axis=1)
+    return np.where(n > 0, median, MISSING)
+
+
+def majority(counts):
+    """
+    Çoğunluk kategorisi ve ona oy veren uzman oranı. Eşitlikte sadece en çok oy alan
+    kategoriler arasından alt medyan seçilir (A:2, B:1, D:2 -> A, oran 0.4).
+    """
+    n = counts.sum(axis=1)
+    top = counts.max(axis=1)
+    # Tek mod varsa alt medyanı kendisidir; eşitlikte her mod tek oy sayılır
+    modes = (counts == top[:, None]).astype(counts.dtype)
+    winner = lower_median(modes)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        agreement = top / n
+    return np.where(n > 0, winner, MISSING), agreement
+
+
+def mean_std(codes):
+    """Kodlanmış puanların satır bazında ortalaması ve (popülasyon) standart sapması; puan yoksa NaN."""
+    valid = codes >= 0
+    count = valid.sum(axis=1)
+    values = np.where(valid, codes, 0).astype(np.float64)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = values.sum(axis=1) / count
+        variance = (np.where(valid, values - mean[:, None], 0.0) ** 2).sum(axis=1) / count
+    return mean, np.sqrt(variance)
+
+
+def fleiss_kappa(counts):
+    """
+    Değişken sayıda puanlayıcıya izin veren Fleiss kappası (en az iki uzmanın puanladığı tespitler).
+    Beklenen uyum 1 ise (herkes hep aynı kategoriyi seçmiş) kappa tanımsızdır: None.
+    """
+    n = counts.sum(axis=1)
+    rated = n >= 2
+    if not rated.any():
+        return None
+    counts, n = counts[rated], n[rated]
+    observed = ((counts * (counts - 1)).sum(axis=1) / (n * (n - 1))).mean()
+    proportions = counts.sum(axis=0) / n.sum()
+    expected = (proportions ** 2).sum()
+    if expected >= 1:
+        return None
+    return float((observed - expected) / (1 - expected))
+
+
+def cohen_kappa(first, second, n_categories):
+    """İki uzmanın ortak puanladığı tespitler üzerinde Cohen kappası."""
+    confusion = np.bincount(first * n_categories + second, minlength=n_categories * n_categories)
+    confusion = confusion.reshape(n_categories, n_categories) / len(first)
+    observed = np.trace(confusion)
+    expected = confusion.sum(axis=1) @ confusion.sum(axis=0)
+    if expected >= 1:
+        return None
+    return float((observed - expected) / (1 - expected))
+
+
+def pairwise_cohen_kappa(codes, n_categories, rater_ids):
+    """Ortak en az iki tespit puanlamış her uzman çifti için Cohen kappası ve ortalaması."""
+    pairs = {}
+    for a, b in combinations(range(codes.shape[1]), 2):
+        both = (codes[:, a] >= 0) & (codes[:, b] >= 0)
+        if both.sum() < 2:
+            continue
+        pairs[f"{rater_ids[a]}-{rater_ids[b]}"] = cohen_kappa(codes[both, a], codes[both, b], n_categories)
+    defined = [kappa for kappa in pairs.values() if kappa is not None]
+    return pairs, (float(np.mean(defined)) if defined else None)
+
+
+def _optional(value, cast=float):
+    return None if value is None or (isinstance(value, float) and np.isnan(value)) or value < 0 else cast(value)
+
+
+def compute_consensus(rows):
+    """
+    rows: (detection_id, user_id, grade, sitoplazma, zona, kumulus, oopla) — bir görüntünün puanları.
+    Dönüş: ({tespit_id: tespit konsensüsü}, görüntü özet sözlüğü) ya da puan yoksa ({}, None).
+    """
+    if not rows:
+        return {}, None
+    detection_ids = sorted({row[0] for row in rows})
+    rater_ids = sorted({row[1] for row in rows})
+    item_index = {detection_id: i for i, detection_id in enumerate(detection_ids)}
+    rater_index = {user_id: j for j, user_id in enumerate(rater_ids)}
+
+    # Kategori kodu matrisleri: [genel not, sitoplazma, zona, kumulus, oopla]
+    codes = np.full((1 + len(CRITERIA), len(detection_ids), len(rater_ids)), MISSING, dtype=np.int64)
+    for detection_id, user_id, grade, *criteria in rows:
+        i, j = item_index[detection_id], rater_index[user_id]
+        if grade in GRADES:
+            codes[0, i, j] = GRADES.index(grade)
+        for k, value in enumerate(criteria, start=1):
+            if isinstance(value, int) and 1 <= value <= CRITERION_LEVELS:
+                codes[k, i, j] = value - 1
+
+    grade_counts = category_counts(codes[0], len(GRADES))
+    grade_majority, grade_agreement = majority(grade_counts)
+    grade_median = lower_median(grade_counts)
+    rater_counts = (codes >= 0).any(axis=0).sum(axis=1)
+
+    detections = {
+        detection_id: {
+            'rater_count': int(rater_counts[i]),
+            'grade_majority': GRADES[grade_majority[i]] if grade_majority[i] >= 0 else None,
+            'grade_median': GRADES[grade_median[i]] if grade_median[i] >= 0 else None,
+            'grade_agreement': _optional(grade_agreement[i]),
+        }
+        for i, detection_id in enumerate(detection_ids)
+    }
+    grade_pairs, grade_cohen = pairwise_cohen_kappa(codes[0], len(GRADES), rater_ids)
+    agreement = {
+        'grade': {'fleiss_kappa': fleiss_kappa(grade_counts), 'cohen_kappa': grade_cohen, 'pairs': grade_pairs}
+    }
+
+    for k, criterion in enumerate(CRITERIA, start=1):
+        counts = category_counts(codes[k], CRITERION_LEVELS)
+        mean, std = mean_std(codes[k])
+        median = lower_median(counts)
+        for i, detection_id in enumerate(detection_ids):
+            detections[detection_id][f'{criterion}_mean'] = _optional(mean[i] + 1)
+            detections[detection_id][f'{criterion}_std'] = _optional(std[i])
+            detections[detection_id][f'{criterion}_median'] = _optional(median[i] + 1 if median[i] >= 0 else -1, int)
+        pairs, cohen = pairwise_cohen_kappa(codes[k], CRITERION_LEVELS, rater_ids)
+        agreement[criterion] = {'fleiss_kappa': fleiss_kappa(counts), 'cohen_kappa': cohen, 'pairs': pairs}
+
+    image = {
+        'scored_detections': len(detection_ids),
+        'rater_count': len(rater_ids),
+        'fleiss_kappa': agreement['grade']['fleiss_kappa'],
+        'cohen_kappa': agreement['grade']['cohen_kappa'],
+        'agreement_json': agreement,
+    }
+    return detections, image
+
+
+# --- Veritabanı (commit çağırana aittir) ---
+def image_score_rows(image_id):
+    # Silinmiş uzmanların (user_id NULL) puanları uzman kimliği olmadığı için hesaba katılmaz
+    return db.session.query(
+        Score.detection_id, Score.user_id, Score.grade,
+        Score.score_sitoplazma, Score.score_zona, Score.score_kumulus, Score.score_oopla
+    ).join(
+        Detection, Score.detection_id == Detection.id
+    ).filter(
+        Detection.parent_image_id == image_id, Score.user_id.isnot(None)
+    ).all()
+
+
+def clear_image_consensus(image_id):
+    DetectionConsensus.query.filter_by(image_id=image_id).delete(synchronize_session=False)
+    ImageConsensus.query.filter_by(image_id=image_id).delete(synchronize_session=False)
+
+
+def consensus_records(image_id, rows, now):
+    """compute_consensus sonucunu tablo satırlarına çevirir: ([tespit satırları], görüntü satırı veya None)."""
+    detections, image = compute_consensus(rows)
+    if image is None:
+        return [], None
+    detection_records = [
+        dict(values, detection_id=detection_id, image_id=image_id, updated_at=now)
+        for detection_id, values in detections.items()
+    ]
+    return detection_records, dict(image, image_id=image_id, updated_at=now)
+
+
+def refresh_image_consensus(image_ids):
+    """Verilen görüntülerin konsensüs satırlarını puanlardan yeniden üretir."""
+    now = datetime.utcnow()
+    for image_id in dict.fromkeys(image_ids):
+        clear_image_consensus(image_id)
+        detection_records, image_record = consensus_records(
+            image_id, [tuple(row) for row in image_score_rows(image_id)], now
+        )
+        if image_record is None:
+            continue
+        db.session.execute(DetectionConsensus.__table__.insert(), detection_records)
+        db.session.execute(ImageConsensus.__table__.insert(), [image_record])
+
+
+def image_ids_for_detections(detection_ids):
+    if not detection_ids:
+        return []
+    return [row[0] for row in db.session.query(Detection.parent_image_id)
+            .filter(Detection.id.in_(list(detection_ids))).distinct().all()]
+
+
+def image_ids_scored_by(user_id):
+    return [row[0] for row in db.session.query(Detection.parent_image_id)
+            .join(Score, Score.detection_id == Detection.id)
+            .filter(Score.user_id == user_id).distinct().all()]
+
+
+def detection_consensus_to_dict(row):
+    result = {
+        'detection_id': row.detection_id,
+        'rater_count': row.rater_count,
+        'grade_majority': row.grade_majority,
+        'grade_median': row.grade_median,
+        'grade_agreement': row.grade_agreement,
+    }
+    for criterion in CRITERIA:
+        result[criterion] = {
+            'mean': getattr(row, f'{criterion}_mean'),
+            'std': getattr(row, f'{criterion}_std'),
+            'median': getattr(row, f'{criterion}_median'),
+        }
+    return result
+
+
+def image_consensus_to_dict(image_id):
+    summary = db.session.get(ImageConsensus, image_id)
+    detections = DetectionConsensus.query.filter_by(image_id=image_id).order_by(DetectionConsensus.detection_id).all()
+    return {
+        'image_id': image_id,
+        'scored_detections': summary.scored_detections if summary else 0,
+        'rater_count': summary.rater_count if summary else 0,
+        'fleiss_kappa': summary.fleiss_kappa if summary else None,
+        'cohen_kappa': summary.cohen_kappa if summary else None,
+        'agreement': summary.agreement_json if summary else {},
+        'updated_at': summary.updated_at.isoformat() if summary and summary.updated_at else None,
+        'detections': [detection_consensus_to_dict(row) for row in detections],
+    }
+
+
+def consensus_label(row):
+    """Konsensüs satırını veri seti etiketine çevirir (not: çoğunluk, kriterler: alt medyan)."""
+    return ConsensusLabel(
+        CONSENSUS_RATER, row.grade_majority,
+        row.sitoplazma_median, row.zona_median, row.kumulus_median, row.oopla_median
+    )
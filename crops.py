@@ -0,0 +1,107 @@
+# crops.py
+import hashlib
+import json
+import os
+import shutil
+import threading
+from collections import OrderedDict
+
+from PIL import Image as PILImage
+
+
+class PreviewCache:
+    """
+    Çözülmüş (decode edilmiş) önizlemeleri tutan, bayt sınırlı LRU önbellek.
+
+    Anahtar (dosya yolu, değişiklik zamanı) olduğu için dosya yeniden yazılırsa eski
+    kopya kullanılmaz. Kırpma önbelleğinde bulunmayan tespitler için aynı önizlemenin
+    tekrar tekrar açılıp çözülmesini engeller.
+    """
+
+    def __init__(self, max_bytes=512 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._items = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _image_bytes(pil_img):
+        return pil_img.width * pil_img.height * len(pil_img.getbands())
+
+    def get(self, path):
+        key = (path, os.stat(path).st_mtime_ns)
+        with self._lock:
+            pil_img = self._items.get(key)
+            if pil_img is not None:
+                self._items.move_to_end(key)
+                self.hits += 1
+                return pil_img
+            self.misses += 1
+
+        with PILImage.open(path) as opened:
+            opened.load()
+            pil_img = opened.copy()
+
+        size = self._image_bytes(pil_img)
+        with self._lock:
+            if key not in self._items and size <= self.max_bytes:
+                self._items[key] = pil_img
+                self._bytes += size
+                while self._bytes > self.max_bytes:
+                    _, evicted = self._items.popitem(last=False)
+                    self._bytes -= self._image_bytes(evicted)
+        return pil_img
+
+
+preview_cache = PreviewCache()
+
+
+def crop_box(coordinates_labelme):
+    """LabelMe dikdörtgen noktalarını (x1, y1, x2, y2) tam sayı kutusuna çevirir."""
+    coords = coordinates_labelme['points']
+    x1, y1 = int(coords[0][0]), int(coords[0][1])
+    x2, y2 = int(coords[1][0]), int(coords[1][1])
+    return (min(x1, x2), min(y1, y2), max(x1, x2), max(y1, y2))
+
+
+def crop_version(coordinates_labelme):
+    """Koordinatlardan türetilen kısa sürüm etiketi (kırpma URL'lerinde önbellek kırıcı)."""
+    payload = json.dumps(coordinates_labelme['points'], separators=(',', ':'))
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()[:10]
+
+
+def crop_path(crop_folder, image_id, detection_id):
+    return os.path.join(crop_folder, image_id, f"{detection_id}.png")
+
+
+def save_crop(base_img, crop_folder, image_id, detection_id, coordinates_labelme):
+    path = crop_path(crop_folder, image_id, detection_id)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    base_img.crop(crop_box(coordinates_labelme)).save(path, 'PNG')
+    return path
+
+
+def save_detection_crops(base_img, crop_folder, image_id, detections):
+    """Yükleme sırasında tüm tespitlerin kırpılmış görüntülerini tek seferde üretir."""
+    for det in detections:
+        save_crop(base_img, crop_folder, image_id, det['id'], det['coordinates_labelme'])
+
+
+def ensure_detection_crop(crop_folder, preview_full_path, image_id, detection_id, coordinates_labelme):
+    """Kırpma dosyası yoksa önizlemeyi (LRU önbellekten) kullanarak üretir ve yolunu döndürür."""
+    path = crop_path(crop_folder, image_id, detection_id)
+    if not os.path.exists(path):
+        save_crop(preview_cache.get(preview_full_path), crop_folder, image_id, detection_id, coordinates_labelme)
+    return path
+
+
+def remove_detection_crop(crop_folder, image_id, detection_id):
+    path = crop_path(crop_folder, image_id, detection_id)
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def remove_image_crops(crop_folder, image_id):
+    shutil.rmtree(os.path.join(crop_folder, image_id), ignore_errors=True)
@@ -0,0 +1,196 @@
+# czi_metadata.py
+import logging
+import struct
+import xml.etree.ElementTree as ET
+from datetime import date
+
+logger = logging.getLogger(__name__)
+
+
+# CZI dosyası segmentlerden oluşur; her segment 32 baytlık bir başlıkla (16 bayt kimlik,
+# ayrılan boyut, kullanılan boyut) başlar. Dosya başındaki ZISRAWFILE segmenti metadata
+# segmentinin (ZISRAWMETADATA) konumunu tutar; XML o segmentte 256 baytlık başlıktan sonra
+# gelir. Böylece piksel verisine dokunmadan sadece birkaç KB okunarak metadata alınır.
+SEGMENT_HEADER = struct.Struct('<16sqq')      # kimlik, ayrılan boyut, kullanılan boyut
+FILE_HEADER = struct.Struct('<iiii16s16siqqiq')  # ZISRAWFILE segment verisi
+METADATA_HEADER = struct.Struct('<ii')          # XML boyutu, ek boyutu (+248 bayt boşluk)
+METADATA_HEADER_SIZE = 256
+MAX_XML_BYTES = 64 * 1024 * 1024
+
+
+class CziMetadataError(ValueError):
+    """Dosya geçerli bir CZI değil ya da metadata segmenti okunamadı."""
+
+
+def get_objective_name_from_xml(xml_root):
+    """
+    AICSImage metadata (XML root) içinden objektif adını bulmaya çalışır.
+    """
+    if xml_root is None: return "Bilinmiyor"
+    try:
+        # Zeiss XML'inde objektif adı için en yaygın yolu dene
+        objective_node = xml_root.find(".//{*}Information/{*}Instrument/{*}Objectives/{*}Objective")
+        if objective_node is not None and 'Name' in objective_node.attrib:
+            return objective_node.attrib['Name'] # örn: "Plan-Apochromat 20x/0.8"
+
+        objective_node = xml_root.find(".//{*}Objective")
+        if objective_node is not None and 'Name' in objective_node.attrib:
+            return objective_node.attrib['Name']
+        return "Bilinmiyor"
+    except Exception as e:
+        logger.warning("Objektif XML okuma hatası: %s", e)
+        return "XML Hatası"
+
+# === YENİ: Çekim Tarihini XML'den Okuma Fonksiyonu ===
+def get_acquisition_date_from_xml(xml_root):
+    """
+    AICSImage metadata (XML root) içinden çekim tarihini bulmaya çalışır.
+    """
+    if xml_root is None: return "Bilinmiyor"
+    try:
+        # Zeiss XML'inde en yaygın yolu dene
+        # Yol: .../Metadata/Information/Image/AcquisitionDateAndTime
+        date_node = xml_root.find(".//{*}Information/{*}Image/{*}AcquisitionDateAndTime")
+        if date_node is not None:
+            # Tarihi (örn: "2025-11-15T20:30:00.000") al ve sadece tarih kısmını (T'den öncesi) döndür
+            return date_node.text.split('T')[0]
+
+        # Başka bir yaygın yolu dene
+        date_node = xml_root.find(".//{*}AcquisitionDateAndTime")
+        if date_node is not None:
+            return date_node.text.split('T')[0]
+
+        return "Bilinmiyor"
+    except Exception as e:
+        logger.warning("Çekim Tarihi XML okuma hatası: %s", e)
+        return "XML Hatası"
+
+
+def _read_segment_header(f, position, expected_id):
+    f.seek(position)
+    raw = f.read(SEGMENT_HEADER.size)
+    if len(raw) < SEGMENT_HEADER.size:
+        raise CziMetadataError(f"{expected_id} segmenti okunamadı (dosya kısa).")
+    segment_id, allocated_size, used_size = SEGMENT_HEADER.unpack(raw)
+    if segment_id.rstrip(b'\0').decode('ascii', 'replace') != expected_id:
+        raise CziMetadataError(f"{position} konumunda {expected_id} segmenti beklenirken başka bir segment bulundu.")
+    return allocated_size, used_size
+
+
+def read_czi_xml(czi_path):
+    """Sadece dosya başlığını ve metadata segmentini okuyarak XML kökünü döndürür."""
+    with open(czi_path, 'rb') as f:
+        _read_segment_header(f, 0, 'ZISRAWFILE')
+        raw = f.read(FILE_HEADER.size)
+        if len(raw) < FILE_HEADER.size:
+            raise CziMetadataError('ZISRAWFILE başlığı eksik.')
+        metadata_position = FILE_HEADER.unpack(raw)[8]
+        if metadata_position <= 0:
+            raise CziMetadataError('Dosyada metadata segmenti yok.')
+
+        _read_segment_header(f, metadata_position, 'ZISRAWMETADATA')
+        xml_size, _ = METADATA_HEADER.unpack(f.read(METADATA_HEADER.size))
+        if not 0 < xml_size <= MAX_XML_BYTES:
+            raise CziMetadataError(f"Geçersiz metadata XML boyutu: {xml_size}")
+        f.seek(metadata_position + SEGMENT_HEADER.size + METADATA_HEADER_SIZE)
+        xml_bytes = f.read(xml_size)
+    try:
+        return ET.fromstring(xml_bytes.rstrip(b'\0'))
+    except ET.ParseError as e:
+        raise CziMetadataError(f"Metadata XML'i çözümlenemedi: {e}")
+
+
+def _int_text(xml_root, path):
+    node = xml_root.find(path)
+    try:
+        return int(node.text) if node is not None and node.text else None
+    except ValueError:
+        return None
+
+
+def scale_um_from_xml(xml_root):
+    """Metadata/Scaling/Items/Distance[Id=X]/Value (metre) -> µm/piksel."""
+    for distance in xml_root.iterfind(".//{*}Scaling/{*}Items/{*}Distance"):
+        if distance.attrib.get('Id') == 'X':
+            value = distance.find('{*}Value')
+            try:
+                return float(value.text) * 1_000_000 if value is not None and value.text else None
+            except ValueError:
+                return None
+    return None
+
+
+def channel_names_from_xml(xml_root):
+    channels = xml_root.find(".//{*}Information/{*}Image/{*}Dimensions/{*}Channels")
+    if channels is None:
+        return []
+    return [channel.attrib.get('Name') or channel.attrib.get('Id') or '' for channel in channels.iterfind('{*}Channel')]
+
+
+def parse_acquisition_date(value):
+    """'YYYY-AA-GG' metnini date'e çevirir; 'Bilinmiyor' gibi değerler için None."""
+    try:
+        return date.fromisoformat(value) if value else None
+    except (TypeError, ValueError):
+        return None
+
+
+def metadata_from_xml(xml_root):
+    """Listeleme/katalog sütunlarına yazılacak alanlar (bulunamayanlar None)."""
+    channel_names = channel_names_from_xml(xml_root)
+    size_c = _int_text(xml_root, ".//{*}Information/{*}Image/{*}SizeC")
+    pixel_type = xml_root.find(".//{*}Information/{*}Image/{*}PixelType")
+    objective_name = get_objective_name_from_xml(xml_root)
+    return {
+        'objective_name': None if objective_name in ('Bilinmiyor', 'XML Hatası') else objective_name,
+        'acquisition_date': parse_acquisition_date(get_acquisition_date_from_xml(xml_root)),
+        'scale_um_per_pixel': scale_um_from_xml(xml_root),
+        'channel_count': size_c or (len(channel_names) or None),
+        'channel_names': channel_names,
+        'size_x': _int_text(xml_root, ".//{*}Information/{*}Image/{*}SizeX"),
+        'size_y': _int_text(xml_root, ".//{*}Information/{*}Image/{*}SizeY"),
+        'pixel_type': pixel_type.text if pixel_type is not None else None,
+    }
+
+
+def read_czi_metadata(czi_path):
+    """Piksel verisi okumadan .czi metadata alanlarını döndürür."""
+    return metadata_from_xml(read_czi_xml(czi_path))
+
+
+def metadata_from_json(metadata_json):
+    """Başlığı okunamayan (dosyası silinmiş vb.) görüntüler için kayıtlı JSON'dan aynı alanlar."""
+    metadata_json = metadata_json or {}
+    channel_names = metadata_json.get('channel_names') or []
+    objective_name = metadata_json.get('objective_name')
+    return {
+        'objective_name': None if objective_name in (None, 'Bilinmiyor', 'XML Hatası') else objective_name,
+        'acquisition_date': parse_acquisition_date(metadata_json.get('acquisition_date')),
+        'scale_um_per_pixel': metadata_json.get('original_scale_um_per_pixel', metadata_json.get('scale_um_per_pixel')),
+        'channel_count': len(channel_names) or None,
+        'channel_names': channel_names,
+        'size_x': None,
+        'size_y': None,
+        'pixel_type': None,
+    }
+
+
+INDEXED_FIELDS = [
+    'objective_name', 'acquisition_date', 'scale_um_per_pixel', 'channel_count', 'size_x', 'size_y', 'pixel_type'
+]
+
+
+def apply_metadata_columns(image, fields):
+    """Okunan alanları görüntünün sorgulanabilir sütunlarına yazar."""
+    for name in INDEXED_FIELDS:
+        setattr(image, name, fields.get(name))
+
+
+def index_image_metadata(image):
+    """Önce dosya başlığını, olmazsa kayıtlı JSON'u kullanarak sütunları doldurur. Dönüş: kaynak."""
+    try:
+        apply_metadata_columns(image, read_czi_metadata(image.file_path))
+        return 'header'
+    except (OSError, CziMetadataError):
+        apply_metadata_columns(image, metadata_from_json(image.metadata_json))
+        return 'json'
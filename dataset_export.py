@@ -0,0 +1,370 @@
+# dataset_export.py
+import csv
+import hashlib
+import io
+import json
+import os
+import zipfile
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+from PIL import Image as PILImage
+
+from crops import crop_box
+
+
+CROP_SIZE = 512
+PAD_COLOR = (0, 0, 0)
+CROP_RENDER_VERSION = 1  # Kırpma/padding algoritması değişirse artırılır; eski kayıtlar geçersiz olur
+LABEL_COLUMNS = [
+    'dosya_adi',
+    'genel_puan', # A, B, C, D
+    'sitoplazma', # 1-5
+    'zona',       # 1-5
+    'kumulus',    # 1-5
+    'oopla'       # 1-5
+]
+
+
+# --- Kırpma + 512x512 Padding (işçi süreçlerde çalışır) ---
+def render_padded_crop(base_img, coordinates_labelme, size=CROP_SIZE):
+    """Oositi kırpar, en-boy oranını koruyarak küçültür ve siyah kare arka plana ortalar (PNG bayt)."""
+    cropped_img = base_img.crop(crop_box(coordinates_labelme))
+    # LANCZOS en yüksek kaliteli yeniden örnekleme filtresidir
+    cropped_img.thumbnail((size, size), PILImage.Resampling.LANCZOS)
+    padded_img = PILImage.new("RGB", (size, size), PAD_COLOR)
+    paste_x = (size - cropped_img.width) // 2
+    paste_y = (size - cropped_img.height) // 2
+    padded_img.paste(cropped_img.convert("RGB"), (paste_x, paste_y))
+    img_io = io.BytesIO()
+    padded_img.save(img_io, 'PNG')
+    return img_io.getvalue()
+
+
+def render_image_crops(task):
+    """
+    Bir önizlemeye ait kırpmaları işler; önizleme sadece bir kez açılıp çözülür.
+    task = (önizleme yolu, [(tespit_id, koordinatlar, depo yolu veya None), ...])
+    Depo yolu verilmişse üretilen PNG oraya da yazılır (bir sonraki dışa aktarımda yeniden kullanılır).
+    Dönüş: [(tespit_id, png_bayt veya None, hata mesajı veya None), ...]
+    """
+    preview_full_path, detections = task
+    results = []
+    try:
+        with PILImage.open(preview_full_path) as base_img:
+            base_img.load()
+            for detection_id, coordinates_labelme, store_path in detections:
+                try:
+                    png_bytes = render_padded_crop(base_img, coordinates_labelme)
+                    if store_path:
+                        CropStore.write_atomic(store_path, png_bytes)
+                    results.append((detection_id, png_bytes, None))
+                except Exception as e:
+                    results.append((detection_id, None, str(e)))
+    except Exception as e:
+        results = [(detection_id, None, str(e)) for detection_id, _, _ in detections]
+    return results
+
+
+# --- İçerik adresli kırpma deposu ---
+def training_crop_key(preview_full_path, coordinates_labelme, size=CROP_SIZE):
+    """Kırpmanın içeriğini belirleyen her şeyden türetilen SHA-1 anahtarı."""
+    stat = os.stat(preview_full_path)
+    payload = json.dumps({
+        'preview': os.path.basename(preview_full_path),
+        'mtime_ns': stat.st_mtime_ns,
+        'bytes': stat.st_size,
+        'box': crop_box(coordinates_labelme),
+        'size': size,
+        'pad': PAD_COLOR,
+        'version': CROP_RENDER_VERSION,
+    }, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+class CropStore:
+    """
+    512x512 eğitim kırpmalarının kalıcı, içerik adresli disk deposu.
+
+    Anahtar; önizleme kimliği (dosya adı + değişiklik zamanı + boyut), tespit kutusu ve
+    padding parametrelerinden türetilir. Koordinatlar ya da önizleme değişirse anahtar da
+    değişir; değişmeyen kırpmalar bir sonraki dışa aktarımda diskten okunur.
+    Dosyalar `<root>/<anahtarın ilk 2 karakteri>/<anahtar>.png` olarak tutulur.
+    """
+
+    def __init__(self, root, size=CROP_SIZE):
+        self.root = root
+        self.size = size
+
+    def key(self, preview_full_path, coordinates_labelme):
+        return training_crop_key(preview_full_path, coordinates_labelme, self.size)
+
+    def path(self, key):
+        return os.path.join(self.root, key[:2], f"{key}.png")
+
+    def contains(self, key):
+        return os.path.exists(self.path(key))
+
+    def get(self, key):
+        try:
+            with open(self.path(key), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    @staticmethod
+    def write_atomic(path, data):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def prune(self, keep_keys):
+        """`keep_keys` dışındaki tüm kırpmaları siler; silinen dosya sayısını döndürür."""
+        keep_keys = set(keep_keys)
+        removed = 0
+        if not os.path.isdir(self.root):
+            return removed
+        for dirpath, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                if filename.endswith('.png') and filename[:-4] not in keep_keys:
+                    os.remove(os.path.join(dirpath, filename))
+                    removed += 1
+        return removed
+
+
+# --- Dışa aktarım manifestleri ---
+def sample_key(detection_id, user_id):
+    """Bir eğitim örneğinin dışa aktarımlar arasında sabit kimliği (tespit + puanlayan uzman)."""
+    return f"{detection_id}_u{user_id}"
+
+
+def list_manifests(manifest_folder):
+    """Kayıtlı manifest kimliklerini eskiden yeniye döndürür."""
+    if not manifest_folder or not os.path.isdir(manifest_folder):
+        return []
+    return sorted(f[:-5] for f in os.listdir(manifest_folder) if f.endswith('.json'))
+
+
+def load_manifest(manifest_folder, export_id):
+    """`export_id` için kayıtlı manifesti yükler; 'latest' en son dışa aktarımı seçer."""
+    if export_id == 'latest':
+        manifests = list_manifests(manifest_folder)
+        if not manifests:
+            return None
+        export_id = manifests[-1]
+    path = os.path.join(manifest_folder, f"{os.path.basename(export_id)}.json")
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def diff_manifests(previous, current):
+    """
+    İki manifest arasındaki farkı çıkarır: eklenen, değişen (kırpma veya etiket) ve
+    kaldırılan örnekler. Her liste örnek anahtarlarına göre sıralıdır.
+    """
+    old_samples = previous.get('samples', {}) if previous else {}
+    new_samples = current['samples']
+    added = sorted(k for k in new_samples if k not in old_samples)
+    removed = sorted(k for k in old_samples if k not in new_samples)
+    changed = sorted(
+        k for k in new_samples
+        if k in old_samples and (
+            new_samples[k]['crop_key'] != old_samples[k]['crop_key']
+            or new_samples[k]['labels'] != old_samples[k]['labels']
+        )
+    )
+    return {
+        'since': previous.get('export_id') if previous else None,
+        'export_id': current['export_id'],
+        'added': added,
+        'changed': changed,
+        'removed': removed,
+    }
+
+
+def save_manifest(manifest_folder, manifest):
+    path = os.path.join(manifest_folder, f"{manifest['export_id']}.json")
+    CropStore.write_atomic(path, json.dumps(manifest, ensure_ascii=False, indent=1).encode('utf-8'))
+    return path
+
+
+# --- Akışlı (streaming) ZIP ---
+class _ZipStream:
+    """
+    zipfile'ın yazdığı baytları biriktiren, geri sarılamayan (unseekable) dosya nesnesi.
+    `seek` olmadığı için zipfile yerel başlıklarını veri tanımlayıcılarıyla yazar ve
+    arşiv parça parça istemciye gönderilebilir.
+    """
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._position = 0
+
+    def write(self, data):
+        self._buffer += data
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def take(self):
+        chunk = bytes(self._buffer)
+        self._buffer.clear()
+        return chunk
+
+
+def _bounded_map(executor, fn, tasks, window):
+    """executor.map gibi sıralı sonuç verir; ama aynı anda en fazla `window` iş bekletir."""
+    pending = deque()
+    for task in tasks:
+        pending.append(executor.submit(fn, task))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def group_scored_items(rows):
+    """
+    (score, detection_id, coordinates, image_id, preview_full_path) satırlarını
+    önizleme bazında gruplar: {önizleme yolu: {tespit_id: (koordinatlar, [score, ...])}}
+    """
+    grouped = OrderedDict()
+    for score, detection_id, coordinates_labelme, image_id, preview_full_path in rows:
+        detections = grouped.setdefault(preview_full_path, OrderedDict())
+        detections.setdefault(detection_id, (coordinates_labelme, []))[1].append(score)
+    return grouped
+
+
+def score_labels(score):
+    return {
+        'genel_puan': score.grade,
+        'sitoplazma': score.score_sitoplazma,
+        'zona': score.score_zona,
+        'kumulus': score.score_kumulus,
+        'oopla': score.score_oopla,
+    }
+
+
+def iter_classification_zip(rows, workers=None, crop_store=None, previous_manifest=None,
+                            only_changed=False, manifest_folder=None, log=print):
+    """
+    Sınıflandırma veri setini (512x512 PNG'ler + labels.csv + manifest.json) akış halinde üretir.
+
+    Kırpmalar önce `crop_store` içinde aranır; yalnızca yeni ya da koordinatı/önizlemesi
+    değişmiş tespitler görüntü bazında süreç havuzuna gönderilir (her önizleme bir kez
+    çözülür) ve üretilen PNG'ler depoya da yazılır. PNG'ler zaten sıkıştırılmış olduğu için
+    ZIP'e sıkıştırmadan (STORED) yazılır; arşivin tamamı bellekte tutulmaz.
+
+    `previous_manifest` verilirse arşive `delta.json` (eklenen/değişen/kaldırılan örnekler)
+    eklenir; `only_changed` ile arşive sadece eklenen ve değişen örnekler yazılır.
+    Dışa aktarım tamamlanınca manifest `manifest_folder` içine kaydedilir.
+    `rows` içindeki `score` nesnesi: user_id, grade ve score_* alanlarına sahip düz bir kayıt.
+    """
+    grouped = group_scored_items(rows)
+    previous_samples = previous_manifest.get('samples', {}) if previous_manifest else {}
+    manifest = {
+        'export_id': datetime.now().strftime('%Y%m%d-%H%M%S-%f'),
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'crop_size': CROP_SIZE,
+        'samples': {},
+    }
+
+    # 1. Her tespit için kırpma anahtarını bul; depoda olanları oku, eksikleri işe dönüştür
+    plan = []
+    for preview_full_path, detections in grouped.items():
+        entries, missing = [], []
+        for detection_id, (coordinates_labelme, scores) in detections.items():
+            try:
+                key = training_crop_key(preview_full_path, coordinates_labelme)
+            except OSError as e:
+                log(f"HATA: Veri seti oluşturulurken {detection_id} işlenemedi: {e}")
+                continue
+            samples = []
+            for score in scores:
+                name, labels = sample_key(detection_id, score.user_id), score_labels(score)
+                previous = previous_samples.get(name, {})
+                skip = only_changed and previous.get('crop_key') == key and previous.get('labels') == labels
+                samples.append((name, labels, score, skip))
+            unchanged = all(skip for _, _, _, skip in samples)
+            # Depodaki kırpmalar burada okunmaz; arşive yazılırken tek tek okunur
+            cached = not unchanged and crop_store is not None and crop_store.contains(key)
+            if not unchanged and not cached:
+                missing.append((detection_id, coordinates_labelme,
+                                crop_store.path(key) if crop_store is not None else None))
+            entries.append((detection_id, key, samples, unchanged, cached))
+        plan.append((preview_full_path, entries, missing))
+
+    render_tasks = [(preview_full_path, missing) for preview_full_path, _, missing in plan if missing]
+    rendered_count = sum(len(missing) for _, missing in render_tasks)
+    reused_count = sum(1 for _, entries, _ in plan for entry in entries if entry[4])
+
+    csv_buffer = io.StringIO()
+    csv_writer = csv.writer(csv_buffer)
+    csv_writer.writerow(LABEL_COLUMNS)
+    stream = _ZipStream()
+    written_count = 0
+
+    with zipfile.ZipFile(stream, 'w', zipfile.ZIP_STORED) as zip_f:
+        # Tüm kırpmalar depodaysa süreç havuzu hiç başlatılmaz
+        executor = ProcessPoolExecutor(max_workers=workers) if render_tasks else None
+        try:
+            results_iter = iter(())
+            if executor is not None:
+                window = (workers or executor._max_workers) * 2
+                results_iter = _bounded_map(executor, render_image_crops, render_tasks, window)
+            for preview_full_path, entries, missing in plan:
+                rendered = {}
+                if missing:
+                    for detection_id, png_bytes, error in next(results_iter):
+                        if png_bytes is None:
+                            log(f"HATA: Veri seti oluşturulurken {detection_id} işlenemedi: {error}")
+                        rendered[detection_id] = png_bytes
+                for detection_id, key, samples, unchanged, cached in entries:
+                    png_bytes = crop_store.get(key) if cached else rendered.get(detection_id)
+                    if png_bytes is None and not unchanged:
+                        continue
+                    # Aynı oositi birden fazla uzman puanladıysa aynı kırpma her puan için yazılır
+                    for name, labels, score, skip in samples:
+                        png_filename = f"{detection_id}_u{score.user_id}_g{score.grade}.png"
+                        manifest['samples'][name] = {
+                            'file': png_filename,
+                            'detection_id': detection_id,
+                            'user_id': score.user_id,
+                            'crop_key': key,
+                            'labels': labels,
+                        }
+                        if skip:
+                            continue
+                        zip_f.writestr(png_filename, png_bytes)
+                        csv_writer.writerow([png_filename] + [labels[column] for column in LABEL_COLUMNS[1:]])
+                        written_count += 1
+                chunk = stream.take()
+                if chunk:
+                    yield chunk
+        finally:
+            if executor is not None:
+                executor.shutdown(cancel_futures=True)
+
+        zip_f.writestr('labels.csv', csv_buffer.getvalue(), compress_type=zipfile.ZIP_DEFLATED)
+        zip_f.writestr('manifest.json', json.dumps(manifest, ensure_ascii=False, indent=1),
+                       compress_type=zipfile.ZIP_DEFLATED)
+        if previous_manifest is not None:
+            delta = diff_manifests(previous_manifest, manifest)
+            zip_f.writestr('delta.json', json.dumps(delta, ensure_ascii=False, indent=1),
+                           compress_type=zipfile.ZIP_DEFLATED)
+
+    if manifest_folder:
+        save_manifest(manifest_folder, manifest)
+    log(f"Veri seti {manifest['export_id']}: {written_count} görüntü ve labels.csv arşive yazıldı "
+        f"({reused_count} kırpma depodan, {rendered_count} yeniden üretildi).")
+    yield stream.take()
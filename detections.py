@@ -0,0 +1,107 @@
+# detections.py
+from sqlalchemy import update
+
+from models import db, Image, Detection, Score
+from consensus import refresh_image_consensus
+
+
+class DetectionEditError(ValueError):
+    """Toplu düzenleme isteği geçersiz (eksik koordinat, başka görüntüye ait tespit vb.)."""
+
+
+def allocate_detection_ids(image_id, count=1):
+    """
+    Görüntünün `detection_seq` sayacını tek bir UPDATE ile `count` kadar artırır ve ayrılan
+    id'leri döndürür. UPDATE yazma kilidini aldığı için eşzamanlı iki istek aynı numarayı
+    alamaz; mevcut tespitlerin taranmasına gerek kalmaz. Commit çağırana aittir.
+    """
+    result = db.session.execute(
+        update(Image).where(Image.id == image_id)
+        .values(detection_seq=Image.detection_seq + count)
+        .returning(Image.detection_seq)
+    ).first()
+    if result is None:
+        raise LookupError(image_id)
+    last = result[0]
+    return [f"{image_id}_{index}" for index in range(last - count + 1, last + 1)]
+
+
+def rectangle(points):
+    """İstemciden gelen [[x1, y1], [x2, y2]] noktalarını LabelMe dikdörtgenine çevirir."""
+    try:
+        (x1, y1), (x2, y2) = points
+        points = [[float(x1), float(y1)], [float(x2), float(y2)]]
+    except (TypeError, ValueError):
+        raise DetectionEditError('Geçersiz koordinat')
+    return {"shape_type": "rectangle", "points": points}
+
+
+def detection_to_dict(detection, score=None):
+    return {
+        "id": detection.id,
+        "coordinates_labelme": detection.coordinates_labelme,
+        "scores": {
+            "grade": score.grade if score else None,
+            "sitoplazma": score.score_sitoplazma if score else None,
+            "zona": score.score_zona if score else None,
+            "kumulus": score.score_kumulus if score else None,
+            "oopla": score.score_oopla if score else None
+        }
+    }
+
+
+def image_detections_for_user(image_id, user_id):
+    """Görüntünün tespitleri ve verilen uzmanın puanları (annotate ekranının veri biçimi)."""
+    rows = db.session.query(Detection, Score).outerjoin(
+        Score, (Score.detection_id == Detection.id) & (Score.user_id == user_id)
+    ).filter(Detection.parent_image_id == image_id).all()
+    return [detection_to_dict(det, score) for det, score in rows]
+
+
+def apply_detection_edits(image_id, add=(), update_boxes=(), delete=()):
+    """
+    Eklemeleri, koordinat güncellemelerini ve silmeleri oturuma uygular (commit çağırana aittir).
+    `add`: [[x1, y1], [x2, y2]] listeleri; `update_boxes`: {'id', 'coordinates'} kayıtları;
+    `delete`: tespit id'leri. Silme varsa görüntünün konsensüsü yenilenir. Dönüş: (eklenen tespitler, güncellenen tespitler, silinen id'ler)
+    """
+    delete = list(dict.fromkeys(delete))
+    updates = {}
+    for item in update_boxes:
+        if not isinstance(item, dict) or not item.get('id'):
+            raise DetectionEditError('Güncellemede tespit id eksik')
+        updates[item['id']] = rectangle(item.get('coordinates'))
+    overlap = set(updates) & set(delete)
+    if overlap:
+        raise DetectionEditError(f"Aynı tespit hem güncellenip hem silinemez: {sorted(overlap)[0]}")
+
+    touched = list(updates) + delete
+    existing = {
+        det.id: det for det in
+        Detection.query.filter(Detection.id.in_(touched)).all()
+    } if touched else {}
+    for detection_id in touched:
+        det = existing.get(detection_id)
+        if det is None:
+            raise LookupError(detection_id)
+        if det.parent_image_id != image_id:
+            raise DetectionEditError(f"Tespit bu görüntüye ait değil: {detection_id}")
+
+    updated = []
+    for detection_id, coordinates in updates.items():
+        det = existing[detection_id]
+        det.coordinates_labelme = coordinates
+        updated.append(det)
+
+    for detection_id in delete:
+        db.session.delete(existing[detection_id])
+    if delete:
+        refresh_image_consensus([image_id])
+
+    added = []
+    boxes = [rectangle(points) for points in add]
+    if boxes:
+        for detection_id, coordinates in zip(allocate_detection_ids(image_id, len(boxes)), boxes):
+            det = Detection(id=detection_id, parent_image_id=image_id, coordinates_labelme=coordinates)
+            db.session.add(det)
+            added.append(det)
+    return added, updated, delete
@@ -0,0 +1,243 @@
+# image_listing.py
+import base64
+import json
+
+from sqlalchemy import func, literal_column, tuple_
+from sqlalchemy.orm import joinedload
+
+from models import db, Image, Detection, Score, ImageAssignment
+from czi_metadata import parse_acquisition_date
+
+
+REQUIRED_SCORERS = 2    # Bu kadar uzman puanlamadıysa görüntü "Onay Bekliyor"
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+class ListingError(ValueError):
+    """Geçersiz filtre/sıralama/imleç parametresi (API 400 döner)."""
+
+
+def encode_cursor(values):
+    payload = json.dumps(values, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(payload).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token):
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except Exception:
+        raise ListingError('Geçersiz sayfa imleci.')
+    if not isinstance(values, list) or len(values) != 2:
+        raise ListingError('Geçersiz sayfa imleci.')
+    return values
+
+
+def acquisition_sort_column():
+    # migrations.py'deki ix_images_acquisition_sort ifade indeksiyle birebir aynı olmalı
+    return func.coalesce(Image.acquisition_date, literal_column("''"), type_=db.String)
+
+
+# Sıralama adı -> (ikincil anahtar ifadesi veya None, azalan mı)
+# Her sıralama görüntü kimliğiyle sonlanır; böylece imleç her zaman tekil bir konumu gösterir.
+SORTS = {
+    '-id': (None, True),
+    'id': (None, False),
+    '-acquisition_date': (acquisition_sort_column, True),
+    'acquisition_date': (acquisition_sort_column, False),
+}
+
+
+def scorer_counts_for(image_ids):
+    """Verilen görüntüler için puanlayan (farklı) uzman sayıları, tek gruplanmış sorguda."""
+    if not image_ids:
+        return {}
+    return dict(
+        db.session.query(Detection.parent_image_id, func.count(db.distinct(Score.user_id)))
+        .join(Score, Score.detection_id == Detection.id)
+        .filter(Detection.parent_image_id.in_(image_ids))
+        .group_by(Detection.parent_image_id).all()
+    )
+
+
+def _scored_by(user_id):
+    return db.session.query(Detection.id).join(
+        Score, Score.detection_id == Detection.id
+    ).filter(
+        Detection.parent_image_id == Image.id, Score.user_id == user_id
+    ).exists()
+
+
+def _scorer_count_subquery():
+    return db.session.query(
+        Detection.parent_image_id.label('image_id'),
+        func.count(db.distinct(Score.user_id)).label('scorer_count')
+    ).join(
+        Score, Score.detection_id == Detection.id
+    ).group_by(Detection.parent_image_id).subquery()
+
+
+def _int_arg(args, name):
+    value = args.get(name)
+    if value in (None, ''):
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise ListingError(f"'{name}' bir sayı olmalı.")
+
+
+def _float_arg(args, name):
+    value = args.get(name)
+    if value in (None, ''):
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        raise ListingError(f"'{name}' bir sayı olmalı.")
+
+
+def _date_arg(args, name):
+    value = args.get(name)
+    if value in (None, ''):
+        return None
+    parsed = parse_acquisition_date(value)
+    if parsed is None:
+        raise ListingError(f"'{name}' YYYY-AA-GG biçiminde olmalı.")
+    return parsed
+
+
+def build_image_query(args, viewer):
+    """
+    Filtre parametrelerinden görüntü sorgusunu kurar.
+
+    scope: uploaded (yüklediklerim), assigned (bana atananlar), all (sadece admin)
+    uploader, assigned_to ('none': atanmamış): sadece admin için
+    status: scored / unscored (kapsam 'all' değilse izleyicinin kendi puanları),
+            pending / complete (puanlayan uzman sayısı REQUIRED_SCORERS'a göre)
+    date_from, date_to: çekim tarihi (YYYY-AA-GG); objective: objektif adı içinde arama
+    scale_min, scale_max: µm/piksel aralığı; channels: kanal sayısı
+    (metadata filtreleri CZI başlığından doldurulan indeksli sütunlarda çalışır)
+    """
+    is_admin = viewer.role == 'admin'
+    scope = args.get('scope', 'uploaded')
+    query = Image.query
+
+    if scope == 'uploaded':
+        query = query.filter(Image.uploader_id == viewer.id)
+    elif scope == 'assigned':
+        query = query.filter(Image.assignments.any(ImageAssignment.expert_id == viewer.id))
+    elif scope == 'all':
+        if not is_admin:
+            raise ListingError('Tüm görüntüleri listeleme yetkiniz yok.')
+    else:
+        raise ListingError(f"Bilinmeyen kapsam: {scope}")
+
+    if is_admin:
+        uploader_id = _int_arg(args, 'uploader')
+        if uploader_id is not None:
+            query = query.filter(Image.uploader_id == uploader_id)
+        assigned_to = args.get('assigned_to')
+        if assigned_to == 'none':
+            query = query.filter(~Image.assignments.any())
+        elif assigned_to:
+            expert_id = _int_arg(args, 'assigned_to')
+            query = query.filter(Image.assignments.any(ImageAssignment.expert_id == expert_id))
+
+    status = args.get('status')
+    if status in ('scored', 'unscored'):
+        if scope == 'all':
+            condition = Image.detections.any(Detection.scores.any())
+        else:
+            condition = _scored_by(viewer.id)
+        query = query.filter(condition if status == 'scored' else ~condition)
+    elif status in ('pending', 'complete'):
+        counts = _scorer_count_subquery()
+        scorer_count = func.coalesce(counts.c.scorer_count, 0)
+        query = query.outerjoin(counts, counts.c.image_id == Image.id).filter(
+            scorer_count < REQUIRED_SCORERS if status == 'pending' else scorer_count >= REQUIRED_SCORERS
+        )
+    elif status:
+        raise ListingError(f"Bilinmeyen durum filtresi: {status}")
+
+    date_from, date_to = _date_arg(args, 'date_from'), _date_arg(args, 'date_to')
+    if date_from:
+        query = query.filter(Image.acquisition_date >= date_from)
+    if date_to:
+        query = query.filter(Image.acquisition_date <= date_to)
+
+    objective = args.get('objective')
+    if objective:
+        query = query.filter(Image.objective_name.ilike(f"%{objective}%"))
+
+    scale_min, scale_max = _float_arg(args, 'scale_min'), _float_arg(args, 'scale_max')
+    if scale_min is not None:
+        query = query.filter(Image.scale_um_per_pixel >= scale_min)
+    if scale_max is not None:
+        query = query.filter(Image.scale_um_per_pixel <= scale_max)
+
+    channels = _int_arg(args, 'channels')
+    if channels is not None:
+        query = query.filter(Image.channel_count == channels)
+
+    return query
+
+
+def image_page(args, viewer):
+    """
+    Keyset (imleç) sayfalama ile bir sayfa görüntü döndürür.
+    OFFSET kullanılmaz; her sayfa bir önceki sayfanın son (sıralama değeri, id) çiftinden devam eder.
+    Dönüş: (görüntüler, {görüntü_id: puanlayan sayısı}, sonraki imleç veya None)
+    """
+    sort = args.get('sort', '-id')
+    if sort not in SORTS:
+        raise ListingError(f"Bilinmeyen sıralama: {sort}")
+    secondary, descending = SORTS[sort]
+    limit = min(max(_int_arg(args, 'limit') or DEFAULT_PAGE_SIZE, 1), MAX_PAGE_SIZE)
+
+    query = build_image_query(args, viewer)
+    sort_key = secondary() if secondary else None
+    key_columns = [sort_key, Image.id] if sort_key is not None else [Image.id]
+
+    cursor = args.get('after')
+    if cursor:
+        last_value, last_id = decode_cursor(cursor)
+        if sort_key is None:
+            query = query.filter(Image.id < last_id if descending else Image.id > last_id)
+        else:
+            position = tuple_(sort_key, Image.id)
+            query = query.filter(
+                position < tuple_(last_value, last_id) if descending else position > tuple_(last_value, last_id)
+            )
+
+    query = query.order_by(*[c.desc() if descending else c.asc() for c in key_columns])
+    if sort_key is not None:
+        query = query.add_columns(sort_key)
+    rows = query.options(joinedload(Image.uploader)).limit(limit + 1).all()
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if sort_key is not None:
+        images = [image for image, _ in rows]
+        last_value = rows[-1][1] if rows else None
+    else:
+        images = rows
+        last_value = None
+    next_cursor = encode_cursor([last_value, images[-1].id]) if has_more else None
+    return images, scorer_counts_for([image.id for image in images]), next_cursor
+
+
+def image_to_dict(image, scorer_count):
+    metadata = image.metadata_json or {}
+    return {
+        'id': image.id,
+        'uploader': image.uploader.username if image.uploader else None,
+        'scale_um_per_pixel': image.scale_um_per_pixel or metadata.get('scale_um_per_pixel'),
+        'acquisition_date': (image.acquisition_date.isoformat() if image.acquisition_date
+                             else metadata.get('acquisition_date')),
+        'objective_name': image.objective_name or metadata.get('objective_name'),
+        'channel_count': image.channel_count,
+        'scorer_count': scorer_count,
+        'pending': scorer_count < REQUIRED_SCORERS,
+    }
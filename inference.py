@@ -0,0 +1,547 @@
+# inference.py
+import logging
+import os
+import threading
+import queue
+import time
+from collections import deque
+
+import numpy as np
+from PIL import Image as PILImage
+
+from metrics import INFERENCE_BATCH_SIZE, PROCESSING_STAGE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+
+class _InferenceRequest:
+    """Kuyruktaki tek bir tespit isteği (önizleme + sonucu bekleyen olay)."""
+    __slots__ = ('source', 'enqueued_at', 'done', 'result', 'error')
+
+    def __init__(self, source):
+        self.source = source
+        self.enqueued_at = time.perf_counter()
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+# === Çıkarım Arka Uçları ===
+class UltralyticsBackend:
+    """Ultralytics PyTorch modeli (`YOLO(...).predict`); girdi BGR NumPy dizileri."""
+    name = 'ultralytics'
+
+    def __init__(self, model_path):
+        self.model_path = model_path
+        self.model = None
+
+    def load(self):
+        from ultralytics import YOLO  # Ağır import; sadece servis thread'inde bir kez yapılır
+        self.model = YOLO(self.model_path)
+
+    def predict_batch(self, images):
+        return [self._boxes_from_result(result) for result in self.model.predict(images, verbose=False)]
+
+    @staticmethod
+    def _boxes_from_result(result):
+        """Ultralytics sonucunu (N, 5) [x1, y1, x2, y2, conf] dizisine çevirir."""
+        boxes = result.boxes
+        if boxes is None or len(boxes) == 0:
+            return np.zeros((0, 5), dtype=np.float32)
+        xyxy = boxes.xyxy.cpu().numpy()
+        conf = boxes.conf.cpu().numpy().reshape(-1, 1)
+        return np.hstack([xyxy, conf]).astype(np.float32)
+
+    def describe(self):
+        return {'backend': self.name, 'model_path': self.model_path}
+
+
+def quantized_model_path(model_path):
+    root, extension = os.path.splitext(model_path)
+    return f"{root}.int8{extension}"
+
+
+def quantize_onnx_model(model_path, output_path=None, force=False):
+    """
+    Ağırlıkları dinamik INT8 nicemlemeyle (aktivasyon ölçekleri çalışma anında) küçültür.
+    Kalibrasyon verisi gerekmez. Nicemlenmiş dosya kaynak modelden yeniyse tekrar üretilmez.
+    """
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    output_path = output_path or quantized_model_path(model_path)
+    if not force and os.path.exists(output_path) and os.path.getmtime(output_path) >= os.path.getmtime(model_path):
+        return output_path
+    quantize_dynamic(model_path, output_path, weight_type=QuantType.QInt8)
+    return output_path
+
+
+def letterbox(image, size, fill=114):
+    """
+    BGR görüntüyü en-boy oranını koruyarak `size` (yükseklik, genişlik) içine sığdırır ve
+    kalan alanı gri doldurur (ultralytics ile aynı). Dönüş: (dizi, ölçek, (sol, üst) dolgu)
+    """
+    height, width = image.shape[:2]
+    target_height, target_width = size
+    ratio = min(target_height / height, target_width / width)
+    new_width, new_height = round(width * ratio), round(height * ratio)
+    if (new_width, new_height) != (width, height):
+        image = np.asarray(PILImage.fromarray(image).resize((new_width, new_height), PILImage.Resampling.BILINEAR))
+    left = (target_width - new_width) // 2
+    top = (target_height - new_height) // 2
+    canvas = np.full((target_height, target_width, 3), fill, dtype=np.uint8)
+    canvas[top:top + new_height, left:left + new_width] = image
+    return canvas, ratio, (left, top)
+
+
+class OnnxBackend:
+    """
+    Ultralytics'ten dışa aktarılmış YOLOv8 ONNX modeli, onnxruntime CPU sağlayıcısıyla.
+
+    PyTorch/ultralytics import edilmez. Ön ve son işleme ultralytics varsayılanlarını izler:
+    letterbox (114 gri dolgu), RGB, 0-1 ölçek; güven eşiği `conf`, sınıf bazında NMS (`iou`),
+    en fazla `max_det` kutu. `int8=True` ise model ilk yüklemede dinamik INT8 nicemlenir
+    (`<ad>.int8.onnx`). `intra_op_threads` > 0 ise oturumun tek operatör içi thread sayısıdır.
+    """
+    name = 'onnx'
+
+    def __init__(self, model_path, int8=False, intra_op_threads=0, imgsz=640, conf=0.25, iou=0.7, max_det=300):
+        self.model_path = model_path
+        self.int8 = int8
+        self.intra_op_threads = intra_op_threads
+        self.imgsz = imgsz
+        self.conf = conf
+        self.iou = iou
+        self.max_det = max_det
+        self.session = None
+        self.input_name = None
+        self.input_size = (imgsz, imgsz)
+        self.fixed_batch = None
+
+    def load(self):
+        import onnxruntime as ort
+
+        path = quantize_onnx_model(self.model_path) if self.int8 else self.model_path
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if self.intra_op_threads:
+            options.intra_op_num_threads = int(self.intra_op_threads)
+        self.session = ort.InferenceSession(path, sess_options=options, providers=['CPUExecutionProvider'])
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        batch, _, height, width = model_input.shape  # Dinamik eksenler metin (örn. 'batch') olarak gelir
+        if isinstance(height, int) and isinstance(width, int):
+            self.input_size = (height, width)
+        self.fixed_batch = batch if isinstance(batch, int) else None
+
+    def _run(self, tensors):
+        if self.fixed_batch is None or self.fixed_batch == len(tensors):
+            return list(self.session.run(None, {self.input_name: np.stack(tensors)})[0])
+        # Sabit batch boyutuyla dışa aktarılmış modelde görüntüler tek tek verilir
+        return [self.session.run(None, {self.input_name: tensor[None]})[0][0] for tensor in tensors]
+
+    def predict_batch(self, images):
+        prepared = [letterbox(image, self.input_size) for image in images]
+        # BGR -> RGB, HWC -> CHW, 0-1
+        tensors = [
+            np.ascontiguousarray(canvas[:, :, ::-1].transpose(2, 0, 1), dtype=np.float32) / 255.0
+            for canvas, _, _ in prepared
+        ]
+        outputs = self._run(tensors)
+        return [
+            self._postprocess(output, ratio, pad, image.shape[:2])
+            for output, (_, ratio, pad), image in zip(outputs, prepared, images)
+        ]
+
+    def _postprocess(self, output, ratio, pad, original_shape):
+        """(4 + sınıf sayısı, aday) çıktısını özgün görüntü koordinatlarında (N, 5) kutulara çevirir."""
+        predictions = output.T
+        class_scores = predictions[:, 4:]
+        classes = class_scores.argmax(axis=1)
+        scores = class_scores[np.arange(len(predictions)), classes]
+        keep = scores > self.conf
+        if not keep.any():
+            return np.zeros((0, 5), dtype=np.float32)
+        cx, cy, w, h = predictions[keep, :4].T
+        boxes = np.stack([cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2, scores[keep]], axis=1)
+        classes = classes[keep]
+
+        # Sınıf bazında NMS: sınıflar kaydırılarak birbirinden ayrılır (ultralytics ile aynı yöntem)
+        shifted = boxes.copy()
+        shifted[:, :4] += classes[:, None] * 7680.0
+        boxes = boxes[nms_indices(shifted, iou_threshold=self.iou)[:self.max_det]]
+
+        left, top = pad
+        boxes[:, [0, 2]] = (boxes[:, [0, 2]] - left) / ratio
+        boxes[:, [1, 3]] = (boxes[:, [1, 3]] - top) / ratio
+        height, width = original_shape
+        boxes[:, [0, 2]] = boxes[:, [0, 2]].clip(0, width)
+        boxes[:, [1, 3]] = boxes[:, [1, 3]].clip(0, height)
+        return boxes.astype(np.float32)
+
+    def describe(self):
+        return {
+            'backend': self.name, 'model_path': self.model_path, 'int8': self.int8,
+            'intra_op_threads': self.intra_op_threads, 'input_size': list(self.input_size),
+        }
+
+
+BACKENDS = {'ultralytics': UltralyticsBackend, 'onnx': OnnxBackend}
+
+
+def make_backend(name, model_path, **options):
+    if name not in BACKENDS:
+        raise ValueError(f"Bilinmeyen çıkarım arka ucu: {name} ({', '.join(BACKENDS)})")
+    return BACKENDS[name](model_path, **options)
+
+
+class InferenceService:
+    """
+    YOLO modelini süreç boyunca bir kez yükleyip sıcak tutan çıkarım servisi.
+
+    Tüm yüklemelerden gelen tespit istekleri tek bir kuyrukta toplanır; arka plandaki
+    işçi thread kuyruktaki önizlemeleri gruplayarak toplu (batched) `predict` çağrıları yapar.
+    Her çağrı için kuyruk derinliği ve gecikme bilgisi `stats()` ile raporlanır.
+    Modeli çalıştıran arka uç (`backend`) verilmezse ultralytics kullanılır.
+    Model yüklenemezse hata kalıcı sayılmaz: bekleme süresi (`load_retry_seconds`'dan başlayıp
+    her başarısızlıkta ikiye katlanarak `max_load_retry_seconds`'a kadar) dolduktan sonraki ilk
+    batch yüklemeyi yeniden dener; arada gelen istekler son hatayla hemen reddedilir.
+    """
+
+    def __init__(self, model_path, max_batch_size=8, max_wait_ms=50, warmup=True, history_size=200,
+                 backend=None, load_retry_seconds=5, max_load_retry_seconds=300):
+        self.model_path = model_path
+        self.backend = backend or UltralyticsBackend(model_path)
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0, max_wait_ms) / 1000.0
+        self.warmup = warmup
+        self.model = None
+        self.ready = threading.Event()
+        self.load_error = None
+        self.load_failures = 0
+        self.load_retry_seconds = load_retry_seconds
+        self.max_load_retry_seconds = max_load_retry_seconds
+        self._retry_at = 0.0
+        self.load_seconds = None
+        self.batch_history = deque(maxlen=history_size)
+        self.total_batches = 0
+        self.total_images = 0
+        self._queue = queue.Queue()
+        self._stats_lock = threading.Lock()
+        self._worker = threading.Thread(target=self._run, name='yolo-inference', daemon=True)
+        self._worker.start()
+
+    # --- Model Yükleme ---
+    def _load_model(self):
+        start = time.perf_counter()
+        self.backend.load()
+        if self.warmup:
+            # İlk predict çağrısındaki gecikmeyi (fuse, bellek ayırma) yüklemeye taşı
+            self.backend.predict_batch([np.zeros((64, 64, 3), dtype=np.uint8)])
+        self.load_seconds = time.perf_counter() - start
+        PROCESSING_STAGE_SECONDS.observe(self.load_seconds, stage='model_load')
+        logger.info("YOLO modeli yüklendi (%s: %s), süre: %.2f sn", self.backend.name, self.model_path, self.load_seconds)
+        return self.backend
+
+    def _try_load(self):
+        try:
+            self.model = self._load_model()
+            self.load_error = None
+            self.load_failures = 0
+        except Exception as e:
+            self.load_error = e
+            self.load_failures += 1
+            delay = min(self.max_load_retry_seconds, self.load_retry_seconds * 2 ** (self.load_failures - 1))
+            self._retry_at = time.perf_counter() + delay
+            logger.error("YOLO modeli yüklenemedi (%d. deneme, %.1f sn sonra tekrar denenecek): %s",
+                         self.load_failures, delay, e)
+
+    # --- İşçi Döngüsü ---
+    def _run(self):
+        try:
+            self._try_load()
+        finally:
+            self.ready.set()
+
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.perf_counter() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._process_batch(batch)
+
+    def _process_batch(self, batch):
+        if self.model is None and time.perf_counter() >= self._retry_at:
+            self._try_load()
+        if self.model is None:
+            for req in batch:
+                req.error = RuntimeError(f"YOLO modeli yüklenemedi: {self.load_error}")
+                req.done.set()
+            return
+
+        queue_depth = self._queue.qsize()
+        started = time.perf_counter()
+        try:
+            results = self.backend.predict_batch([req.source for req in batch])
+            for req, result in zip(batch, results):
+                req.result = result
+        except Exception as e:
+            for req in batch:
+                req.error = e
+        finished = time.perf_counter()
+
+        batch_stat = {
+            'batch_size': len(batch),
+            'queue_depth': queue_depth,
+            'max_wait_ms': round(max(started - req.enqueued_at for req in batch) * 1000, 2),
+            'inference_ms': round((finished - started) * 1000, 2),
+        }
+        PROCESSING_STAGE_SECONDS.observe(finished - started, stage='inference')
+        INFERENCE_BATCH_SIZE.observe(len(batch))
+        with self._stats_lock:
+            self.batch_history.append(batch_stat)
+            self.total_batches += 1
+            self.total_images += len(batch)
+
+        for req in batch:
+            req.done.set()
+
+    # --- Dış API ---
+    def predict(self, source, timeout=None):
+        """
+        Tek bir önizlemeyi (dosya yolu veya `to_model_input` ile hazırlanmış NumPy dizisi)
+        kuyruğa ekler ve sonucu bekler.
+        Dönen değer: (N, 5) [x1, y1, x2, y2, conf] dizisi.
+        """
+        req = _InferenceRequest(source)
+        self._queue.put(req)
+        if not req.done.wait(timeout):
+            raise TimeoutError("YOLO çıkarımı zaman aşımına uğradı.")
+        if req.error is not None:
+            raise req.error
+        return req.result
+
+    def predict_many(self, sources, timeout=None):
+        """
+        Birden fazla önizlemeyi (örn. döşeme pencereleri) aynı anda kuyruğa ekler;
+        servis bunları batch'ler halinde modele verir. Sonuçlar girdi sırasıyla döner.
+        """
+        requests = [_InferenceRequest(source) for source in sources]
+        for req in requests:
+            self._queue.put(req)
+        results = []
+        for req in requests:
+            if not req.done.wait(timeout):
+                raise TimeoutError("YOLO çıkarımı zaman aşımına uğradı.")
+            if req.error is not None:
+                raise req.error
+            results.append(req.result)
+        return results
+
+    def stats(self):
+        """Kuyruk derinliği ve son batch'lerin gecikme bilgileri."""
+        with self._stats_lock:
+            history = list(self.batch_history)
+            return {
+                'model_path': self.model_path,
+                'backend': self.backend.describe(),
+                'ready': self.ready.is_set() and self.load_error is None,
+                'load_seconds': self.load_seconds,
+                'load_failures': self.load_failures,
+                'queue_depth': self._queue.qsize(),
+                'total_batches': self.total_batches,
+                'total_images': self.total_images,
+                'recent_batches': history,
+            }
+
+
+# === Süreç Genelinde Tek Servis ===
+_services = {}
+_services_lock = threading.Lock()
+
+
+def get_inference_service(model_path, backend='ultralytics', backend_options=None, **options):
+    """
+    Verilen model ve arka uç için süreç genelindeki servisi döndürür; yoksa oluşturur.
+    `options` sadece servis ilk kez oluşturulurken kullanılır.
+    """
+    backend_options = backend_options or {}
+    key = (backend, model_path, tuple(sorted(backend_options.items())))
+    with _services_lock:
+        service = _services.get(key)
+        if service is None:
+            service = InferenceService(
+                model_path, backend=make_backend(backend, model_path, **backend_options), **options
+            )
+            _services[key] = service
+        return service
+
+
+def to_model_input(image):
+    """
+    Bellekteki önizleme dizisini modele verilecek biçime getirir.
+    Ultralytics NumPy girdisini BGR (OpenCV) kabul eder; gri görüntüler 3 kanala çoğaltılır.
+    """
+    image = np.asarray(image)
+    if image.ndim == 2:
+        return np.ascontiguousarray(np.repeat(image[:, :, None], 3, axis=2))
+    return np.ascontiguousarray(image[:, :, ::-1])
+
+
+# === Döşemeli (Tiled) Çıkarım ===
+def tile_windows(height, width, tile_size, overlap):
+    """Görüntüyü kaplayan, `overlap` oranında örtüşen (y0, x0, y1, x1) pencereleri üretir."""
+    stride = max(1, int(tile_size * (1 - overlap)))
+
+    def starts(length):
+        if length <= tile_size:
+            return [0]
+        positions = list(range(0, length - tile_size, stride))
+        positions.append(length - tile_size)  # Son pencere kenara yaslanır
+        return positions
+
+    return [
+        (y0, x0, min(y0 + tile_size, height), min(x0 + tile_size, width))
+        for y0 in starts(height) for x0 in starts(width)
+    ]
+
+
+def nms_indices(boxes, iou_threshold=0.5, ios_threshold=float('inf')):
+    """(N, 5) [x1, y1, x2, y2, conf] kutularından NMS sonrası kalanların indeksleri (güvene göre sıralı)."""
+    if len(boxes) == 0:
+        return np.zeros(0, dtype=np.int64)
+    x1, y1, x2, y2, conf = boxes.T
+    areas = np.maximum(x2 - x1, 0) * np.maximum(y2 - y1, 0)
+    order = np.argsort(-conf)
+    keep = []
+    while order.size:
+        i = order[0]
+        keep.append(i)
+        rest = order[1:]
+        inter_w = np.maximum(np.minimum(x2[i], x2[rest]) - np.maximum(x1[i], x1[rest]), 0)
+        inter_h = np.maximum(np.minimum(y2[i], y2[rest]) - np.maximum(y1[i], y1[rest]), 0)
+        inter = inter_w * inter_h
+        union = areas[i] + areas[rest] - inter
+        iou = inter / np.maximum(union, 1e-6)
+        ios = inter / np.maximum(np.minimum(areas[i], areas[rest]), 1e-6)
+        order = rest[(iou <= iou_threshold) & (ios <= ios_threshold)]
+    return np.asarray(keep, dtype=np.int64)
+
+
+def non_max_suppression(boxes, iou_threshold=0.5, ios_threshold=0.7):
+    """
+    (N, 5) [x1, y1, x2, y2, conf] kutularında güvene göre NMS uygular.
+
+    Döşeme kenarında kesilmiş bir kutu, komşu döşemedeki tam kutunun içinde kalır ve
+    IoU'su düşük olabilir; bu yüzden küçük kutuya göre kesişim oranı (IoS) da kontrol edilir.
+    """
+    if len(boxes) == 0:
+        return boxes
+    return boxes[nms_indices(boxes, iou_threshold, ios_threshold)]
+
+
+def box_iou(a, b):
+    """(N, 4+) ve (M, 4+) kutular arasında (N, M) IoU matrisi."""
+    x1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    y2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    inter = np.maximum(x2 - x1, 0) * np.maximum(y2 - y1, 0)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    return inter / np.maximum(area_a[:, None] + area_b[None, :] - inter, 1e-6)
+
+
+def match_boxes(reference, candidate, threshold=0.5):
+    """
+    İki kutu kümesini açgözlü (en yüksek IoU önce) bire bir eşleştirir.
+    Dönüş: [(referans indeksi, aday indeksi, IoU), ...]; IoU'su `threshold` altındakiler eşleşmez.
+    """
+    if len(reference) == 0 or len(candidate) == 0:
+        return []
+    iou = box_iou(np.asarray(reference, dtype=np.float64), np.asarray(candidate, dtype=np.float64))
+    matched = []
+    while True:
+        i, j = np.unravel_index(np.argmax(iou), iou.shape)
+        if iou[i, j] < threshold:
+            break
+        matched.append((int(i), int(j), float(iou[i, j])))
+        iou[i, :] = -1
+        iou[:, j] = -1
+    return matched
+
+
+def detect_boxes(detector, image, tile_size=0, tile_overlap=0.25, nms_iou=0.5):
+    """
+    Bellekteki önizleme dizisinde tespit yapar ve (N, 5) kutu dizisi döndürür.
+
+    `tile_size` > 0 ve görüntü bundan büyükse örtüşen pencereler tek seferde kuyruğa
+    verilir (batch), kutular tam görüntü koordinatlarına taşınıp döşemeler arası NMS ile
+    birleştirilir. Böylece büyük mozaiklerde küçük oositler model girdisine küçültülürken kaybolmaz.
+    """
+    height, width = image.shape[:2]
+    if not tile_size or (height <= tile_size and width <= tile_size):
+        return detector.predict(to_model_input(image))
+
+    windows = tile_windows(height, width, tile_size, tile_overlap)
+    tiles = [to_model_input(image[y0:y1, x0:x1]) for y0, x0, y1, x1 in windows]
+    merged = []
+    for (y0, x0, _, _), boxes in zip(windows, detector.predict_many(tiles)):
+        if len(boxes):
+            boxes = boxes.copy()
+            boxes[:, [0, 2]] += x0
+            boxes[:, [1, 3]] += y0
+            merged.append(boxes)
+    logger.debug("Döşemeli tespit: %d pencere, birleştirme öncesi %d kutu", len(windows), sum(len(b) for b in merged))
+    if not merged:
+        return np.zeros((0, 5), dtype=np.float32)
+    return non_max_suppression(np.vstack(merged), iou_threshold=nms_iou)
+
+
+def active_model_path(config):
+    """Seçili arka ucun model dosyası (ONNX için dışa aktarılmış .onnx)."""
+    if config.get('YOLO_BACKEND', 'ultralytics') == 'onnx':
+        return config['YOLO_ONNX_PATH']
+    return config['YOLO_MODEL_PATH']
+
+
+def backend_options_from_config(config):
+    if config.get('YOLO_BACKEND', 'ultralytics') != 'onnx':
+        return {}
+    return {
+        'int8': bool(config.get('YOLO_ONNX_INT8', False)),
+        'intra_op_threads': config.get('YOLO_ONNX_THREADS', 0),
+        'imgsz': config.get('YOLO_IMGSZ', 640),
+        'conf': config.get('YOLO_CONF', 0.25),
+        'iou': config.get('YOLO_IOU', 0.7),
+    }
+
+
+def inference_options_from_config(config):
+    """`get_inference_service`'e anahtar kelime olarak geçirilecek model, arka uç ve kuyruk ayarları."""
+    return {
+        'model_path': active_model_path(config),
+        'backend': config.get('YOLO_BACKEND', 'ultralytics'),
+        'backend_options': backend_options_from_config(config),
+        'max_batch_size': config.get('YOLO_BATCH_SIZE', 8),
+        'max_wait_ms': config.get('YOLO_BATCH_WAIT_MS', 50),
+    }
+
+
+def service_from_config(config):
+    """Uygulama konfigürasyonundaki YOLO ayarlarıyla servisi döndürür."""
+    return get_inference_service(**inference_options_from_config(config))
+
+
+def detection_options_from_config(config):
+    """`process_czi_image`'e geçirilecek döşemeli tespit ayarları."""
+    return {
+        'tile_size': config.get('YOLO_TILE_SIZE', 0),
+        'tile_overlap': config.get('YOLO_TILE_OVERLAP', 0.25),
+        'nms_iou': config.get('YOLO_NMS_IOU', 0.5),
+    }
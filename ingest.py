@@ -0,0 +1,507 @@
+# ingest.py
+import os
+import time
+import uuid
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, FIRST_COMPLETED, wait
+from datetime import datetime, timedelta
+
+from sqlalchemy import or_
+from sqlalchemy.exc import OperationalError
+from werkzeug.utils import secure_filename
+
+from models import db, Image, Detection, IngestJob
+from processing import process_czi_image, processing_options_from_config, reuse_cached_result
+from inference import service_from_config
+from tiles import remove_tile_pyramid
+from crops import remove_image_crops
+from czi_metadata import index_image_metadata
+from preview_encoding import remove_previews
+from processing_cache import (
+    copy_file_hashed, find_duplicate_image, lookup_processing_cache, model_version, store_processing_cache
+)
+
+
+# --- Ortak Yardımcılar (form yüklemesi ve arka plan işleri birlikte kullanır) ---
+def store_ingest_result(image_id, czi_path, uploader_id, metadata, preview_path, detections,
+                        content_hash=None, detection_model_version=None):
+    """İşlenmiş görüntüyü ve tespitlerini oturuma ekler (commit çağırana aittir)."""
+    new_image = Image(
+        id=image_id, file_path=czi_path,
+        preview_path=preview_path,
+        metadata_json=metadata,
+        uploader_id=uploader_id,
+        content_hash=content_hash,
+        detection_model_version=detection_model_version,
+        detection_seq=len(detections)  # İşleme adımı id'leri 1..n olarak numaralandırır
+    )
+    index_image_metadata(new_image)  # Sorgulanabilir sütunlar (sadece CZI başlığı okunur)
+    db.session.add(new_image)
+    for det_data in detections:
+        db.session.add(Detection(
+            id=det_data['id'],
+            parent_image_id=image_id,
+            coordinates_labelme=det_data['coordinates_labelme']
+        ))
+    return new_image
+
+
+def process_or_reuse(czi_path, image_id, config, cached=None, detector=None, progress_callback=None):
+    """
+    `cached` (lookup_processing_cache sonucu) verilirse CZI çözülmeden ve model çalıştırılmadan
+    önbellekteki sonuç yeni görüntü id'siyle yazılır; yoksa dosya baştan işlenir.
+    """
+    options = processing_options_from_config(config)
+    if cached is not None:
+        return reuse_cached_result(
+            cached['preview_path'], image_id, config['PREVIEW_FOLDER'],
+            cached['metadata'], cached['coordinates'],
+            progress_callback=progress_callback, **options
+        )
+    return process_czi_image(
+        czi_path, image_id,
+        config['PREVIEW_FOLDER'],
+        config['YOLO_MODEL_PATH'],
+        detector=detector or service_from_config(config),
+        progress_callback=progress_callback,
+        **options
+    )
+
+
+def cache_ingest_result(content_hash, version, metadata, preview_path, detections, config):
+    """Önbelleğe yazma hatası yüklemeyi başarısız saymaz."""
+    try:
+        store_processing_cache(content_hash, version, metadata, preview_path, detections, config)
+    except OSError as e:
+        print(f"UYARI: {content_hash} işleme sonucu önbelleğe yazılamadı: {e}")
+
+
+def cleanup_failed_ingest(image_id, czi_path, config):
+    """İşlenemeyen yüklemenin .czi, önizleme, döşeme ve kırpma dosyalarını diskten temizler."""
+    if czi_path and os.path.exists(czi_path): os.remove(czi_path)
+    try:
+        remove_previews(config['PREVIEW_FOLDER'], image_id)
+        if config.get('PYRAMID_FOLDER'):
+            remove_tile_pyramid(config['PYRAMID_FOLDER'], image_id)
+        if config.get('CROP_FOLDER'):
+            remove_image_crops(config['CROP_FOLDER'], image_id)
+    except OSError: pass
+
+
+def job_to_dict(job):
+    return {
+        'job_id': job.id,
+        'image_id': job.image_id,
+        'filename': job.original_filename,
+        'status': job.status,
+        'stage': job.stage,
+        'progress': job.progress,
+        'detection_count': job.detection_count,
+        'error': job.error,
+        'duplicate': job.stage == 'duplicate',
+        'created_at': job.created_at.isoformat() if job.created_at else None,
+        'updated_at': job.updated_at.isoformat() if job.updated_at else None,
+    }
+
+
+# --- Arka Plan İş Kuyruğu ---
+ACTIVE_JOB_STATUSES = ('queued', 'running')
+
+
+class IngestJobQueue:
+    """
+    Yüklenen .czi dosyalarını istek thread'i dışında işleyen işçi havuzu.
+
+    İş durumu `ingest_jobs` tablosunda tutulur; böylece birden fazla web
+    işçisi (gunicorn) altında da durum sorgulama API'si tutarlı kalır.
+    Her süreç elindeki (kuyruktaki ya da işlenen) işlerin `updated_at` alanını
+    düzenli aralıklarla tazeler (kalp atışı). Kalp atışı `INGEST_STALE_SECONDS`
+    süresinden eski olan etkin işler sahipsiz sayılıp kurtarılır
+    (`recover_interrupted_jobs`); böylece PID'ler yeniden kullanılsa da yeniden
+    başlatmada yarım kalan işler takılı kalmaz. İzleme thread'i ilk istekte başlar;
+    CLI komutları istek almadığı için iş başlatmaz.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.executor = None
+        self._held = set()  # Bu sürecin havuzundaki iş id'leri
+        self._held_lock = threading.Lock()
+        self._monitor = None
+        self._monitor_lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.executor = ThreadPoolExecutor(
+            max_workers=app.config.get('INGEST_WORKERS', 2),
+            thread_name_prefix='ingest'
+        )
+        app.extensions['ingest_job_queue'] = self
+
+        @app.before_request
+        def start_ingest_monitor():
+            if self._monitor is None:
+                with self._monitor_lock:
+                    if self._monitor is None:
+                        self._monitor = threading.Thread(
+                            target=self._monitor_loop, name='ingest-monitor', daemon=True
+                        )
+                        self._monitor.start()
+
+    def create_job(self, image_id, file_path, user_id, original_filename=None, content_hash=None):
+        """İş kaydını oluşturur ve işçi havuzuna gönderir."""
+        job = IngestJob(
+            id=uuid.uuid4().hex,
+            image_id=image_id,
+            file_path=file_path,
+            user_id=user_id,
+            original_filename=original_filename,
+            content_hash=content_hash,
+            owner_pid=os.getpid(),
+            status='queued', stage='queued', progress=0
+        )
+        db.session.add(job)
+        db.session.commit()
+        self._submit(job.id)
+        return job
+
+    def _submit(self, job_id):
+        with self._held_lock:
+            self._held.add(job_id)
+        self.executor.submit(self._run, job_id)
+
+    def _monitor_loop(self):
+        interval = self.app.config.get('INGEST_HEARTBEAT_SECONDS', 30)
+        while True:
+            with self.app.app_context():
+                try:
+                    self.heartbeat()
+                    self.recover_interrupted_jobs()
+                except Exception as e:
+                    db.session.rollback()
+                    print(f"HATA: Yükleme işi izleme adımı başarısız: {e}")
+                finally:
+                    db.session.remove()
+            time.sleep(interval)
+
+    def heartbeat(self):
+        """Bu süreçte bekleyen ya da işlenen işlerin `updated_at` alanını tazeler."""
+        with self._held_lock:
+            held = list(self._held)
+        if not held:
+            return
+        try:
+            IngestJob.query.filter(
+                IngestJob.id.in_(held), IngestJob.status.in_(ACTIVE_JOB_STATUSES)
+            ).update({'updated_at': datetime.utcnow()}, synchronize_session=False)
+            db.session.commit()
+        except OperationalError:
+            db.session.rollback()  # Kilit çakışması: bir sonraki turda tekrar denenir
+
+    def recover_interrupted_jobs(self):
+        """
+        Kalp atışı eskimiş 'queued' / 'running' işleri bulur. Yüklenen dosya duruyorsa
+        yarım kalan çıktılar silinip iş baştan kuyruğa alınır; dosya yoksa iş başarısız
+        işaretlenir ve çıktıları temizlenir. Her iş, eskime koşulu tekrar sınanan koşullu
+        bir güncellemeyle sahiplenilir; birden fazla web işçisi aynı işi iki kez kuyruğa almaz.
+        Dönüş: (yeniden kuyruğa alınan, başarısız işaretlenen) iş sayıları
+        """
+        config = self.app.config
+        stale_before = datetime.utcnow() - timedelta(seconds=config.get('INGEST_STALE_SECONDS', 120))
+        is_stale = or_(IngestJob.updated_at.is_(None), IngestJob.updated_at < stale_before)
+        requeued, failed = 0, 0
+        try:
+            jobs = IngestJob.query.filter(IngestJob.status.in_(ACTIVE_JOB_STATUSES), is_stale).all()
+        except OperationalError:
+            db.session.rollback()  # Tablo/sütun henüz yok: 'flask init-db' / 'flask migrate-db' öncesi
+            return requeued, failed
+
+        with self._held_lock:
+            held = set(self._held)
+        for job in jobs:
+            if job.id in held:
+                continue
+            claimed = IngestJob.query.filter(
+                IngestJob.id == job.id, IngestJob.status.in_(ACTIVE_JOB_STATUSES), is_stale
+            ).update({'owner_pid': os.getpid(), 'updated_at': datetime.utcnow()}, synchronize_session=False)
+            db.session.commit()
+            if not claimed:
+                continue
+            job = IngestJob.query.get(job.id)
+            if Image.query.get(job.image_id) is None:
+                # Önizleme, döşeme ve kırpmaların yarım kalmış olabilecek kısmı; .czi korunur
+                cleanup_failed_ingest(job.image_id, None, config)
+            if os.path.exists(job.file_path):
+                _update_job(job, status='queued', stage='queued', progress=0, error=None)
+                self._submit(job.id)
+                requeued += 1
+            else:
+                cleanup_failed_ingest(job.image_id, job.file_path, config)
+                _update_job(job, status='failed', stage='failed',
+                            error='Sunucu yeniden başlatıldı ve yüklenen dosya bulunamadı.')
+                failed += 1
+        if requeued or failed:
+            print(f"Yarım kalan yükleme işleri: {requeued} yeniden kuyruğa alındı, {failed} başarısız işaretlendi.")
+        return requeued, failed
+
+    def _run(self, job_id):
+        with self.app.app_context():
+            try:
+                run_ingest_job(job_id, self.app.config)
+            finally:
+                db.session.remove()
+                with self._held_lock:
+                    self._held.discard(job_id)
+
+
+def _update_job(job, **fields):
+    for key, value in fields.items():
+        setattr(job, key, value)
+    job.updated_at = datetime.utcnow()
+    db.session.commit()
+
+
+def run_ingest_job(job_id, config):
+    """Tek bir yükleme işini uçtan uca işler; hata olursa dosyaları temizler."""
+    job = IngestJob.query.get(job_id)
+    if job is None or job.status not in ('queued', 'running'):
+        return
+    _update_job(job, status='running', stage='opening', progress=1)
+    image_id, czi_path = job.image_id, job.file_path
+
+    def progress(stage, percent):
+        _update_job(job, stage=stage, progress=percent)
+
+    try:
+        duplicate = find_duplicate_image(job.content_hash)
+        if duplicate is not None:
+            # İş kuyruktayken aynı içerik başka bir yüklemeyle eklenmiş: yeniden işleme, mevcut görüntüye bağla
+            if os.path.exists(czi_path): os.remove(czi_path)
+            _update_job(job, status='done', stage='duplicate', progress=100,
+                        image_id=duplicate.id, detection_count=len(duplicate.detections))
+            return
+        version = model_version(config)
+        cached = lookup_processing_cache(job.content_hash, version, config['PROCESSING_CACHE_FOLDER'])
+        metadata, preview_path, detections = process_or_reuse(
+            job.file_path, job.image_id, config, cached=cached, progress_callback=progress
+        )
+        progress('saving_db', 90)
+        store_ingest_result(
+            job.image_id, job.file_path, job.user_id,
+            metadata, preview_path, detections, content_hash=job.content_hash, detection_model_version=version
+        )
+        if cached is None:
+            cache_ingest_result(job.content_hash, version, metadata, preview_path, detections, config)
+        _update_job(job, status='done', stage='done', progress=100, detection_count=len(detections))
+    except Exception as e:
+        db.session.rollback()
+        cleanup_failed_ingest(image_id, czi_path, config)
+        print(f"HATA: Yükleme işi {job_id} ({image_id}) işlenemedi: {e}")
+        job = IngestJob.query.get(job_id)
+        _update_job(job, status='failed', stage='failed', error=str(e))
+
+
+# =====================================================================
+# ===  TOPLU KLASÖR İÇE AKTARMA (flask ingest)
+# =====================================================================
+
+_worker_config = None
+
+
+def _init_ingest_worker(config, threads_per_worker):
+    """Her işçi süreci için bir kez çalışır; modeli süreç başına bir kez yükler."""
+    global _worker_config
+    _worker_config = config
+    # Torch/OpenMP, işçi sayısı x çekirdek kadar thread açmasın
+    for var in ('OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS'):
+        os.environ[var] = str(threads_per_worker)
+    if not config.get('YOLO_ONNX_THREADS'):
+        config['YOLO_ONNX_THREADS'] = threads_per_worker  # onnxruntime bu ortam değişkenlerini okumaz
+    service_from_config(config)
+
+
+def _ingest_worker(task):
+    """Yükleme klasörüne kopyalanmış tek bir .czi dosyasını işçi sürecinde işler (DB'ye dokunmaz)."""
+    image_id, source_path, dest_path, content_hash, cached = task
+    config = _worker_config
+    try:
+        metadata, preview_path, detections = process_or_reuse(dest_path, image_id, config, cached=cached)
+        return {'ok': True, 'image_id': image_id, 'file_path': dest_path,
+                'content_hash': content_hash, 'cached': cached is not None,
+                'metadata': metadata, 'preview_path': preview_path, 'detections': detections}
+    except Exception as e:
+        cleanup_failed_ingest(image_id, dest_path, config)
+        return {'ok': False, 'image_id': image_id, 'source_path': source_path, 'error': str(e)}
+
+
+def image_id_for_file(path):
+    """
+    Dosya adı + değişiklik zamanından deterministik bir görüntü ID'si üretir;
+    aynı dosya tekrar içe aktarıldığında aynı ID çıkar (kaldığı yerden devam için).
+    """
+    base_name = os.path.splitext(secure_filename(os.path.basename(path)))[0]
+    timestamp = datetime.fromtimestamp(os.path.getmtime(path)).strftime('%Y%m%d%H%M%S')
+    return f"{base_name}_{timestamp}"
+
+
+def find_czi_files(directory, recursive=True):
+    found = []
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for name in sorted(files):
+            if name.lower().endswith('.czi'):
+                found.append(os.path.join(root, name))
+        if not recursive:
+            break
+    return found
+
+
+def ingest_directory(directory, config, uploader_id=None, workers=None, batch_size=20,
+                     recursive=True, threads_per_worker=1, log=print):
+    """
+    Klasördeki tüm .czi dosyalarını süreç havuzunda paralel işler.
+
+    Dosyalar önce thread havuzunda yükleme klasörüne geçici adla kopyalanır; SHA-256 özeti
+    kopyalarken hesaplanır (kaynak tek kez okunur). Sonuçlar `batch_size`'lık gruplar halinde
+    tek transaction ile yazılır. Veritabanında zaten bulunan görüntüler (aynı id ya da aynı
+    içerik özeti) atlanır; böylece yarıda kalan bir içe aktarma aynı komutla kaldığı yerden
+    devam eder. İşleme sonucu önbellekte olan dosyalar için model çalıştırılmaz.
+    Aynı dosyalar üzerinde eşzamanlı çalışan iki ingest komutu desteklenmez.
+    """
+    files = find_czi_files(directory, recursive=recursive)
+    version = model_version(config)
+    workers = workers or os.cpu_count() or 1
+    candidates, seen_ids, seen_hashes = [], set(), set()
+    skipped = 0
+    for path in files:
+        image_id = image_id_for_file(path)
+        if image_id in seen_ids or Image.query.get(image_id) is not None:
+            skipped += 1
+            continue
+        seen_ids.add(image_id)
+        candidates.append((image_id, path))
+
+    def stage(candidate):
+        # Görüntü id'siyle adlandırılan dosyalara işçiye gönderilene kadar dokunulmaz
+        image_id, path = candidate
+        staging_path = os.path.join(config['UPLOAD_FOLDER'], f"{image_id}.czi.ingest")
+        try:
+            content_hash, _ = copy_file_hashed(path, staging_path)
+            return staging_path, content_hash, None
+        except OSError as e:
+            return staging_path, None, str(e)
+
+    # Kopyalama ve özet paralel: dosya G/Ç'si ve hashlib büyük bloklarda GIL'i bırakır
+    with ThreadPoolExecutor(max_workers=workers) as copier:
+        staged = list(copier.map(stage, candidates))
+
+    tasks, failed = [], []
+    for (image_id, path), (staging_path, content_hash, error) in zip(candidates, staged):
+        if error is not None:
+            failed.append((image_id, f"Kopyalanamadı: {error}"))
+            log(f"  HATA: {path} kopyalanamadı: {error}")
+            continue
+        if content_hash in seen_hashes or find_duplicate_image(content_hash) is not None:
+            os.remove(staging_path)
+            skipped += 1
+            continue
+        seen_hashes.add(content_hash)
+        cached = lookup_processing_cache(content_hash, version, config['PROCESSING_CACHE_FOLDER'])
+        tasks.append((image_id, path, staging_path, content_hash, cached))
+    db.session.commit()  # Önbellek isabet sayaçları
+
+    log(f"{len(files)} .czi dosyası bulundu, {skipped} tanesi zaten içe aktarılmış, {len(tasks)} işlenecek.")
+    if not tasks:
+        return {'found': len(files), 'skipped': skipped, 'ingested': 0, 'failed': failed}
+
+    # İşçi süreçlere sadece düz konfigürasyon değerleri (büyük harfli anahtarlar) aktarılır
+    worker_config = {key: value for key, value in config.items() if key.isupper()}
+
+    ingested, pending = 0, []
+
+    def claim(task):
+        """
+        İşçiye göndermeden hemen önce id ve özeti yeniden kontrol eder. Bu arada başka bir
+        yoldan (web yüklemesi) eklenmişse mevcut kaydın dosyalarına dokunmadan atlanır;
+        yoksa geçici kopya `{image_id}.czi` adına taşınır ve işçi görevi döner.
+        """
+        nonlocal skipped
+        image_id, source_path, staging_path, content_hash, cached = task
+        db.session.commit()  # Diğer süreçlerin yazdıklarını görmek için okuma transaction'ı kapatılır
+        if Image.query.get(image_id) is not None or find_duplicate_image(content_hash) is not None:
+            os.remove(staging_path)
+            skipped += 1
+            return None
+        dest_path = os.path.join(config['UPLOAD_FOLDER'], f"{image_id}.czi")
+        os.replace(staging_path, dest_path)
+        return image_id, source_path, dest_path, content_hash, cached
+
+    def flush():
+        nonlocal ingested
+        if not pending:
+            return
+        written = []
+        try:
+            for result in pending:
+                # İşlenirken aynı id ya da içerik eklenmişse (eşzamanlı ikinci bir ingest) yazılmaz.
+                # Aynı id'de çıktılar artık diğer kayıtla aynı adları taşıdığı için silinmez.
+                if Image.query.get(result['image_id']) is not None:
+                    failed.append((result['image_id'], 'İşlenirken aynı id ile başka bir görüntü eklendi.'))
+                    continue
+                if find_duplicate_image(result['content_hash']) is not None:
+                    cleanup_failed_ingest(result['image_id'], result['file_path'], config)
+                    failed.append((result['image_id'], 'İşlenirken aynı içerik başka bir görüntü olarak eklendi.'))
+                    continue
+                written.append(result)
+                store_ingest_result(
+                    result['image_id'], result['file_path'], uploader_id,
+                    result['metadata'], result['preview_path'], result['detections'],
+                    content_hash=result['content_hash'], detection_model_version=version
+                )
+                if not result['cached']:
+                    cache_ingest_result(
+                        result['content_hash'], version, result['metadata'],
+                        result['preview_path'], result['detections'], config
+                    )
+            db.session.commit()
+            ingested += len(written)
+            log(f"  {ingested}/{len(tasks)} görüntü veritabanına yazıldı.")
+        except Exception as e:
+            db.session.rollback()
+            for result in written:
+                cleanup_failed_ingest(result['image_id'], result['file_path'], config)
+                failed.append((result['image_id'], f"Veritabanı hatası: {e}"))
+        pending.clear()
+
+    def handle(result):
+        if result['ok']:
+            pending.append(result)
+            if len(pending) >= batch_size:
+                flush()
+        else:
+            failed.append((result['image_id'], result['error']))
+            log(f"  HATA: {result['source_path']} işlenemedi: {result['error']}")
+
+    # İşler havuza toplu değil, boşaldıkça gönderilir; böylece kontrol ile işleme arası kısa kalır
+    waiting, in_flight = deque(tasks), set()
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_init_ingest_worker,
+        initargs=(worker_config, threads_per_worker)
+    ) as executor:
+        while waiting or in_flight:
+            while waiting and len(in_flight) < workers * 2:
+                task = claim(waiting.popleft())
+                if task is not None:
+                    in_flight.add(executor.submit(_ingest_worker, task))
+            if not in_flight:
+                continue
+            done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                handle(future.result())
+        flush()
+
+    return {'found': len(files), 'skipped': skipped, 'ingested': ingested, 'failed': failed}
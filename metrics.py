@@ -0,0 +1,256 @@
+# metrics.py
+import re
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager, nullcontext
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+
+from models import db
+
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+SIZE_BUCKETS = tuple(1024 * 1024 * 4 ** power for power in range(8))  # 1 MB ... 16 GB
+BATCH_BUCKETS = (1, 2, 4, 8, 16, 32, 64)
+ATTEMPT_BUCKETS = (1, 2, 3, 4, 5, 10)
+_NAME_PATTERN = re.compile(r'^[a-zA-Z_:][a-zA-Z0-9_:]*$')
+
+
+class MetricError(ValueError):
+    """Geçersiz metrik adı, yinelenen kayıt ya da eksik/fazla etiket."""
+
+
+# --- Prometheus Metin Biçimi ---
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, int) or float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _sample_line(name, labels, value):
+    if labels:
+        rendered = ','.join(f'{key}="{_escape(label)}"' for key, label in labels)
+        return f'{name}{{{rendered}}} {_format_value(value)}'
+    return f'{name} {_format_value(value)}'
+
+
+class Registry:
+    """Süreç içi metrik kaydı; `render()` tüm metrikleri Prometheus metin biçiminde döndürür."""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise MetricError(f"Metrik zaten kayıtlı: {metric.name}")
+            self._metrics[metric.name] = metric
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.type_name}')
+            lines.extend(_sample_line(name, labels, value) for name, labels, value in metric.samples())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+
+class Histogram:
+    """
+    Etiket kümesi başına kova (bucket) sayıları, toplam ve gözlem sayısı tutan histogram.
+    Kovalar gözlem anında birikimsiz tutulur; metin çıktısında birikimli (`le`) yazılır.
+    """
+    type_name = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DURATION_BUCKETS, registry=REGISTRY):
+        if not _NAME_PATTERN.match(name):
+            raise MetricError(f"Geçersiz metrik adı: {name}")
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(float(bound) for bound in buckets))
+        self._values = {}
+        self._lock = threading.Lock()
+        if registry is not None:
+            registry.register(self)
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise MetricError(f"{self.name} etiketleri {self.labelnames} olmalı: {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][index] += 1
+            state[1] += value
+
+    def samples(self):
+        with self._lock:
+            items = sorted((key, list(counts), total) for key, (counts, total) in self._values.items())
+        for key, counts, total in items:
+            labels = list(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                yield f'{self.name}_bucket', labels + [('le', _format_value(bound))], cumulative
+            yield f'{self.name}_sum', labels, total
+            yield f'{self.name}_count', labels, cumulative
+
+
+# --- Aşama Süreleri ---
+class StageTimer:
+    """
+    Bir işin aşama sürelerini toplar. İç içe ölçülen aşamanın süresi dıştaki aşamadan düşülür;
+    böylece örn. 'normalize' içinde okunan düzlemlerin süresi sadece 'plane_read'e yazılır.
+    Tek thread içinde kullanılır.
+    """
+
+    def __init__(self):
+        self.durations = {}
+        self._children = []
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        self._children.append(0.0)
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            own = elapsed - self._children.pop()
+            self.durations[name] = self.durations.get(name, 0.0) + own
+            if self._children:
+                self._children[-1] += elapsed
+
+    def observe(self, histogram):
+        for name, seconds in self.durations.items():
+            histogram.observe(seconds, stage=name)
+
+    def rounded(self, digits=3):
+        return {name: round(seconds, digits) for name, seconds in self.durations.items()}
+
+
+def measure(timer, name):
+    """`timer` None ise hiçbir şey ölçmeyen bağlam."""
+    return timer.stage(name) if timer is not None else nullcontext()
+
+
+# --- Uygulama Metrikleri ---
+PROCESSING_STAGE_SECONDS = Histogram(
+    'czi_processing_stage_seconds',
+    'CZI işleme aşamalarının süresi (open, metadata, plane_read, normalize, preview_save, tiles, '
+    'detect, crops) ve çıkarım servisinin model_load / inference süreleri.',
+    ['stage']
+)
+PROCESSING_SECONDS = Histogram('czi_processing_seconds', 'Bir CZI dosyasının toplam işleme süresi.')
+PROCESSING_PEAK_RSS_BYTES = Histogram(
+    'czi_processing_peak_rss_bytes', 'Bir CZI dosyası işlenirken sürecin en yüksek bellek kullanımı (RSS).',
+    buckets=SIZE_BUCKETS
+)
+INFERENCE_BATCH_SIZE = Histogram(
+    'inference_batch_size', 'Çıkarım servisinin tek predict çağrısındaki önizleme sayısı.', buckets=BATCH_BUCKETS
+)
+HTTP_REQUEST_SECONDS = Histogram(
+    'http_request_duration_seconds',
+    'İstek süresi (akış yanıtlarında ilk bayta kadar).', ['method', 'route', 'status']
+)
+HTTP_REQUEST_SQL_QUERIES = Histogram(
+    'http_request_sql_queries', 'İstek başına çalıştırılan SQL sorgusu sayısı.', ['route'],
+    buckets=QUERY_COUNT_BUCKETS
+)
+HTTP_REQUEST_SQL_SECONDS = Histogram(
+    'http_request_sql_seconds', 'İstek başına SQL sorgularında geçen toplam süre.', ['route']
+)
+SCORE_WRITE_ATTEMPTS = Histogram(
+    'score_write_attempts',
+    'Puan yazımının kaç denemede sonuçlandığı (result: committed / gave_up); 1\'den büyük '
+    'değerler SQLite kilit çakışmasıdır.', ['result'], buckets=ATTEMPT_BUCKETS
+)
+UPLOAD_BYTES = Histogram(
+    'upload_size_bytes', 'Yüklenen CZI dosyalarının boyutu (result: queued / duplicate).', ['result'],
+    buckets=SIZE_BUCKETS
+)
+
+
+def request_route():
+    # Etiket kardinalitesi sınırlı kalsın diye gerçek yol değil, URL kuralı kullanılır
+    return request.url_rule.rule if request.url_rule is not None else 'unmatched'
+
+
+def init_request_metrics(app):
+    """
+    Her istek için süreyi, SQL sorgu sayısını ve sorgu süresini ölçer.
+    Sorgular motor düzeyindeki cursor olaylarıyla sayılır; istek dışında (arka plan işleri)
+    çalışan sorgular istek metriklerine yazılmaz.
+    Metrikler süreç içinde tutulur; birden çok süreçle çalışan sunucularda her süreç kendi
+    değerlerini raporlar.
+    """
+
+    @app.before_request
+    def start_request_metrics():
+        g.request_metrics = {'started': time.perf_counter(), 'queries': 0, 'sql_seconds': 0.0}
+
+    def observe_request(status):
+        state = g.pop('request_metrics', None)
+        if state is None:
+            return
+        route = request_route()
+        HTTP_REQUEST_SECONDS.observe(
+            time.perf_counter() - state['started'], method=request.method, route=route, status=status
+        )
+        HTTP_REQUEST_SQL_QUERIES.observe(state['queries'], route=route)
+        HTTP_REQUEST_SQL_SECONDS.observe(state['sql_seconds'], route=route)
+
+    @app.after_request
+    def finish_request_metrics(response):
+        observe_request(response.status_code)
+        return response
+
+    @app.teardown_request
+    def finish_failed_request_metrics(exc):
+        # Yakalanmayan hata yayıldığında (debug / PROPAGATE_EXCEPTIONS) after_request çalışmaz;
+        # ölçüm burada 500 olarak yazılır. after_request çalıştıysa durum zaten alınmıştır.
+        observe_request(500)
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info['query_started'].pop()
+        if has_request_context():
+            state = g.get('request_metrics')
+            if state is not None:
+                state['queries'] += 1
+                state['sql_seconds'] += time.perf_counter() - started
+
+    def handle_error(context):
+        # Hata veren sorgunun başlangıç zamanı yığında kalmasın
+        started = context.connection.info.get('query_started') if context.connection is not None else None
+        if started:
+            started.pop()
+
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+        event.listen(db.engine, 'after_cursor_execute', after_cursor_execute)
+        event.listen(db.engine, 'handle_error', handle_error)
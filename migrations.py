@@ -0,0 +1,239 @@
+# migrations.py
+import os
+import sqlite3
+from datetime import datetime
+from itertools import groupby
+
+from sqlalchemy import event
+
+from models import db, Image, Detection, Score, ImageAssignment, DetectionConsensus, ImageConsensus
+from consensus import consensus_records
+
+
+# --- Bağlantı Düzeyinde SQLite Ayarları ---
+def init_sqlite_pragmas(app):
+    """
+    Her yeni SQLite bağlantısında WAL günlüğü, busy_timeout ve synchronous ayarlarını uygular.
+    WAL ile okuyucular yazıcıyı beklemez; busy_timeout eşzamanlı yazmalarda anında
+    "database is locked" hatası yerine kilidin açılmasını bekletir.
+    """
+    journal_mode = app.config.get('SQLITE_JOURNAL_MODE', 'WAL')
+    busy_timeout = int(app.config.get('SQLITE_BUSY_TIMEOUT_MS', 5000))
+    synchronous = app.config.get('SQLITE_SYNCHRONOUS', 'NORMAL')
+
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            if journal_mode:
+                cursor.execute(f"PRAGMA journal_mode = {journal_mode}")
+            cursor.execute(f"PRAGMA busy_timeout = {busy_timeout}")
+            if synchronous:
+                cursor.execute(f"PRAGMA synchronous = {synchronous}")
+        finally:
+            cursor.close()
+
+    with app.app_context():
+        if db.engine.dialect.name == 'sqlite':
+            event.listen(db.engine, 'connect', set_pragmas)
+
+
+# --- Sürümlü Şema Göçleri (PRAGMA user_version) ---
+def _create_index(conn, name, table, columns):
+    conn.exec_driver_sql(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({', '.join(columns)})")
+
+
+def _add_foreign_key_indexes(conn):
+    # İsimler SQLAlchemy'nin `index=True` ile ürettiği isimlerle aynıdır; yeni kurulumlarda
+    # `create_all` aynı indeksleri zaten oluşturduğu için bu adım tekrar çalışsa da zararsızdır.
+    _create_index(conn, 'ix_detections_parent_image_id', 'detections', ['parent_image_id'])
+    _create_index(conn, 'ix_scores_user_id', 'scores', ['user_id'])
+    _create_index(conn, 'ix_scores_detection_id', 'scores', ['detection_id'])
+    _create_index(conn, 'ix_image_assignments_expert_id', 'image_assignments', ['expert_id'])
+    _create_index(conn, 'ix_images_uploader_id', 'images', ['uploader_id'])
+    _create_index(conn, 'ix_ingest_jobs_user_id', 'ingest_jobs', ['user_id'])
+
+
+def _add_detection_sequence(conn):
+    columns = [row[1] for row in conn.exec_driver_sql("PRAGMA table_info(images)")]
+    if 'detection_seq' not in columns:
+        conn.exec_driver_sql("ALTER TABLE images ADD COLUMN detection_seq INTEGER NOT NULL DEFAULT 0")
+    # Sayacı mevcut tespitlerin en büyük `{image_id}_{n}` numarasından başlat
+    conn.exec_driver_sql(
+        "UPDATE images SET detection_seq = COALESCE(("
+        " SELECT MAX(CAST(substr(d.id, length(images.id) + 2) AS INTEGER))"
+        " FROM detections d WHERE d.parent_image_id = images.id), 0)"
+    )
+
+
+def _backfill_consensus(conn):
+    # Tablolar `create_all` ile oluşur; burada mevcut puanlardan ilk konsensüs satırları üretilir
+    conn.execute(DetectionConsensus.__table__.delete())
+    conn.execute(ImageConsensus.__table__.delete())
+    rows = conn.exec_driver_sql(
+        "SELECT d.parent_image_id, s.detection_id, s.user_id, s.grade,"
+        " s.score_sitoplazma, s.score_zona, s.score_kumulus, s.score_oopla"
+        " FROM scores s JOIN detections d ON s.detection_id = d.id"
+        " WHERE s.user_id IS NOT NULL ORDER BY d.parent_image_id"
+    ).all()
+    now = datetime.utcnow()
+    for image_id, image_rows in groupby(rows, key=lambda row: row[0]):
+        detection_records, image_record = consensus_records(image_id, [tuple(row[1:]) for row in image_rows], now)
+        conn.execute(DetectionConsensus.__table__.insert(), detection_records)
+        conn.execute(ImageConsensus.__table__.insert(), [image_record])
+
+
+METADATA_COLUMNS = [
+    ('objective_name', 'VARCHAR(200)'), ('acquisition_date', 'DATE'), ('scale_um_per_pixel', 'FLOAT'),
+    ('channel_count', 'INTEGER'), ('size_x', 'INTEGER'), ('size_y', 'INTEGER'), ('pixel_type', 'VARCHAR(20)'),
+]
+
+
+def _add_metadata_columns(conn):
+    # Değerler `flask reindex-metadata` ile CZI başlıklarından doldurulur
+    columns = [row[1] for row in conn.exec_driver_sql("PRAGMA table_info(images)")]
+    for name, column_type in METADATA_COLUMNS:
+        if name not in columns:
+            conn.exec_driver_sql(f"ALTER TABLE images ADD COLUMN {name} {column_type}")
+    for name in ('objective_name', 'acquisition_date', 'scale_um_per_pixel', 'channel_count'):
+        _create_index(conn, f'ix_images_{name}', 'images', [name])
+    # Çekim tarihine göre sıralı sayfalama (image_listing SORTS) ifadesiyle birebir aynı
+    _create_index(conn, 'ix_images_acquisition_sort', 'images', ["coalesce(acquisition_date, '')", 'id'])
+
+
+def _add_content_hash_columns(conn):
+    # processing_cache tablosu `create_all` ile oluşur; eski yüklemelerin özetleri
+    # `flask hash-uploads` ile doldurulur (göç sırasında dosyalar okunmaz)
+    for table in ('images', 'ingest_jobs'):
+        columns = [row[1] for row in conn.exec_driver_sql(f"PRAGMA table_info({table})")]
+        if 'content_hash' not in columns:
+            conn.exec_driver_sql(f"ALTER TABLE {table} ADD COLUMN content_hash VARCHAR(64)")
+        _create_index(conn, f'ix_{table}_content_hash', table, ['content_hash'])
+
+
+def _add_detection_model_version(conn):
+    # Eski görüntüler NULL kalır; `flask redetect` ilk çalıştırmada hepsini işler
+    columns = [row[1] for row in conn.exec_driver_sql("PRAGMA table_info(images)")]
+    if 'detection_model_version' not in columns:
+        conn.exec_driver_sql("ALTER TABLE images ADD COLUMN detection_model_version VARCHAR(64)")
+    _create_index(conn, 'ix_images_detection_model_version', 'images', ['detection_model_version'])
+
+
+def _add_ingest_job_owner(conn):
+    # Eski işlerin sahibi NULL kalır; kalp atışları eskidiği için web süreci bunları kurtarır
+    columns = [row[1] for row in conn.exec_driver_sql("PRAGMA table_info(ingest_jobs)")]
+    if 'owner_pid' not in columns:
+        conn.exec_driver_sql("ALTER TABLE ingest_jobs ADD COLUMN owner_pid INTEGER")
+
+
+# (sürüm, açıklama, fonksiyon) — sadece sona eklenir, mevcut adımlar değiştirilmez
+MIGRATIONS = [
+    (1, 'Birleştirme (join) sütunlarına indeks ekle', _add_foreign_key_indexes),
+    (2, 'Görüntü başına tespit numarası sayacı ekle', _add_detection_sequence),
+    (3, 'Uzmanlar arası konsensüs tablolarını doldur', _backfill_consensus),
+    (4, 'Sorgulanabilir CZI metadata sütunları ve indeksleri ekle', _add_metadata_columns),
+    (5, 'Yükleme içerik özeti (SHA-256) sütunlarını ekle', _add_content_hash_columns),
+    (6, 'Tespitleri üreten model sürümü sütununu ekle', _add_detection_model_version),
+    (7, 'Yükleme işine sahip süreç sütununu ekle', _add_ingest_job_owner),
+]
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def schema_version(conn):
+    return conn.exec_driver_sql("PRAGMA user_version").scalar()
+
+
+def backup_database(engine, database_path):
+    """Çalışan veritabanının tutarlı bir kopyasını SQLite backup API'si ile alır."""
+    backup_path = f"{database_path}.bak-{datetime.now().strftime('%Y%m%d%H%M%S')}"
+    raw_connection = engine.raw_connection()
+    target = sqlite3.connect(backup_path)
+    try:
+        raw_connection.driver_connection.backup(target)
+    finally:
+        target.close()
+        raw_connection.close()
+    return backup_path
+
+
+def migrate(engine, backup=True, log=print):
+    """
+    Eksik tabloları oluşturur ve `user_version`'dan yeni olan göç adımlarını sırayla uygular.
+    Her adım kendi transaction'ında çalışır; sürüm numarası adımla birlikte yazılır, böylece
+    yarıda kalan bir göç tekrar çalıştırıldığında kaldığı yerden devam eder.
+    Dönüş: (başlangıç sürümü, son sürüm)
+    """
+    db.metadata.create_all(engine)
+    with engine.connect() as conn:
+        start_version = schema_version(conn)
+    pending = [m for m in MIGRATIONS if m[0] > start_version]
+    if not pending:
+        return start_version, start_version
+
+    database_path = engine.url.database
+    if backup and database_path and database_path != ':memory:' and os.path.exists(database_path):
+        log(f"Yedek alındı: {backup_database(engine, database_path)}")
+
+    for version, description, apply in pending:
+        with engine.begin() as conn:
+            apply(conn)
+            conn.exec_driver_sql(f"PRAGMA user_version = {int(version)}")
+        log(f"  v{version}: {description}")
+    return start_version, pending[-1][0]
+
+
+# --- Sorgu Planı Kontrolü ---
+def hot_queries():
+    """(ad, ORM sorgusu, beklenen indeksler) — annotate, panel istatistikleri ve dışa aktarımlar."""
+    return [
+        ('annotate: görüntünün tespitleri',
+         Detection.query.filter(Detection.parent_image_id == 'x'),
+         ['ix_detections_parent_image_id']),
+        ('annotate: uzmanın puanları',
+         Score.query.filter(Score.user_id == 1, Score.detection_id.in_(['a', 'b'])),
+         ['ix_scores_user_id', 'ix_scores_detection_id', 'sqlite_autoindex_scores_1']),
+        ('detay: tespitin puanları',
+         Score.query.filter(Score.detection_id == 'x'),
+         ['ix_scores_detection_id', 'sqlite_autoindex_scores_1']),
+        ('panel: uzmana atanan görüntüler',
+         ImageAssignment.query.filter(ImageAssignment.expert_id == 1),
+         ['ix_image_assignments_expert_id']),
+        ('panel: uzmanın puanladığı görüntü sayısı',
+         db.session.query(db.func.count(db.distinct(Detection.parent_image_id)))
+         .join(Score, Score.detection_id == Detection.id).filter(Score.user_id == 1),
+         ['ix_scores_user_id']),
+        ('liste: görüntünün puanlayan sayısı',
+         db.session.query(db.func.count(db.distinct(Score.user_id)))
+         .join(Detection, Score.detection_id == Detection.id)
+         .filter(Detection.parent_image_id == 'x'),
+         ['ix_detections_parent_image_id']),
+        ('katalog: objektife göre',
+         Image.query.filter(Image.objective_name == 'x'),
+         ['ix_images_objective_name']),
+        ('katalog: çekim tarihi aralığı',
+         Image.query.filter(Image.acquisition_date >= db.func.date('2025-01-01')),
+         ['ix_images_acquisition_date']),
+        ('katalog: kanal sayısına göre',
+         Image.query.filter(Image.channel_count == 3),
+         ['ix_images_channel_count']),
+        ('yükleme: aynı içerikli görüntü',
+         Image.query.filter(Image.content_hash == 'x'),
+         ['ix_images_content_hash']),
+        ('liste: yüklenen görüntüler',
+         Image.query.filter(Image.uploader_id == 1).order_by(Image.id.desc()),
+         ['ix_images_uploader_id']),
+    ]
+
+
+def explain_query_plans(engine):
+    """
+    Sıcak sorguları `EXPLAIN QUERY PLAN` ile çalıştırır.
+    Dönüş: [(ad, plan satırları, beklenen indeks kullanıldı mı), ...]
+    """
+    results = []
+    with engine.connect() as conn:
+        for name, query, expected_indexes in hot_queries():
+            sql = str(query.statement.compile(engine, compile_kwargs={'literal_binds': True}))
+            plan = [row[-1] for row in conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {sql}")]
+            uses_index = any(index in line for line in plan for index in expected_indexes)
+            results.append((name, plan, uses_index))
+    return results
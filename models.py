@@ -9,7 +9,7 @@ class ImageAssignment(db.Model):
     __tablename__ = 'image_assignments'
     id = db.Column(db.Integer, primary_key=True)
     image_id = db.Column(db.String(300), db.ForeignKey('images.id'), nullable=False)
-    expert_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False) 
+    expert_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False, index=True)
     assigned_at = db.Column(db.DateTime, server_default=func.now())
     __table_args__ = (db.UniqueConstraint('image_id', 'expert_id', name='_image_expert_uc'),)
 
@@ -31,7 +31,23 @@ class Image(db.Model):
     file_path = db.Column(db.String(500), nullable=False) 
     preview_path = db.Column(db.String(500), nullable=False) 
     metadata_json = db.Column(db.JSON, nullable=True) 
-    uploader_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='SET NULL'), nullable=True)
+    uploader_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='SET NULL'), nullable=True, index=True)
+    # Son ayrılan tespit numarası; yeni tespit id'leri `{id}_{n}` bu sayaçtan atomik olarak alınır
+    detection_seq = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+
+    # CZI başlığından okunan, filtrelenebilir (indeksli) metadata sütunları
+    objective_name = db.Column(db.String(200), nullable=True, index=True)
+    acquisition_date = db.Column(db.Date, nullable=True, index=True)
+    scale_um_per_pixel = db.Column(db.Float, nullable=True, index=True)   # Özgün (küçültülmemiş) ölçek
+    channel_count = db.Column(db.Integer, nullable=True, index=True)
+    size_x = db.Column(db.Integer, nullable=True)
+    size_y = db.Column(db.Integer, nullable=True)
+    pixel_type = db.Column(db.String(20), nullable=True)
+
+    # Yüklenen .czi dosyasının SHA-256 özeti; aynı dosyanın tekrar yüklenmesini tanımak için
+    content_hash = db.Column(db.String(64), nullable=True, index=True)
+    # Tespitleri son üreten model sürümü (processing_cache.model_version); yeniden tespit kaldığı yeri bundan bilir
+    detection_model_version = db.Column(db.String(64), nullable=True, index=True)
 
     detections = db.relationship('Detection', backref='parent_image', lazy=True, cascade="all, delete-orphan")
     assignments = db.relationship('ImageAssignment', backref='image', lazy=True, cascade="all, delete-orphan")
@@ -40,7 +56,7 @@ class Image(db.Model):
 class Detection(db.Model):
     __tablename__ = 'detections'
     id = db.Column(db.String(350), primary_key=True) 
-    parent_image_id = db.Column(db.String(300), db.ForeignKey('images.id'), nullable=False)
+    parent_image_id = db.Column(db.String(300), db.ForeignKey('images.id'), nullable=False, index=True)
     coordinates_labelme = db.Column(db.JSON, nullable=False)
     scores = db.relationship('Score', backref='detection', lazy=True, cascade="all, delete-orphan")
 
@@ -48,8 +64,8 @@ class Detection(db.Model):
 class Score(db.Model):
     __tablename__ = 'scores'
     id = db.Column(db.Integer, primary_key=True)
-    detection_id = db.Column(db.String(350), db.ForeignKey('detections.id'), nullable=False)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='SET NULL'), nullable=True)
+    detection_id = db.Column(db.String(350), db.ForeignKey('detections.id'), nullable=False, index=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='SET NULL'), nullable=True, index=True)
     
     # === YENİ SÜTUN: A, B, C, D Sınıflaması ===
     grade = db.Column(db.String(1), nullable=True)
@@ -61,4 +77,81 @@ class Score(db.Model):
     score_oopla = db.Column(db.Integer)
     
     timestamp = db.Column(db.DateTime, server_default=func.now())
-    __table_args__ = (db.UniqueConstraint('detection_id', 'user_id', name='_detection_user_uc'),)
\ No newline at end of file
+    __table_args__ = (db.UniqueConstraint('detection_id', 'user_id', name='_detection_user_uc'),)
+
+
+# === YENİ: Arka Plan İşleme Kuyruğu İçin Yükleme İşleri ===
+class IngestJob(db.Model):
+    __tablename__ = 'ingest_jobs'
+    id = db.Column(db.String(32), primary_key=True)
+    image_id = db.Column(db.String(300), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='SET NULL'), nullable=True, index=True)
+    original_filename = db.Column(db.String(300), nullable=True)
+    file_path = db.Column(db.String(500), nullable=False)
+    content_hash = db.Column(db.String(64), nullable=True, index=True)
+    # İşi en son kuyruğuna alan web sürecinin PID'si (tanı amaçlı). Sahipsiz işler PID'ye değil,
+    # sahibin düzenli tazelediği `updated_at` kalp atışının eskimesine bakılarak bulunur.
+    owner_pid = db.Column(db.Integer, nullable=True)
+
+    # queued -> running -> done / failed (aynı içerik zaten yüklüyse stage='duplicate', image_id mevcut görüntü)
+    status = db.Column(db.String(20), nullable=False, default='queued')
+    stage = db.Column(db.String(50), nullable=True)
+    progress = db.Column(db.Integer, nullable=False, default=0)
+    detection_count = db.Column(db.Integer, nullable=True)
+    error = db.Column(db.Text, nullable=True)
+
+    created_at = db.Column(db.DateTime, server_default=func.now())
+    updated_at = db.Column(db.DateTime, server_default=func.now())
+
+
+# === YENİ: Uzmanlar Arası Konsensüs (puan yazıldıkça görüntü bazında yeniden hesaplanır) ===
+class DetectionConsensus(db.Model):
+    __tablename__ = 'detection_consensus'
+    detection_id = db.Column(db.String(350), db.ForeignKey('detections.id', ondelete='CASCADE'), primary_key=True)
+    image_id = db.Column(db.String(300), db.ForeignKey('images.id', ondelete='CASCADE'), nullable=False, index=True)
+    rater_count = db.Column(db.Integer, nullable=False, default=0)
+
+    grade_majority = db.Column(db.String(1), nullable=True)   # Eşitlikte medyan not
+    grade_median = db.Column(db.String(1), nullable=True)     # Alt medyan
+    grade_agreement = db.Column(db.Float, nullable=True)      # Çoğunluk notunu veren uzman oranı
+
+    # Her kriter için ortalama, standart sapma ve (etiket olarak kullanılan) alt medyan
+    sitoplazma_mean = db.Column(db.Float)
+    sitoplazma_std = db.Column(db.Float)
+    sitoplazma_median = db.Column(db.Integer)
+    zona_mean = db.Column(db.Float)
+    zona_std = db.Column(db.Float)
+    zona_median = db.Column(db.Integer)
+    kumulus_mean = db.Column(db.Float)
+    kumulus_std = db.Column(db.Float)
+    kumulus_median = db.Column(db.Integer)
+    oopla_mean = db.Column(db.Float)
+    oopla_std = db.Column(db.Float)
+    oopla_median = db.Column(db.Integer)
+
+    updated_at = db.Column(db.DateTime, server_default=func.now())
+
+
+class ImageConsensus(db.Model):
+    __tablename__ = 'image_consensus'
+    image_id = db.Column(db.String(300), db.ForeignKey('images.id', ondelete='CASCADE'), primary_key=True)
+    scored_detections = db.Column(db.Integer, nullable=False, default=0)
+    rater_count = db.Column(db.Integer, nullable=False, default=0)
+    fleiss_kappa = db.Column(db.Float, nullable=True)   # Genel kalite (A-D) için
+    cohen_kappa = db.Column(db.Float, nullable=True)    # Uzman çiftlerinin ortalama Cohen kappası
+    # {kriter: {'fleiss_kappa', 'cohen_kappa', 'pairs': {"u1-u2": kappa}}}
+    agreement_json = db.Column(db.JSON, nullable=True)
+    updated_at = db.Column(db.DateTime, server_default=func.now())
+
+
+# === YENİ: İşleme Sonucu Önbelleği (içerik özeti + model sürümü) ===
+class ProcessingCache(db.Model):
+    __tablename__ = 'processing_cache'
+    content_hash = db.Column(db.String(64), primary_key=True)
+    model_version = db.Column(db.String(64), primary_key=True)   # Ağırlık dosyası özeti + tespit ayarları
+    metadata_json = db.Column(db.JSON, nullable=False)
+    detections_json = db.Column(db.JSON, nullable=False)         # [coordinates_labelme, ...] (tespit sırasıyla)
+    preview_file = db.Column(db.String(300), nullable=False)     # PROCESSING_CACHE_FOLDER içindeki ana önizleme
+    hit_count = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, server_default=func.now())
+    last_used_at = db.Column(db.DateTime, server_default=func.now())
@@ -0,0 +1,120 @@
+# normalization.py
+import numpy as np
+
+
+def percentile_from_histogram(hist, q):
+    """
+    Histogramdan `np.percentile` (linear) ile birebir aynı yüzdelik değerini hesaplar.
+    hist[v] = v değerine sahip piksel sayısı. Tüm düzlemi sıralamaya gerek kalmaz.
+    """
+    cumulative = np.cumsum(hist)
+    total = int(cumulative[-1])
+    if total == 0:
+        return 0.0
+    position = q / 100.0 * (total - 1)
+    lower_rank = int(np.floor(position))
+    fraction = position - lower_rank
+    lower = int(np.searchsorted(cumulative, lower_rank, side='right'))
+    if fraction == 0:
+        return float(lower)
+    upper = int(np.searchsorted(cumulative, lower_rank + 1, side='right'))
+    return lower + fraction * (upper - lower)
+
+
+def build_lut(low, high, num_bins):
+    """[low, high] aralığını 0-255'e taşıyan uint8 arama tablosu (eski formülle aynı)."""
+    low, high = np.float32(low), np.float32(high)
+    if high == low:
+        return np.zeros(num_bins, dtype=np.uint8)
+    # İşlem sırası ve float32 hassasiyeti eski `normalize_channel` ile aynı tutulur
+    values = np.arange(num_bins, dtype=np.float32)
+    np.clip(values, low, high, out=values)
+    values -= low
+    values /= high - low
+    values *= 255
+    return values.astype(np.uint8)
+
+
+def _integer_layout(dtype):
+    """Histogram/LUT ile işlenebilen tamsayı tipleri için (kutu sayısı, ofset)."""
+    dtype = np.dtype(dtype)
+    if dtype.kind == 'u' and dtype.itemsize <= 2:
+        return 1 << (8 * dtype.itemsize), 0
+    if dtype.kind == 'i' and dtype.itemsize <= 2:
+        return 1 << (8 * dtype.itemsize), 1 << (8 * dtype.itemsize - 1)
+    return None
+
+
+class ChannelNormalizer:
+    """
+    Tek bir kanal için 2-98 yüzdelik kontrast normalizasyonu.
+
+    uint16 (ve daha küçük tamsayı) verilerde: bloklar `update` ile tek bir `bincount`
+    histogramına eklenir, `finalize` yüzdelikleri histogramdan bulup her olası giriş
+    değeri için bir uint8 çıktı tutan `num_bins` elemanlı arama tablosu (LUT; uint16 için
+    65536 eleman) kurar, `apply` sonucu float ara dizisi olmadan doğrudan uint8 çıktıya yazar. Diğer tiplerde (float vb.) alt örnek üzerinden `np.percentile`
+    ve blok bazlı float32 ölçekleme kullanılır.
+    """
+
+    def __init__(self, dtype, low=2, high=98, sample_step=1):
+        self.dtype = np.dtype(dtype)
+        self.low_q, self.high_q = low, high
+        self.sample_step = max(1, int(sample_step))
+        layout = _integer_layout(self.dtype)
+        self.num_bins, self.offset = layout if layout else (None, 0)
+        self.hist = np.zeros(self.num_bins, dtype=np.int64) if self.num_bins else None
+        self._samples = []
+        self.low = self.high = None
+        self.lut = None
+
+    @property
+    def uses_lut(self):
+        return self.num_bins is not None
+
+    def _indices(self, block):
+        return block.astype(np.int32) + self.offset if self.offset else block
+
+    def update(self, block):
+        block = block[::self.sample_step, ::self.sample_step] if self.sample_step > 1 else block
+        if self.uses_lut:
+            self.hist += np.bincount(self._indices(block).ravel(), minlength=self.num_bins)
+        else:
+            self._samples.append(np.asarray(block, dtype=np.float32).ravel())
+
+    def finalize(self):
+        if self.uses_lut:
+            low = percentile_from_histogram(self.hist, self.low_q) - self.offset
+            high = percentile_from_histogram(self.hist, self.high_q) - self.offset
+            # LUT indeksleri ofsetli değerler olduğu için aralık da ofsetli kurulur
+            self.lut = build_lut(low + self.offset, high + self.offset, self.num_bins)
+        else:
+            samples = np.concatenate(self._samples) if self._samples else np.zeros(1, np.float32)
+            low, high = np.percentile(samples, [self.low_q, self.high_q])
+            self._samples = []
+        self.low, self.high = float(low), float(high)
+        return self.low, self.high
+
+    def apply(self, block, out):
+        """Bloğu normalize edip `out` (aynı şekilli uint8 görünüm) içine yazar."""
+        if self.uses_lut:
+            np.take(self.lut, self._indices(block), out=out, mode='clip')
+            return
+        if self.high == self.low:
+            out[...] = 0
+            return
+        low, high = np.float32(self.low), np.float32(self.high)
+        data = np.clip(block.astype(np.float32), low, high)
+        data -= low
+        data /= high - low
+        data *= 255
+        out[...] = data.astype(np.uint8)
+
+    def normalize(self, data, out=None):
+        """Bellekteki tüm düzlem için kısayol: histogram + LUT tek çağrıda."""
+        if out is None:
+            out = np.empty(data.shape, dtype=np.uint8)
+        self.update(data)
+        self.finalize()
+        self.apply(data, out)
+        return out
+
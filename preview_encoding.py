@@ -0,0 +1,111 @@
+# preview_encoding.py
+import os
+
+from PIL import Image as PILImage
+
+
+# Biçim adı -> (dosya uzantısı, PIL biçimi)
+FORMATS = {
+    'png': ('png', 'PNG'),
+    'webp': ('webp', 'WEBP'),
+    'jpeg': ('jpg', 'JPEG'),
+}
+LOSSLESS_FORMATS = ('png', 'webp')
+DISPLAY_SUFFIX = '_display'
+
+
+class PreviewEncoding:
+    """
+    Önizleme kodlama ayarları.
+
+    Ana kopya (master) kayıpsızdır: kırpmalar, veri seti ve LabelMe dışa aktarımı onu kullanır.
+    PNG'de zlib seviyesi (0-9) kodlama süresini belirler; 1, varsayılan 6'ya göre çok daha hızlı
+    kodlar ve boyut farkı genelde küçüktür. WebP ana kopya `lossless=True` ile yazılır.
+    Görüntüleme kopyası (display) en uzun kenarı `display_max_size` olacak şekilde küçültülür
+    ve kayıplı (progresif JPEG / WebP) ya da PNG olarak yazılır; `display_format` None ise üretilmez.
+    """
+
+    def __init__(self, master_format='png', png_compress_level=1, webp_method=4,
+                 display_format='jpeg', display_max_size=2048, display_quality=85):
+        if master_format not in LOSSLESS_FORMATS:
+            raise ValueError(f"Ana önizleme kayıpsız olmalı (png, webp): {master_format}")
+        if display_format is not None and display_format not in FORMATS:
+            raise ValueError(f"Bilinmeyen önizleme biçimi: {display_format}")
+        self.master_format = master_format
+        self.png_compress_level = png_compress_level
+        self.webp_method = webp_method
+        self.display_format = display_format
+        self.display_max_size = display_max_size
+        self.display_quality = display_quality
+
+    def save_options(self, fmt, lossless):
+        if fmt == 'png':
+            return {'compress_level': self.png_compress_level}
+        if fmt == 'webp':
+            if lossless:
+                return {'lossless': True, 'method': self.webp_method, 'quality': 100}
+            return {'quality': self.display_quality, 'method': self.webp_method}
+        return {'quality': self.display_quality, 'progressive': True, 'optimize': True}
+
+
+def encoding_from_config(config):
+    return PreviewEncoding(
+        master_format=config.get('PREVIEW_MASTER_FORMAT', 'png'),
+        png_compress_level=config.get('PREVIEW_PNG_COMPRESS_LEVEL', 1),
+        webp_method=config.get('PREVIEW_WEBP_METHOD', 4),
+        display_format=config.get('PREVIEW_DISPLAY_FORMAT', 'jpeg'),
+        display_max_size=config.get('PREVIEW_DISPLAY_MAX_SIZE', 2048),
+        display_quality=config.get('PREVIEW_DISPLAY_QUALITY', 85),
+    )
+
+
+def encode_image(pil_img, path_or_file, fmt, options):
+    if fmt == 'jpeg' and pil_img.mode not in ('RGB', 'L'):
+        pil_img = pil_img.convert('RGB')
+    pil_img.save(path_or_file, FORMATS[fmt][1], **options)
+
+
+def display_size(width, height, max_size):
+    scale = min(1.0, max_size / max(width, height)) if max_size else 1.0
+    return max(1, round(width * scale)), max(1, round(height * scale)), scale
+
+
+def save_previews(pil_img, preview_folder, image_id, encoding):
+    """
+    Kayıpsız ana önizlemeyi ve (ayarlıysa) küçültülmüş görüntüleme kopyasını yazar.
+    Dönüş: (ana önizlemenin static'e göre yolu, görüntüleme kopyası bilgisi veya None)
+    """
+    master_extension = FORMATS[encoding.master_format][0]
+    master_name = f"{image_id}.{master_extension}"
+    encode_image(pil_img, os.path.join(preview_folder, master_name), encoding.master_format,
+                 encoding.save_options(encoding.master_format, lossless=True))
+
+    display = None
+    if encoding.display_format:
+        width, height, scale = display_size(pil_img.width, pil_img.height, encoding.display_max_size)
+        display_img = pil_img if scale == 1.0 else pil_img.resize((width, height), PILImage.Resampling.LANCZOS)
+        display_name = f"{image_id}{DISPLAY_SUFFIX}.{FORMATS[encoding.display_format][0]}"
+        encode_image(display_img, os.path.join(preview_folder, display_name), encoding.display_format,
+                     encoding.save_options(encoding.display_format, lossless=False))
+        display = {
+            'path': f"previews/{display_name}",
+            'width': width, 'height': height,
+            'source_width': pil_img.width, 'source_height': pil_img.height,
+        }
+    return f"previews/{master_name}", display
+
+
+def preview_files(preview_folder, image_id):
+    """Görüntüye ait tüm önizleme dosyaları (ana kopya ve görüntüleme kopyası, her biçimde)."""
+    paths = []
+    for extension, _ in FORMATS.values():
+        for name in (f"{image_id}.{extension}", f"{image_id}{DISPLAY_SUFFIX}.{extension}"):
+            path = os.path.join(preview_folder, name)
+            if os.path.exists(path):
+                paths.append(path)
+    return paths
+
+
+def remove_previews(preview_folder, image_id):
+    for path in preview_files(preview_folder, image_id):
+        os.remove(path)
@@ -1,192 +1,375 @@
 # processing.py
+import logging
 import numpy as np
 from PIL import Image as PILImage
-from ultralytics import YOLO
 import os
+import sys
+import threading
+import time
 from aicsimageio import AICSImage
-import xml.etree.ElementTree as ET # XML okumak için
+from inference import get_inference_service, detect_boxes, detection_options_from_config, inference_options_from_config
+from normalization import ChannelNormalizer
+from tiles import build_tile_pyramid
+from crops import save_detection_crops
+from czi_metadata import get_objective_name_from_xml, get_acquisition_date_from_xml
+from preview_encoding import PreviewEncoding, encoding_from_config, save_previews
+from metrics import PROCESSING_PEAK_RSS_BYTES, PROCESSING_SECONDS, PROCESSING_STAGE_SECONDS, StageTimer, measure
 
-def get_objective_name_from_xml(xml_root):
+logger = logging.getLogger(__name__)
+
+# =====================================================================
+# ===  BELLEK SINIRLI DÜZLEM OKUMA
+# =====================================================================
+
+def _current_rss_bytes():
+    """Sürecin anlık RSS değeri (Linux'ta /proc, diğerlerinde ru_maxrss yaklaşımı)."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        import resource
+        usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return usage if sys.platform == 'darwin' else usage * 1024
+
+
+class PeakMemoryMonitor:
     """
-    AICSImage metadata (XML root) içinden objektif adını bulmaya çalışır.
+    Blok içindeki en yüksek süreç RSS'ini arka planda örnekleyerek ölçer.
+    Aynı süreçte eşzamanlı yüklemeler varsa değer süreç geneli içindir.
     """
-    if xml_root is None: return "Bilinmiyor"
-    try:
-        # Zeiss XML'inde objektif adı için en yaygın yolu dene
-        objective_node = xml_root.find(".//{*}Information/{*}Instrument/{*}Objectives/{*}Objective")
-        if objective_node is not None and 'Name' in objective_node.attrib:
-            return objective_node.attrib['Name'] # örn: "Plan-Apochromat 20x/0.8"
-
-        objective_node = xml_root.find(".//{*}Objective")
-        if objective_node is not None and 'Name' in objective_node.attrib:
-            return objective_node.attrib['Name']
-        return "Bilinmiyor"
-    except Exception as e:
-        print(f"DEBUG: Objektif XML okuma hatası: {e}")
-        return "XML Hatası"
 
-# === YENİ: Çekim Tarihini XML'den Okuma Fonksiyonu ===
-def get_acquisition_date_from_xml(xml_root):
+    def __init__(self, interval=0.05):
+        self.interval = interval
+        self.baseline = 0
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, _current_rss_bytes())
+
+    def __enter__(self):
+        self.baseline = self.peak = _current_rss_bytes()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, _current_rss_bytes())
+        return False
+
+    @property
+    def peak_mb(self):
+        return round(self.peak / (1024 * 1024), 1)
+
+    @property
+    def baseline_mb(self):
+        return round(self.baseline / (1024 * 1024), 1)
+
+
+def choose_downsample(height, width, itemsize, num_planes, memory_limit_mb):
     """
-    AICSImage metadata (XML root) içinden çekim tarihini bulmaya çalışır.
+    Tahmini bellek ihtiyacı sınırı aşmayacak en küçük tam sayı küçültme katsayısı.
+    Tahmin: aynı anda tek bir ham düzlem (tam çözünürlük) + uint8 önizleme,
+    PIL kopyası ve model girdisi (küçültülmüş çözünürlük).
     """
-    if xml_root is None: return "Bilinmiyor"
-    try:
-        # Zeiss XML'inde en yaygın yolu dene
-        # Yol: .../Metadata/Information/Image/AcquisitionDateAndTime
-        date_node = xml_root.find(".//{*}Information/{*}Image/{*}AcquisitionDateAndTime")
-        if date_node is not None:
-            # Tarihi (örn: "2025-11-15T20:30:00.000") al ve sadece tarih kısmını (T'den öncesi) döndür
-            return date_node.text.split('T')[0] 
-
-        # Başka bir yaygın yolu dene
-        date_node = xml_root.find(".//{*}AcquisitionDateAndTime")
-        if date_node is not None:
-            return date_node.text.split('T')[0]
-
-        return "Bilinmiyor"
-    except Exception as e:
-        print(f"DEBUG: Çekim Tarihi XML okuma hatası: {e}")
-        return "XML Hatası"
+    if not memory_limit_mb:
+        return 1
+    limit = memory_limit_mb * 1024 * 1024
+    budget = limit - height * width * itemsize
+    if budget <= 0:
+        logger.debug("Tek bir ham düzlem bile bellek sınırını (%s MB) aşıyor.", memory_limit_mb)
+        budget = limit
+    out_channels = 3 if num_planes >= 3 else 1
+    factor = 1
+    while factor < 64 and -(-height // factor) * -(-width // factor) * out_channels * 3 > budget:
+        factor += 1
+    return factor
+
+
+def _row_blocks(plane, block_rows, timer=None):
+    """
+    Dask düzlemini satır blokları halinde NumPy'a çevirir. Blok sınırları dask parça
+    sınırlarıyla hizalanır; bir parça çok büyükse tek seferde okunup alt bloklara bölünür.
+    `timer` verilirse parçaların okunma süresi 'plane_read' aşamasına yazılır.
+    """
+    row = 0
+    chunks = getattr(plane, 'chunks', None)
+    for chunk_rows in (chunks[0] if chunks else (plane.shape[0],)):
+        with measure(timer, 'plane_read'):
+            chunk = np.asarray(plane[row:row + chunk_rows])
+        for offset in range(0, chunk_rows, block_rows):
+            yield row + offset, chunk[offset:offset + block_rows]
+        row += chunk_rows
+
+
+def copy_plane_into(plane, out, block_rows=1024, timer=None):
+    """uint8 düzlemi normalize etmeden, blok blok çıktı dizisine kopyalar."""
+    for row, block in _row_blocks(plane, block_rows, timer):
+        out[row:row + block.shape[0]] = block
+
+
+def normalize_plane_into(plane, out, block_rows=1024, timer=None):
+    """
+    SADECE uint8 OLMAYAN veriler için kontrastı ayarlar (2-98 yüzdelik aralığı).
+    uint16 verilerde yüzdelikler tek bir histogramdan bulunur ve sonuç LUT ile
+    satır blokları halinde doğrudan `out` (uint8) içine yazılır (bkz. normalization.py).
+    """
+    if getattr(plane, 'numblocks', (1,))[0] == 1:
+        with measure(timer, 'plane_read'):
+            plane = np.asarray(plane)  # Tek parça: dosyayı iki kez okumamak için bir kez belleğe al
+    normalizer = ChannelNormalizer(plane.dtype)
+    if not normalizer.uses_lut:
+        # Histogram kurulamayan tiplerde (float vb.) yüzdelikler ~4M piksellik alt örnekten
+        normalizer.sample_step = max(1, int(np.ceil(np.sqrt(plane.shape[0] * plane.shape[1] / 4_000_000))))
+    for row, block in _row_blocks(plane, block_rows, timer):
+        normalizer.update(block)
+    normalizer.finalize()
+    for row, block in _row_blocks(plane, block_rows, timer):
+        normalizer.apply(block, out[row:row + block.shape[0]])
+
 
+def processing_options_from_config(config):
+    """`process_czi_image`'e geçirilecek konfigürasyon kaynaklı ayarlar."""
+    options = detection_options_from_config(config)
+    options['memory_limit_mb'] = config.get('CZI_MEMORY_LIMIT_MB', 0)
+    options['block_rows'] = config.get('CZI_BLOCK_ROWS', 1024)
+    options['pyramid_folder'] = config.get('PYRAMID_FOLDER')
+    options['pyramid_tile_size'] = config.get('PYRAMID_TILE_SIZE', 256)
+    options['pyramid_format'] = config.get('PYRAMID_TILE_FORMAT', 'jpeg')
+    options['crop_folder'] = config.get('CROP_FOLDER')
+    options['preview_encoding'] = encoding_from_config(config)
+    options['inference_options'] = inference_options_from_config(config)
+    return options
 
-def process_czi_image(czi_path, image_id, preview_folder, yolo_model_path):
+def process_czi_image(czi_path, image_id, preview_folder, yolo_model_path, **options):
     """
     Tüm metadata'ları (Çekim Tarihi, Objektif) XML'den okuyacak şekilde güncellendi.
+    İşlem boyunca sürecin en yüksek bellek kullanımı (RSS) ölçülüp metadata'ya ve
+    `czi_processing_peak_rss_bytes` histogramına yazılır.
+    Aşama süreleri (sn) metadata'ya `stage_seconds` olarak yazılır ve /metrics histogramlarına eklenir.
     """
-    
+    timer = StageTimer()
+    started = time.perf_counter()
+    with PeakMemoryMonitor() as memory:
+        metadata, preview_path_relative, detections = _process_czi_image(
+            czi_path, image_id, preview_folder, yolo_model_path, timer=timer, **options
+        )
+    PROCESSING_SECONDS.observe(time.perf_counter() - started)
+    PROCESSING_PEAK_RSS_BYTES.observe(memory.peak)
+    logger.debug("%s için en yüksek RSS: %s MB (başlangıç: %s MB)", image_id, memory.peak_mb, memory.baseline_mb)
+    timer.observe(PROCESSING_STAGE_SECONDS)
+    metadata['stage_seconds'] = timer.rounded()
+    metadata['peak_rss_mb'] = memory.peak_mb
+    return metadata, preview_path_relative, detections
+
+
+def _process_czi_image(czi_path, image_id, preview_folder, yolo_model_path, detector=None,
+                       progress_callback=None, tile_size=0, tile_overlap=0.25, nms_iou=0.5,
+                       memory_limit_mb=0, block_rows=1024,
+                       pyramid_folder=None, pyramid_tile_size=256, pyramid_format='jpeg',
+                       crop_folder=None, preview_encoding=None, inference_options=None,
+                       image_reader=None, timer=None):
+    """
+    `detector` verilmezse süreç genelindeki çıkarım servisi kullanılır: `inference_options`
+    (`inference_options_from_config`; YOLO_BACKEND / ONNX ayarları dahil) verilmişse onunla,
+    yoksa `yolo_model_path` için varsayılan arka uçla.
+    `progress_callback(stage, percent)` verilirse her aşamanın başında çağrılır.
+    Tespit, diske yazılan PNG yerine bellekteki önizleme dizisi üzerinde yapılır;
+    `tile_size` > 0 ise büyük görüntüler örtüşen pencerelerle taranır.
+    Düzlemler tek tek ve satır blokları halinde işlenir; `memory_limit_mb` > 0 ise
+    tahmini bellek ihtiyacı bu sınırı aşan dosyalar için küçültülmüş önizleme üretilir.
+    `pyramid_folder` verilirse annotate ekranı için DZI döşeme piramidi de üretilir.
+    `crop_folder` verilirse her tespitin kırpılmış görüntüsü önceden diske yazılır.
+    `preview_encoding` kayıpsız ana önizlemenin ve küçültülmüş görüntüleme kopyasının
+    biçimlerini belirler (verilmezse PNG seviye 1 + 2048 px progresif JPEG).
+    `image_reader` dosyayı açan AICSImage uyumlu sınıftır (verilmezse AICSImage; benchmark'lar
+    sentetik dizileri okuyan bir sınıf verir).
+    `timer` (StageTimer) verilirse aşama süreleri ona yazılır.
+    """
+    timer = timer or StageTimer()
+
+    def report(stage, percent):
+        if progress_callback is not None:
+            progress_callback(stage, percent)
+
+    report('opening', 5)
     try:
-        img = AICSImage(czi_path)
+        with timer.stage('open'):
+            img = (image_reader or AICSImage)(czi_path)
     except Exception as e:
         raise ValueError(f"CZI dosyası AICSImageIO ile açılamadı: {e}")
 
-    # === DEBUG Bilgileri ===
-    print(f"DEBUG: Görüntü ID: {image_id}")
-    print(f"DEBUG: Kanal Sayısı (C): {img.dims.C}, Sahne Sayısı (S): {img.dims.S}")
-    print(f"DEBUG: Piksel Tipi (dtype): {img.dtype}")
+    logger.debug("%s: kanal sayısı (C) %s, sahne sayısı (S) %s, piksel tipi %s",
+                 image_id, img.dims.C, img.dims.S, img.dtype)
     
     try:
         # --- 1. Gelişmiş Metadata ve Ölçek Çıkarımı ---
+        report('metadata', 15)
         
-        # 1a. Ölçek (Scale)
-        if img.physical_pixel_sizes.X is None:
-            raise ValueError("Metadata içinde fiziksel piksel boyutu (X) bulunamadı.")
-        scale_x_meters = img.physical_pixel_sizes.X
-        scale_um_per_pixel = scale_x_meters * 1_000_000 
-        
-        # 1b. Diğer Metadata'lar
-        channel_names = img.channel_names          # Kanal İsimleri (Liste)
-        xml_root = img.metadata                    # Ham XML verisi (XML Element objesi)
-        
-        # === DÜZELTME: Verileri XML'den Çek ===
-        objective_name = get_objective_name_from_xml(xml_root)
-        acquisition_date = get_acquisition_date_from_xml(xml_root)
-
-        metadata = {
-            'scale_um_per_pixel': scale_um_per_pixel,
-            'dimensions': img.dims.order,
-            'size_bytes': os.path.getsize(czi_path),
-            'acquisition_date': acquisition_date, # DÜZELTİLDİ
-            'channel_names': channel_names,
-            'objective_name': objective_name
-        }
+        with timer.stage('metadata'):
+            # 1a. Ölçek (Scale)
+            if img.physical_pixel_sizes.X is None:
+                raise ValueError("Metadata içinde fiziksel piksel boyutu (X) bulunamadı.")
+            scale_x_meters = img.physical_pixel_sizes.X
+            scale_um_per_pixel = scale_x_meters * 1_000_000 
+
+            # 1b. Diğer Metadata'lar
+            channel_names = img.channel_names          # Kanal İsimleri (Liste)
+            xml_root = img.metadata                    # Ham XML verisi (XML Element objesi)
+
+            # === DÜZELTME: Verileri XML'den Çek ===
+            objective_name = get_objective_name_from_xml(xml_root)
+            acquisition_date = get_acquisition_date_from_xml(xml_root)
+
+            metadata = {
+                'scale_um_per_pixel': scale_um_per_pixel,
+                'dimensions': img.dims.order,
+                'size_bytes': os.path.getsize(czi_path),
+                'acquisition_date': acquisition_date, # DÜZELTİLDİ
+                'channel_names': channel_names,
+                'objective_name': objective_name
+            }
 
         # --- 2. PNG Önizlemesi Oluşturma ---
+        report('normalizing', 30)
         
         z_slice = img.dims.Z // 2
         num_channels = img.dims.C
         num_scenes = img.dims.S
-        pixel_type = img.dtype
-        
-        def normalize_channel(channel_data):
-            """SADECE uint8 OLMAYAN veriler için kontrastı ayarlar"""
-            data = channel_data.astype(np.float32)
-            p2 = np.percentile(data, 2)
-            p98 = np.percentile(data, 98)
-            data = np.clip(data, p2, p98)
-            min_val, max_val = np.min(data), np.max(data)
-            if max_val == min_val: return np.zeros_like(data, dtype=np.uint8)
-            data = (data - min_val) / (max_val - min_val)
-            return (data * 255).astype(np.uint8)
+        pixel_type = np.dtype(img.dtype)
 
-        
         # === RENK ALGISI (Sahne veya Kanal) ===
-        
         if num_scenes >= 3 and num_channels == 1:
-            # RENK (Sahne'den)
-            print("DEBUG: Renk modu 'Scene' (S:3, C:1) olarak algılandı.")
-            img_data_rgb = np.zeros((img.dims.Y, img.dims.X, 3), dtype=np.uint8)
-            
-            channel_r = img.get_image_data("YX", Z=z_slice, T=0, C=0, S=0)
-            channel_g = img.get_image_data("YX", Z=z_slice, T=0, C=0, S=1)
-            channel_b = img.get_image_data("YX", Z=z_slice, T=0, C=0, S=2)
-
-            if pixel_type != np.uint8:
-                print("DEBUG: Veri tipi uint8 değil, normalize ediliyor...")
-                img_data_rgb[:, :, 0] = normalize_channel(channel_r)
-                img_data_rgb[:, :, 1] = normalize_channel(channel_g)
-                img_data_rgb[:, :, 2] = normalize_channel(channel_b)
-            else:
-                print("DEBUG: Veri tipi uint8, normalize edilmiyor (olduğu gibi alınıyor).")
-                img_data_rgb[:, :, 0] = channel_r
-                img_data_rgb[:, :, 1] = channel_g
-                img_data_rgb[:, :, 2] = channel_b
-            
-            pil_img = PILImage.fromarray(img_data_rgb, 'RGB')
-            
+            logger.debug("Renk modu 'Scene' (S:3, C:1) olarak algılandı.")
+            plane_selections = [dict(C=0, S=0), dict(C=0, S=1), dict(C=0, S=2)]
         elif num_channels >= 3:
-            # RENK (Kanal'dan)
-            print("DEBUG: Renk modu 'Channel' (C:3) olarak algılandı.")
-            img_data_rgb = np.zeros((img.dims.Y, img.dims.X, 3), dtype=np.uint8)
-
-            channel_r = img.get_image_data("YX", Z=z_slice, T=0, C=0)
-            channel_g = img.get_image_data("YX", Z=z_slice, T=0, C=1)
-            channel_b = img.get_image_data("YX", Z=z_slice, T=0, C=2)
-            
-            if pixel_type != np.uint8:
-                print("DEBUG: Veri tipi uint8 değil, normalize ediliyor...")
-                img_data_rgb[:, :, 0] = normalize_channel(channel_r)
-                img_data_rgb[:, :, 1] = normalize_channel(channel_g)
-                img_data_rgb[:, :, 2] = normalize_channel(channel_b)
-            else:
-                print("DEBUG: Veri tipi uint8, normalize edilmiyor (olduğu gibi alınıyor).")
-                img_data_rgb[:, :, 0] = channel_r
-                img_data_rgb[:, :, 1] = channel_g
-                img_data_rgb[:, :, 2] = channel_b
-            
-            pil_img = PILImage.fromarray(img_data_rgb, 'RGB')
-            
+            logger.debug("Renk modu 'Channel' (C:3) olarak algılandı.")
+            plane_selections = [dict(C=0), dict(C=1), dict(C=2)]
         else:
-            # SİYAH BEYAZ (Grayscale)
-            print("DEBUG: Mod 'Grayscale' (C:1, S:1) olarak algılandı.")
-            img_data = img.get_image_data("YX", Z=z_slice, C=0, T=0, S=0)
-            
-            if pixel_type != np.uint8:
-                img_data_normalized = normalize_channel(img_data)
-            else:
-                img_data_normalized = img_data
-                
-            pil_img = PILImage.fromarray(img_data_normalized, 'L')
+            logger.debug("Mod 'Grayscale' (C:1, S:1) olarak algılandı.")
+            plane_selections = [dict(C=0, S=0)]
+        is_rgb = len(plane_selections) == 3
+
+        # Bellek sınırı aşılacaksa önizleme küçültülmüş (her f. piksel) olarak üretilir
+        downsample = choose_downsample(
+            img.dims.Y, img.dims.X, pixel_type.itemsize, len(plane_selections), memory_limit_mb
+        )
+        out_height = -(-img.dims.Y // downsample)
+        out_width = -(-img.dims.X // downsample)
+        if downsample > 1:
+            logger.debug("Bellek sınırı (%s MB) nedeniyle önizleme 1/%d ölçekte üretiliyor.", memory_limit_mb, downsample)
+            metadata['original_scale_um_per_pixel'] = scale_um_per_pixel
+            metadata['scale_um_per_pixel'] = scale_um_per_pixel * downsample
+        metadata['preview_downsample'] = downsample
+
+        preview_array = np.zeros(
+            (out_height, out_width, 3) if is_rgb else (out_height, out_width), dtype=np.uint8
+        )
+        with timer.stage('normalize'):
+            for index, selection in enumerate(plane_selections):
+                # Sadece gerekli Z/C/S düzlemi tembel (dask) olarak seçilir; diğer düzlemler okunmaz
+                plane = img.get_image_dask_data("YX", Z=z_slice, T=0, **selection)
+                if downsample > 1:
+                    plane = plane[::downsample, ::downsample]
+                target = preview_array[:, :, index] if is_rgb else preview_array
+                if pixel_type != np.uint8:
+                    normalize_plane_into(plane, target, block_rows, timer)
+                else:
+                    copy_plane_into(plane, target, block_rows, timer)
+
+        pil_img = PILImage.fromarray(preview_array, 'RGB' if is_rgb else 'L')
 
     except Exception as e:
         raise e
 
-    # --- 3. PNG Kaydetme ---
-    preview_filename = f"{image_id}.png"
-    preview_full_path = os.path.join(preview_folder, preview_filename)
-    pil_img.save(preview_full_path)
-    preview_path_relative = f"previews/{preview_filename}"
+    # --- 3. Önizleme Kaydetme (kayıpsız ana kopya + görüntüleme kopyası) ---
+    preview_path_relative = write_preview_outputs(
+        pil_img, image_id, preview_folder, metadata, report,
+        pyramid_folder=pyramid_folder, pyramid_tile_size=pyramid_tile_size,
+        pyramid_format=pyramid_format, preview_encoding=preview_encoding, timer=timer
+    )
 
-    # --- 4. YOLOv8 Tespiti ---
-    model = YOLO(yolo_model_path)
-    results = model.predict(preview_full_path)
+    # --- 4. YOLOv8 Tespiti (model servis içinde sıcak tutulur) ---
+    report('detecting', 70)
+    if detector is None:
+        detector = (get_inference_service(**inference_options) if inference_options
+                    else get_inference_service(yolo_model_path))
+    with timer.stage('detect'):
+        boxes = detect_boxes(
+            detector, preview_array,
+            tile_size=tile_size, tile_overlap=tile_overlap, nms_iou=nms_iou
+        )
     
     detections = []
-    for i, box in enumerate(results[0].boxes):
-        xyxy = box.xyxy[0].cpu().numpy()
+    for i, xyxy in enumerate(boxes):
         x1, y1, x2, y2 = int(xyxy[0]), int(xyxy[1]), int(xyxy[2]), int(xyxy[3])
         detection_id = f"{image_id}_{i+1}"
         coordinates_labelme = { "shape_type": "rectangle", "points": [ [x1, y1], [x2, y2] ] }
         detections.append({ "id": detection_id, "coordinates_labelme": coordinates_labelme })
 
+    if crop_folder:
+        report('saving_crops', 85)
+        with timer.stage('crops'):
+            save_detection_crops(pil_img, crop_folder, image_id, detections)
+
+    return metadata, preview_path_relative, detections
+
+
+def write_preview_outputs(pil_img, image_id, preview_folder, metadata, report,
+                          pyramid_folder=None, pyramid_tile_size=256, pyramid_format='jpeg',
+                          preview_encoding=None, timer=None):
+    """Önizleme dosyalarını ve (ayarlıysa) döşeme piramidini yazar; metadata'yı günceller."""
+    report('saving_preview', 60)
+    with measure(timer, 'preview_save'):
+        preview_path_relative, display_preview = save_previews(
+            pil_img, preview_folder, image_id, preview_encoding or PreviewEncoding()
+        )
+    metadata.pop('display_preview', None)
+    if display_preview:
+        metadata['display_preview'] = display_preview
+
+    if pyramid_folder:
+        report('building_tiles', 65)
+        with measure(timer, 'tiles'):
+            metadata['tiles'] = build_tile_pyramid(
+                pil_img, pyramid_folder, image_id,
+                tile_size=pyramid_tile_size, tile_format=pyramid_format
+            )
+    return preview_path_relative
+
+
+def reuse_cached_result(cached_preview_path, image_id, preview_folder, cached_metadata, cached_coordinates,
+                        progress_callback=None, pyramid_folder=None, pyramid_tile_size=256,
+                        pyramid_format='jpeg', crop_folder=None, preview_encoding=None, **_unused_options):
+    """
+    Aynı içerikli bir dosyanın önbellekteki sonucundan yeni görüntünün çıktılarını üretir:
+    CZI çözülmez ve model çalıştırılmaz; önizleme, döşemeler ve kırpmalar önbellekteki
+    kayıpsız ana önizlemeden yazılır, tespitler yeni görüntü id'siyle numaralandırılır.
+    (`processing_options_from_config` sözlüğü olduğu gibi verilebilsin diye tespit/çözme ayarları yok sayılır.)
+    """
+    def report(stage, percent):
+        if progress_callback is not None:
+            progress_callback(stage, percent)
+
+    report('cache_hit', 30)
+    metadata = {key: value for key, value in cached_metadata.items() if key not in ('tiles', 'peak_rss_mb', 'stage_seconds')}
+    metadata['processing_cache_hit'] = True
+    detections = [
+        {"id": f"{image_id}_{i+1}", "coordinates_labelme": coordinates_labelme}
+        for i, coordinates_labelme in enumerate(cached_coordinates)
+    ]
+    with PILImage.open(cached_preview_path) as pil_img:
+        pil_img.load()
+        preview_path_relative = write_preview_outputs(
+            pil_img, image_id, preview_folder, metadata, report,
+            pyramid_folder=pyramid_folder, pyramid_tile_size=pyramid_tile_size,
+            pyramid_format=pyramid_format, preview_encoding=preview_encoding
+        )
+        if crop_folder:
+            report('saving_crops', 85)
+            save_detection_crops(pil_img, crop_folder, image_id, detections)
     return metadata, preview_path_relative, detections
\ No newline at end of file
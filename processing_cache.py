@@ -0,0 +1,177 @@
+# processing_cache.py
+import hashlib
+import json
+import os
+import shutil
+from datetime import datetime, timedelta
+
+from models import db, Image, IngestJob, ProcessingCache
+from inference import active_model_path, backend_options_from_config, detection_options_from_config
+
+
+HASH_CHUNK_BYTES = 1024 * 1024
+_weights_digests = {}
+
+
+# --- İçerik Özeti (dosya diske yazılırken / kopyalanırken hesaplanır) ---
+def save_stream_hashed(stream, dest_path, chunk_size=HASH_CHUNK_BYTES):
+    """
+    Yükleme akışını parça parça diske yazarken SHA-256 özetini hesaplar.
+    Dosya önce `.part` adıyla yazılır; yarıda kalan yükleme tamamlanmış gibi görünmez.
+    Dönüş: (hex özet, bayt sayısı)
+    """
+    digest = hashlib.sha256()
+    size = 0
+    part_path = f"{dest_path}.part"
+    try:
+        with open(part_path, 'wb') as f:
+            while True:
+                block = stream.read(chunk_size)
+                if not block:
+                    break
+                digest.update(block)
+                f.write(block)
+                size += len(block)
+        os.replace(part_path, dest_path)
+    except BaseException:
+        if os.path.exists(part_path):
+            os.remove(part_path)
+        raise
+    return digest.hexdigest(), size
+
+
+def copy_file_hashed(source_path, dest_path, chunk_size=HASH_CHUNK_BYTES):
+    with open(source_path, 'rb') as source:
+        result = save_stream_hashed(source, dest_path, chunk_size)
+    shutil.copystat(source_path, dest_path)
+    return result
+
+
+def file_sha256(path, chunk_size=HASH_CHUNK_BYTES):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while True:
+            block = f.read(chunk_size)
+            if not block:
+                break
+            digest.update(block)
+    return digest.hexdigest()
+
+
+# --- Model Sürümü ---
+def _weights_digest(model_path):
+    """Ağırlık dosyasının özeti; dosya değişmedikçe (boyut + mtime) tekrar okunmaz."""
+    try:
+        stat = os.stat(model_path)
+    except OSError:
+        return None
+    key = (os.path.abspath(model_path), stat.st_size, stat.st_mtime_ns)
+    if key not in _weights_digests:
+        _weights_digests[key] = file_sha256(model_path)
+    return _weights_digests[key]
+
+
+def model_version(config):
+    """
+    Önbellek anahtarının model kısmı: ağırlık dosyası özeti + sonucu değiştiren arka uç, tespit ve
+    önizleme (küçültme) ayarları. Model dosyası bulunamazsa None (önbellek kullanılmaz).
+    """
+    weights = _weights_digest(active_model_path(config))
+    if weights is None:
+        return None
+    backend_options = backend_options_from_config(config)
+    backend_options.pop('intra_op_threads', None)  # Sonucu değiştirmez
+    settings = dict(
+        detection_options_from_config(config), memory_limit_mb=config.get('CZI_MEMORY_LIMIT_MB', 0),
+        backend=config.get('YOLO_BACKEND', 'ultralytics'), **backend_options
+    )
+    payload = json.dumps({'weights': weights, 'settings': settings}, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:32]
+
+
+# --- Yinelenen Yüklemeler ---
+def find_duplicate_image(content_hash):
+    if not content_hash:
+        return None
+    return Image.query.filter_by(content_hash=content_hash).order_by(Image.id).first()
+
+
+def find_active_job(content_hash):
+    """Aynı içerik için kuyrukta bekleyen ya da işlenmekte olan yükleme işi."""
+    if not content_hash:
+        return None
+    return IngestJob.query.filter(
+        IngestJob.content_hash == content_hash,
+        IngestJob.status.in_(['queued', 'running'])
+    ).order_by(IngestJob.created_at).first()
+
+
+# --- Önbellek Kayıtları (commit çağırana aittir) ---
+def lookup_processing_cache(content_hash, version, cache_folder):
+    """
+    Geçerli önbellek kaydını düz sözlük olarak döndürür (işçi süreçlere aktarılabilir).
+    Önizleme dosyası silinmişse kayıt da silinir ve None döner.
+    """
+    if not content_hash or not version:
+        return None
+    entry = db.session.get(ProcessingCache, (content_hash, version))
+    if entry is None:
+        return None
+    preview_path = os.path.join(cache_folder, entry.preview_file)
+    if not os.path.exists(preview_path):
+        db.session.delete(entry)
+        return None
+    entry.hit_count += 1
+    entry.last_used_at = datetime.utcnow()
+    return {
+        'preview_path': preview_path,
+        'metadata': entry.metadata_json,
+        'coordinates': entry.detections_json,
+    }
+
+
+def _link_or_copy(source_path, dest_path):
+    # Aynı dosya sisteminde sabit bağlantı ek disk kullanmaz; olmazsa kopyalanır
+    if os.path.exists(dest_path):
+        os.remove(dest_path)
+    try:
+        os.link(source_path, dest_path)
+    except OSError:
+        shutil.copy2(source_path, dest_path)
+
+
+def store_processing_cache(content_hash, version, metadata, preview_path, detections, config):
+    """İşlenmiş bir yüklemenin sonucunu (ana önizleme + metadata + tespitler) önbelleğe yazar."""
+    if not content_hash or not version:
+        return None
+    cache_folder = config['PROCESSING_CACHE_FOLDER']
+    extension = os.path.splitext(preview_path)[1]
+    preview_file = f"{content_hash}_{version}{extension}"
+    _link_or_copy(
+        os.path.join(config['PREVIEW_FOLDER'], os.path.basename(preview_path)),
+        os.path.join(cache_folder, preview_file)
+    )
+    entry = db.session.get(ProcessingCache, (content_hash, version)) or ProcessingCache(
+        content_hash=content_hash, model_version=version, hit_count=0
+    )
+    entry.metadata_json = {key: value for key, value in metadata.items() if key not in ('tiles', 'display_preview')}
+    entry.detections_json = [detection['coordinates_labelme'] for detection in detections]
+    entry.preview_file = preview_file
+    entry.last_used_at = datetime.utcnow()
+    db.session.add(entry)
+    return entry
+
+
+def prune_processing_cache(cache_folder, older_than_days=None):
+    """`older_than_days` verilirse o kadar gündür kullanılmayan, yoksa tüm kayıtları siler."""
+    query = ProcessingCache.query
+    if older_than_days is not None:
+        query = query.filter(ProcessingCache.last_used_at < datetime.utcnow() - timedelta(days=older_than_days))
+    removed = 0
+    for entry in query.all():
+        preview_path = os.path.join(cache_folder, entry.preview_file)
+        if os.path.exists(preview_path):
+            os.remove(preview_path)
+        db.session.delete(entry)
+        removed += 1
+    return removed
@@ -0,0 +1,172 @@
+# redetect.py
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image as PILImage
+from sqlalchemy import or_
+
+from models import db, Image, Detection, Score
+from inference import (
+    active_model_path, detect_boxes, detection_options_from_config, match_boxes, service_from_config
+)
+from detections import apply_detection_edits
+from crops import remove_detection_crop
+from processing_cache import model_version
+
+
+def detection_box(coordinates_labelme):
+    """LabelMe dikdörtgenini [x1, y1, x2, y2] (x1 <= x2, y1 <= y2) kutusuna çevirir."""
+    (x1, y1), (x2, y2) = coordinates_labelme['points']
+    return [min(x1, x2), min(y1, y2), max(x1, x2), max(y1, y2)]
+
+
+def box_points(box):
+    # Yükleme sırasındaki tespitlerle aynı biçim: tam sayı piksel koordinatları
+    return [[int(box[0]), int(box[1])], [int(box[2]), int(box[3])]]
+
+
+def plan_image_diff(existing, boxes, scored_ids, iou_threshold=0.5, delete_unmatched=True):
+    """
+    Yeni model kutularını mevcut tespitlerle IoU'ya göre eşleştirir ve sadece farkları üretir.
+
+    existing: [(tespit id, coordinates_labelme)]; boxes: (N, 5) yeni kutular.
+    Eşleşen tespitin id'si (ve puanları) korunur, kutusu değiştiyse güncellenir. Eşleşmeyen
+    yeni kutular eklenir. Eşleşmeyen eski tespitler puanlanmamışsa silinir; uzman puanı
+    olanlara dokunulmaz (`kept`).
+    Dönüş: {'update': [{'id', 'coordinates'}], 'add': [noktalar], 'delete': [id], 'kept': [id]}
+    """
+    old_boxes = [detection_box(coordinates) for _, coordinates in existing]
+    matches = match_boxes(old_boxes, boxes[:, :4], threshold=iou_threshold) if len(boxes) else []
+    matched_old = {i for i, _, _ in matches}
+    matched_new = {j for _, j, _ in matches}
+
+    plan = {'update': [], 'add': [], 'delete': [], 'kept': []}
+    for i, j, _ in matches:
+        detection_id, coordinates = existing[i]
+        points = box_points(boxes[j])
+        if coordinates['points'] != points:
+            plan['update'].append({'id': detection_id, 'coordinates': points})
+    plan['add'] = [box_points(box) for j, box in enumerate(boxes) if j not in matched_new]
+    for i, (detection_id, _) in enumerate(existing):
+        if i in matched_old:
+            continue
+        if detection_id in scored_ids or not delete_unmatched:
+            plan['kept'].append(detection_id)
+        else:
+            plan['delete'].append(detection_id)
+    return plan
+
+
+def pending_image_ids(version, force=False, image_ids=None, limit=None):
+    """Tespitleri henüz bu model sürümüyle üretilmemiş görüntüler (kaldığı yerden devam)."""
+    query = db.session.query(Image.id).order_by(Image.id)
+    if not force:
+        query = query.filter(or_(Image.detection_model_version.is_(None), Image.detection_model_version != version))
+    if image_ids:
+        query = query.filter(Image.id.in_(image_ids))
+    if limit:
+        query = query.limit(limit)
+    return [row[0] for row in query.all()]
+
+
+def _detect_preview(detector, preview_full_path, options):
+    with PILImage.open(preview_full_path) as pil_img:
+        preview_array = np.asarray(pil_img)
+    return detect_boxes(detector, preview_array, **options)
+
+
+def _batch_state(image_ids):
+    """Toplu işteki görüntülerin mevcut tespitleri ve puanlanmış tespit id'leri (iki sorgu)."""
+    existing = {image_id: [] for image_id in image_ids}
+    for detection_id, image_id, coordinates in db.session.query(
+        Detection.id, Detection.parent_image_id, Detection.coordinates_labelme
+    ).filter(Detection.parent_image_id.in_(image_ids)).order_by(Detection.id):
+        existing[image_id].append((detection_id, coordinates))
+    scored_ids = {row[0] for row in db.session.query(Score.detection_id).join(
+        Detection, Score.detection_id == Detection.id
+    ).filter(Detection.parent_image_id.in_(image_ids)).distinct()}
+    return existing, scored_ids
+
+
+def run_redetection(config, batch_size=32, workers=4, iou_threshold=0.5, delete_unmatched=True,
+                    force=False, dry_run=False, image_ids=None, limit=None, detector=None, log=print):
+    """
+    Kayıtlı önizlemeler üzerinde güncel modeli toplu çalıştırır ve tespit farklarını yazar.
+
+    Önizlemeler `workers` thread'de açılıp çıkarım servisine aynı anda verilir; servis onları
+    batch'ler halinde modele iletir. Her `batch_size` görüntü tek transaction ile yazılır ve
+    görüntülerin `detection_model_version` sütunu güncellenir: bu, kontrol noktasıdır; komut
+    yarıda kesilirse aynı komut kaldığı yerden devam eder. `dry_run` ise hiçbir şey yazılmaz.
+    """
+    version = model_version(config)
+    if version is None:
+        raise ValueError(f"Model dosyası bulunamadı: {active_model_path(config)}")
+    detector = detector or service_from_config(config)
+    options = detection_options_from_config(config)
+    ids = pending_image_ids(version, force=force, image_ids=image_ids, limit=limit)
+    totals = {'images': 0, 'updated': 0, 'added': 0, 'deleted': 0, 'kept': 0, 'unchanged': 0}
+    failed = []
+    log(f"{len(ids)} görüntü yeniden tespit edilecek (model sürümü {version[:12]}).")
+    if not ids:
+        return totals, failed
+
+    def submit(batch_ids):
+        images = {image.id: image for image in Image.query.filter(Image.id.in_(batch_ids)).all()}
+        futures = {
+            image_id: pool.submit(
+                _detect_preview, detector,
+                os.path.join(config['PREVIEW_FOLDER'], os.path.basename(images[image_id].preview_path)),
+                options
+            )
+            for image_id in batch_ids
+        }
+        return images, futures
+
+    batches = [ids[offset:offset + batch_size] for offset in range(0, len(ids), batch_size)]
+    started = time.perf_counter()
+    done = 0
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='redetect') as pool:
+        next_batch = submit(batches[0])
+        for index, batch_ids in enumerate(batches):
+            images, futures = next_batch
+            # Bu toplu işin farkları yazılırken bir sonrakinin çıkarımı sürer
+            if index + 1 < len(batches):
+                next_batch = submit(batches[index + 1])
+            existing, scored_ids = _batch_state(batch_ids)
+            removed_crops = []
+            for image_id in batch_ids:
+                try:
+                    boxes = futures[image_id].result()
+                except Exception as e:
+                    failed.append((image_id, str(e)))
+                    log(f"  HATA: {image_id}: {e}")
+                    continue
+                plan = plan_image_diff(existing[image_id], boxes, scored_ids, iou_threshold, delete_unmatched)
+                if plan['update'] or plan['add'] or plan['delete']:
+                    apply_detection_edits(image_id, plan['add'], plan['update'], plan['delete'])
+                    removed_crops.extend((image_id, item['id']) for item in plan['update'])
+                    removed_crops.extend((image_id, detection_id) for detection_id in plan['delete'])
+                else:
+                    totals['unchanged'] += 1
+                images[image_id].detection_model_version = version
+                totals['images'] += 1
+                totals['updated'] += len(plan['update'])
+                totals['added'] += len(plan['add'])
+                totals['deleted'] += len(plan['delete'])
+                totals['kept'] += len(plan['kept'])
+
+            if dry_run:
+                db.session.rollback()
+            else:
+                db.session.commit()
+                # Değişen kutuların kırpmaları ilk istekte yeni koordinatlarla tekrar üretilir
+                if config.get('CROP_FOLDER'):
+                    for image_id, detection_id in removed_crops:
+                        remove_detection_crop(config['CROP_FOLDER'], image_id, detection_id)
+
+            done += len(batch_ids)
+            rate = done / (time.perf_counter() - started)
+            log(f"  {done}/{len(ids)} görüntü, {rate:.2f} görüntü/sn, kalan ~{(len(ids) - done) / rate / 60:.0f} dk")
+    return totals, failed
@@ -0,0 +1,214 @@
+# score_export.py
+import csv
+import io
+import os
+import tempfile
+from datetime import datetime, timedelta
+
+from models import db, Image, Detection, Score, User
+
+
+CHUNK_ROWS = 2000           # Veritabanından tek seferde okunacak satır sayısı
+FILE_CHUNK_BYTES = 64 * 1024
+SHEET_NAME = 'Tum_Puanlar'
+
+# (başlık, sorgu sütunu) — Excel raporundaki sütun adları ve sırası korunur
+EXPORT_COLUMNS = [
+    ('Resim_ID', Image.id),
+    ('Oosit_ID', Detection.id),
+    ('Uzman_Adı', User.username),
+    ('Genel_Kalite (A-D)', Score.grade),
+    ('Sitoplazma', Score.score_sitoplazma),
+    ('Zona', Score.score_zona),
+    ('Kumulus', Score.score_kumulus),
+    ('Ooplazma', Score.score_oopla),
+    ('Puanlama_Zamanı', Score.timestamp),
+]
+HEADERS = [header for header, _ in EXPORT_COLUMNS]
+
+FORMATS = {
+    'xlsx': ('application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', 'xlsx'),
+    'csv': ('text/csv', 'csv'),  # Response text/* tiplerine charset=utf-8'i kendisi ekler
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+}
+
+
+class ExportError(ValueError):
+    """Geçersiz biçim/filtre parametresi (indirme isteği 400 döner)."""
+
+
+# --- Filtreler ---
+def _split_values(values):
+    """`?image_id=a&image_id=b` ve `?image_id=a,b` biçimlerini tek listeye açar."""
+    result = []
+    for value in values:
+        result.extend(part.strip() for part in str(value).split(',') if part.strip())
+    return result
+
+
+def _parse_date(value, name):
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        raise ExportError(f"Geçersiz tarih ({name}): {value}")
+
+
+def parse_export_filters(args):
+    """
+    İstek parametrelerinden dışa aktarım filtrelerini üretir.
+    expert: uzman id'leri; image_id: görüntü id'leri; date_from / date_to: YYYY-MM-DD
+    (date_to günü dahildir).
+    """
+    try:
+        expert_ids = [int(value) for value in _split_values(args.getlist('expert'))]
+    except ValueError:
+        raise ExportError('Geçersiz uzman id.')
+    filters = {
+        'expert_ids': expert_ids,
+        'image_ids': _split_values(args.getlist('image_id')),
+        'date_from': None,
+        'date_to': None,
+    }
+    if args.get('date_from'):
+        filters['date_from'] = _parse_date(args['date_from'], 'date_from')
+    if args.get('date_to'):
+        date_to = _parse_date(args['date_to'], 'date_to')
+        # Sadece gün verildiyse o günün tamamını kapsa
+        filters['date_to'] = date_to + timedelta(days=1) if len(args['date_to']) <= 10 else date_to
+    return filters
+
+
+def score_export_query(expert_ids=(), image_ids=(), date_from=None, date_to=None):
+    query = db.session.query(*[column.label(header) for header, column in EXPORT_COLUMNS]).join(
+        Detection, Image.id == Detection.parent_image_id
+    ).join(
+        Score, Detection.id == Score.detection_id
+    ).join(
+        User, Score.user_id == User.id
+    )
+    if expert_ids:
+        query = query.filter(Score.user_id.in_(expert_ids))
+    if image_ids:
+        query = query.filter(Image.id.in_(image_ids))
+    if date_from:
+        query = query.filter(Score.timestamp >= date_from)
+    if date_to:
+        query = query.filter(Score.timestamp < date_to)
+    return query.order_by(Image.id, User.username, Detection.id)
+
+
+def iter_row_chunks(query, chunk_size=CHUNK_ROWS):
+    """Sorgu sonucunu `chunk_size` satırlık listeler halinde okur; tamamı belleğe alınmaz."""
+    result = db.session.execute(query.statement, execution_options={'yield_per': chunk_size})
+    for partition in result.partitions(chunk_size):
+        yield [tuple(row) for row in partition]
+
+
+# --- Yazıcılar (her biri bayt parçaları üretir) ---
+def _text_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat(sep=' ', timespec='seconds')
+    return '' if value is None else value
+
+
+def iter_csv(chunks):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    buffer.write('\ufeff')  # Excel'in Türkçe karakterleri doğru açması için UTF-8 BOM
+    writer.writerow(HEADERS)
+    for rows in chunks:
+        writer.writerows([_text_value(value) for value in row] for row in rows)
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+    tail = buffer.getvalue()
+    if tail:
+        yield tail.encode('utf-8')
+
+
+def _iter_file(path):
+    """Geçici dosyayı parça parça okur ve bitince siler."""
+    try:
+        with open(path, 'rb') as f:
+            while True:
+                block = f.read(FILE_CHUNK_BYTES)
+                if not block:
+                    break
+                yield block
+    finally:
+        os.remove(path)
+
+
+def _temporary_path(suffix):
+    handle, path = tempfile.mkstemp(prefix='score_export_', suffix=suffix)
+    os.close(handle)
+    return path
+
+
+def iter_xlsx(chunks):
+    """
+    openpyxl write-only çalışma kitabı: satırlar eklendikçe diske yazılır, hücre nesneleri
+    bellekte tutulmaz. XLSX bir ZIP olduğu için dosya tamamlanınca parça parça gönderilir.
+    """
+    from openpyxl import Workbook
+
+    path = _temporary_path('.xlsx')
+    try:
+        workbook = Workbook(write_only=True)
+        sheet = workbook.create_sheet(SHEET_NAME)
+        sheet.append(HEADERS)
+        for rows in chunks:
+            for row in rows:
+                sheet.append(row)
+        workbook.save(path)
+    except BaseException:
+        os.remove(path)
+        raise
+    yield from _iter_file(path)
+
+
+def iter_parquet(chunks):
+    """Her parça ayrı bir row group olarak yazılır; bellek kullanımı parça boyutuyla sınırlıdır."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([
+        (HEADERS[0], pa.string()), (HEADERS[1], pa.string()), (HEADERS[2], pa.string()),
+        (HEADERS[3], pa.string()), (HEADERS[4], pa.int32()), (HEADERS[5], pa.int32()),
+        (HEADERS[6], pa.int32()), (HEADERS[7], pa.int32()), (HEADERS[8], pa.timestamp('us')),
+    ])
+    path = _temporary_path('.parquet')
+    try:
+        with pq.ParquetWriter(path, schema) as writer:
+            for rows in chunks:
+                columns = list(zip(*rows)) if rows else [[] for _ in HEADERS]
+                writer.write_table(pa.Table.from_arrays(
+                    [pa.array(values, type=field.type) for values, field in zip(columns, schema)],
+                    schema=schema
+                ))
+    except BaseException:
+        os.remove(path)
+        raise
+    yield from _iter_file(path)
+
+
+WRITERS = {'xlsx': iter_xlsx, 'csv': iter_csv, 'parquet': iter_parquet}
+
+
+def check_format(export_format):
+    if export_format not in FORMATS:
+        raise ExportError(f"Desteklenmeyen biçim: {export_format} (xlsx, csv, parquet)")
+    if export_format == 'parquet':
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise ExportError('Parquet dışa aktarımı için pyarrow kurulu olmalı.')
+    mimetype, extension = FORMATS[export_format]
+    return mimetype, extension
+
+
+def iter_score_export(export_format, filters, chunk_size=CHUNK_ROWS):
+    """Filtrelenmiş puanları seçilen biçimde bayt parçaları olarak üretir."""
+    check_format(export_format)
+    chunks = iter_row_chunks(score_export_query(**filters), chunk_size)
+    return WRITERS[export_format](chunks)
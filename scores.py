@@ -0,0 +1,141 @@
+# scores.py
+import random
+import time
+from datetime import datetime
+
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.exc import OperationalError
+
+from models import db, Detection, Score
+from metrics import SCORE_WRITE_ATTEMPTS
+from consensus import image_ids_for_detections, refresh_image_consensus
+
+
+# Çok satırlı INSERT'te SQLite bağlı parametre sınırını (eski sürümlerde 999) aşmamak için
+UPSERT_CHUNK_ROWS = 100
+
+SCORE_FIELDS = {
+    'sitoplazma': 'score_sitoplazma',
+    'zona': 'score_zona',
+    'kumulus': 'score_kumulus',
+    'oopla': 'score_oopla',
+}
+
+
+def is_lock_error(error):
+    """SQLite kilit çakışması mı? (database is locked / busy) — sadece bunlar tekrar denenir."""
+    message = str(getattr(error, 'orig', error)).lower()
+    return 'locked' in message or 'busy' in message
+
+
+def run_with_retry(operation, attempts=5, base_delay=0.05, max_delay=1.0):
+    """
+    `operation()`'ı çalıştırıp commit eder; kilit çakışmasında rollback yapıp üstel
+    bekleme (+ rastgele sapma) ile en fazla `attempts` kez dener. Diğer hatalar hemen yükselir.
+    Deneme sayısı /metrics'te `score_write_attempts` histogramına yazılır.
+    """
+    for attempt in range(1, attempts + 1):
+        try:
+            result = operation()
+            db.session.commit()
+            SCORE_WRITE_ATTEMPTS.observe(attempt, result='committed')
+            return result
+        except OperationalError as e:
+            db.session.rollback()
+            if not is_lock_error(e):
+                raise
+            if attempt == attempts:
+                SCORE_WRITE_ATTEMPTS.observe(attempt, result='gave_up')
+                raise
+            delay = min(max_delay, base_delay * (2 ** (attempt - 1)))
+            time.sleep(delay * random.uniform(0.5, 1.5))
+        except Exception:
+            db.session.rollback()
+            raise
+
+
+def score_values(detection_id, user_id, grade, scores):
+    values = {
+        'detection_id': detection_id,
+        'user_id': user_id,
+        'grade': grade,
+        'timestamp': datetime.utcnow(),
+    }
+    for key, column in SCORE_FIELDS.items():
+        values[column] = scores.get(key)
+    return values
+
+
+def upsert_scores_statement(rows):
+    """
+    Tek ifadelik `INSERT ... ON CONFLICT(detection_id, user_id) DO UPDATE`.
+    Aynı uzmanın aynı oosit için eşzamanlı iki isteği unique kısıtına takılmaz;
+    sonra gelen, öncekinin üzerine yazar.
+    """
+    statement = insert(Score.__table__).values(rows)
+    update_columns = ['grade', 'timestamp'] + list(SCORE_FIELDS.values())
+    return statement.on_conflict_do_update(
+        index_elements=['detection_id', 'user_id'],
+        set_={column: statement.excluded[column] for column in update_columns}
+    )
+
+
+def upsert_score(detection_id, user_id, grade, scores, attempts=5):
+    """
+    Bir uzmanın bir oosite verdiği puanı atomik olarak ekler/günceller ve görüntünün
+    konsensüsünü aynı transaction'da yeniler.
+    """
+    statement = upsert_scores_statement([score_values(detection_id, user_id, grade, scores)])
+
+    def operation():
+        db.session.execute(statement)
+        refresh_image_consensus(image_ids_for_detections([detection_id]))
+
+    run_with_retry(operation, attempts=attempts)
+
+
+def coalesce_updates(updates):
+    """
+    İstemciden gelen güncelleme listesini doğrular ve aynı tespit için birden fazla
+    güncelleme varsa sonuncusunu tutar. Hatalı girdide ValueError yükselir.
+    """
+    latest = {}
+    for update in updates:
+        if not isinstance(update, dict):
+            raise ValueError('Geçersiz güncelleme kaydı')
+        detection_id = update.get('detection_id')
+        scores = update.get('scores')
+        if not detection_id or not isinstance(scores, dict):
+            raise ValueError('Eksik veri')
+        latest.pop(detection_id, None)  # Ekleme sırası son güncellemeyi izlesin
+        latest[detection_id] = (update.get('grade'), scores)
+    return latest
+
+
+def upsert_scores(user_id, updates, attempts=5):
+    """
+    Bir uzmanın birden çok oosite verdiği puanları tek işlemde (transaction) toplu upsert eder.
+    Artık var olmayan tespitlere (ör. çevrimdışı kuyruktayken silinmiş) ait güncellemeler atlanır.
+    Etkilenen görüntülerin konsensüsü aynı transaction'da yenilenir.
+    Dönüş: (kaydedilen tespit id'leri, atlanan tespit id'leri)
+    """
+    latest = coalesce_updates(updates)
+    if not latest:
+        return [], []
+
+    def operation():
+        found = db.session.query(Detection.id, Detection.parent_image_id).filter(Detection.id.in_(list(latest))).all()
+        existing = {row.id for row in found}
+        rows = [
+            score_values(detection_id, user_id, grade, scores)
+            for detection_id, (grade, scores) in latest.items() if detection_id in existing
+        ]
+        for start in range(0, len(rows), UPSERT_CHUNK_ROWS):
+            db.session.execute(upsert_scores_statement(rows[start:start + UPSERT_CHUNK_ROWS]))
+        refresh_image_consensus(row.parent_image_id for row in found)
+        return existing
+
+    existing = run_with_retry(operation, attempts=attempts)
+    saved = [detection_id for detection_id in latest if detection_id in existing]
+    skipped = [detection_id for detection_id in latest if detection_id not in existing]
+    return saved, skipped
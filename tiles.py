@@ -0,0 +1,77 @@
+# tiles.py
+import math
+import os
+import shutil
+
+from PIL import Image as PILImage
+
+
+TILE_EXTENSIONS = {'jpeg': 'jpg', 'png': 'png', 'webp': 'webp'}
+
+
+def pyramid_max_level(width, height):
+    """DZI: en yüksek seviye tam çözünürlüktür; seviye 0 tek pikseldir."""
+    return int(math.ceil(math.log2(max(width, height, 1))))
+
+
+def pyramid_dir(pyramid_folder, image_id):
+    return os.path.join(pyramid_folder, image_id)
+
+
+def build_tile_pyramid(pil_img, pyramid_folder, image_id, tile_size=256, overlap=1,
+                       tile_format='jpeg', quality=90):
+    """
+    Önizlemeden Deep Zoom (DZI) uyumlu çok çözünürlüklü döşeme piramidi üretir.
+
+    Dosyalar `<pyramid_folder>/<image_id>/<seviye>/<sütun>_<satır>.<uzantı>` olarak,
+    tanım dosyası `<pyramid_folder>/<image_id>/image.dzi` olarak yazılır. Her seviye bir
+    öncekinin yarısıdır; küçültme bir önceki seviyeden yapıldığı için toplam maliyet
+    tam çözünürlüklü görüntünün yaklaşık 4/3'ü kadardır.
+    """
+    extension = TILE_EXTENSIONS[tile_format]
+    width, height = pil_img.size
+    max_level = pyramid_max_level(width, height)
+    output_dir = pyramid_dir(pyramid_folder, image_id)
+    if os.path.exists(output_dir):
+        shutil.rmtree(output_dir)
+
+    save_options = {'quality': quality} if tile_format in ('jpeg', 'webp') else {}
+    level_img = pil_img
+    for level in range(max_level, -1, -1):
+        level_width, level_height = level_img.size
+        level_dir = os.path.join(output_dir, str(level))
+        os.makedirs(level_dir, exist_ok=True)
+        for col in range(int(math.ceil(level_width / tile_size))):
+            for row in range(int(math.ceil(level_height / tile_size))):
+                x0 = max(col * tile_size - overlap, 0)
+                y0 = max(row * tile_size - overlap, 0)
+                x1 = min((col + 1) * tile_size + overlap, level_width)
+                y1 = min((row + 1) * tile_size + overlap, level_height)
+                tile = level_img.crop((x0, y0, x1, y1))
+                tile.save(os.path.join(level_dir, f"{col}_{row}.{extension}"), **save_options)
+        if level > 0:
+            next_size = (max(1, int(math.ceil(level_width / 2))), max(1, int(math.ceil(level_height / 2))))
+            level_img = level_img.resize(next_size, PILImage.Resampling.BOX)
+
+    with open(os.path.join(output_dir, 'image.dzi'), 'w') as f:
+        f.write(
+            '<?xml version="1.0" encoding="UTF-8"?>\n'
+            '<Image xmlns="http://schemas.microsoft.com/deepzoom/2008" '
+            f'Format="{extension}" Overlap="{overlap}" TileSize="{tile_size}">'
+            f'<Size Width="{width}" Height="{height}"/></Image>\n'
+        )
+
+    return {
+        'width': width,
+        'height': height,
+        'tile_size': tile_size,
+        'overlap': overlap,
+        'format': extension,
+        'max_level': max_level,
+    }
+
+
+def remove_tile_pyramid(pyramid_folder, image_id):
+    output_dir = pyramid_dir(pyramid_folder, image_id)
+    if os.path.isdir(output_dir):
+        shutil.rmtree(output_dir, ignore_errors=True)